@@ -1,6 +1,18 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import User, MatchTip, APIRequestLog, CreditTransaction, Proxy
+from .models import User, MatchTip, APIRequestLog, CreditTransaction, Proxy, TipSubscription
+from .pagination import EstimatedCountPaginator
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist settings for tables with millions of rows.
+
+    Estimated or capped counts and no second, unfiltered COUNT(*). Keep
+    search_fields to columns with a trigram index (see models.trigram).
+    Filter dates with DateFieldListFilter on an indexed column rather than
+    date_hierarchy, whose links come from a DISTINCT over every row.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
 
 @admin.register(User)
 class UserAdmin(BaseUserAdmin):
@@ -17,18 +29,23 @@ class UserAdmin(BaseUserAdmin):
     )
 
 @admin.register(MatchTip)
-class MatchTipAdmin(admin.ModelAdmin):
-    list_display = ('match_id', 'tip_type', 'league', 'match_time', 'confidence_level')
-    list_filter = ('tip_type', 'confidence_level', 'is_live')
+class MatchTipAdmin(LargeTableAdmin):
+    list_display = ('match_id', 'tip_type', 'league', 'match_time', 'confidence_level', 'result')
+    list_filter = (
+        ('match_time', admin.DateFieldListFilter),
+        'tip_type', 'confidence_level', 'is_live', 'result',
+    )
     search_fields = ('league', 'home_team', 'away_team')
     readonly_fields = ('created_at', 'updated_at')
 
 @admin.register(APIRequestLog)
-class APIRequestLogAdmin(admin.ModelAdmin):
+class APIRequestLogAdmin(LargeTableAdmin):
     list_display = ('user', 'endpoint', 'credits_used', 'timestamp')
-    list_filter = ('used_proxy',)
-    search_fields = ('user__username', 'endpoint')
+    list_select_related = ('user',)
+    list_filter = (('timestamp', admin.DateFieldListFilter), 'used_proxy')
+    search_fields = ('user__username',)
     readonly_fields = ('timestamp',)
+    raw_id_fields = ('user',)
 
 @admin.register(Proxy)
 class ProxyAdmin(admin.ModelAdmin):
@@ -36,4 +53,19 @@ class ProxyAdmin(admin.ModelAdmin):
     list_filter = ('protocol', 'is_active')
     readonly_fields = ('success_rate', 'last_used')
 
-admin.site.register(CreditTransaction)
\ No newline at end of file
+@admin.register(CreditTransaction)
+class CreditTransactionAdmin(LargeTableAdmin):
+    list_display = ('user', 'transaction_type', 'amount', 'description', 'created_at')
+    list_select_related = ('user',)
+    list_filter = (('created_at', admin.DateFieldListFilter), 'transaction_type')
+    search_fields = ('user__username',)
+    readonly_fields = ('created_at',)
+    raw_id_fields = ('user',)
+
+@admin.register(TipSubscription)
+class TipSubscriptionAdmin(admin.ModelAdmin):
+    list_display = ('user', 'tip_type', 'league', 'min_percentage', 'webhook_url', 'is_active')
+    list_select_related = ('user',)
+    list_filter = ('tip_type', 'is_active')
+    search_fields = ('user__username', 'league')
+    readonly_fields = ('secret', 'created_at')
@@ -1,6 +1,26 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import pre_migrate
+
+
+def enable_extensions(using, **kwargs):
+    """Trigram search indexes need pg_trgm before the tables are created"""
+    connection = connections[using]
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from .feed import delta_feed
+        from .notifications import notifier
+        from . import readcache  # noqa: F401  MatchTip write signals
+        from .snapshots import snapshot_store
+
+        snapshot_store.add_listener(delta_feed.record)
+        delta_feed.add_listener(notifier.dispatch)
+        pre_migrate.connect(enable_extensions, sender=self)
@@ -0,0 +1,242 @@
+"""Backtest tip thresholds against settled MatchTip outcomes.
+
+``load_history`` pulls settled rows into NumPy columns once. ``run_grid``
+splits them into (tip_type, league) segments and evaluates every
+(volume band, odds range, threshold) cell of a segment without looping
+over rows: the segment is sorted by percentage once, and for each
+band/range pair cumulative bets/wins/profit are read off at every
+threshold with a single ``searchsorted``. Segments run on a process pool, and finished
+grids are cached keyed by the grid and the MatchTip data version, which every
+write moves (see ``api.readcache``). ``settle`` records results.
+"""
+import hashlib
+import json
+import math
+from concurrent.futures import ProcessPoolExecutor
+from typing import NamedTuple
+
+import numpy as np
+from django.core.cache import cache
+from django.db import transaction
+
+from .export import chunked, export_queryset
+
+INF = math.inf
+
+DEFAULT_THRESHOLDS = tuple(range(60, 96))
+DEFAULT_VOLUME_BANDS = ((0, INF), (50, 200), (200, 1000), (1000, INF))
+DEFAULT_ODDS_RANGES = ((0, INF), (1.0, 1.5), (1.5, 2.0), (2.0, 3.0), (3.0, INF))
+
+# Rows below this go through one process; pool start-up costs more than it saves
+PARALLEL_MIN_ROWS = 50000
+
+WON, LOST, VOID = 1, 0, -1
+OUTCOMES = {'won': WON, 'lost': LOST, 'void': VOID}
+
+
+class History(NamedTuple):
+    """Settled tips, column-wise"""
+    pct: np.ndarray
+    odds: np.ndarray
+    volume: np.ndarray
+    outcome: np.ndarray
+    league: np.ndarray
+    tip_type: np.ndarray
+    leagues: list
+    tip_types: list
+
+
+class Grid(NamedTuple):
+    thresholds: tuple = DEFAULT_THRESHOLDS
+    volume_bands: tuple = DEFAULT_VOLUME_BANDS
+    odds_ranges: tuple = DEFAULT_ODDS_RANGES
+    # None means "all"; per-league segments cover the top `max_leagues` by rows
+    tip_types: tuple = (None,)
+    max_leagues: int = 0
+    min_bets: int = 30
+
+    def cache_key(self, filters, data_version):
+        raw = json.dumps([self, filters, data_version], default=str)
+        return 'backtest:' + hashlib.sha1(raw.encode()).hexdigest()
+
+
+def load_history(date_from=None, date_to=None, tip_type=None, league=None, chunk_size=5000):
+    """Settled (won/lost/void) MatchTip rows as a History"""
+    queryset = export_queryset(date_from, date_to, tip_type, league).filter(
+        result__in=list(OUTCOMES),
+    ).values_list('percentage', 'odds', 'total_money', 'result', 'league', 'tip_type')
+
+    pct, odds, volume, outcome, league_codes, type_codes = [], [], [], [], [], []
+    leagues, tip_types = {}, {}
+    for chunk in chunked(queryset.iterator(chunk_size=chunk_size), chunk_size):
+        for p, o, v, r, lg, tt in chunk:
+            pct.append(float(p))
+            odds.append(float(o))
+            volume.append(float(v))
+            outcome.append(OUTCOMES[r])
+            league_codes.append(leagues.setdefault(lg, len(leagues)))
+            type_codes.append(tip_types.setdefault(tt, len(tip_types)))
+
+    return History(
+        np.array(pct, dtype=np.float64),
+        np.array(odds, dtype=np.float64),
+        np.array(volume, dtype=np.float64),
+        np.array(outcome, dtype=np.int8),
+        np.array(league_codes, dtype=np.int32),
+        np.array(type_codes, dtype=np.int32),
+        list(leagues),
+        list(tip_types),
+    )
+
+
+def evaluate_segment(pct, odds, volume, outcome, thresholds, volume_bands, odds_ranges):
+    """Bets, wins and flat-stake profit per (volume band, odds range, threshold).
+
+    Returns an array of shape (bands, ranges, thresholds, 3). A tip is bet
+    at threshold t when its percentage is >= t; void tips are not bets.
+    """
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    out = np.zeros((len(volume_bands), len(odds_ranges), len(thresholds), 3))
+
+    # Sort once by percentage, highest first; boolean masks keep that order,
+    # so in every band/range the rows with pct >= t are a prefix
+    order = np.argsort(-pct, kind='stable')
+    neg_pct = -pct[order]
+    odds = odds[order]
+    volume = volume[order]
+    outcome = outcome[order]
+    settled = outcome != VOID
+    won = outcome == WON
+    profit = np.where(won, odds - 1.0, -1.0)
+
+    for vi, (low, high) in enumerate(volume_bands):
+        in_band = settled & (volume >= low) & (volume < high)
+        for oi, (odds_low, odds_high) in enumerate(odds_ranges):
+            mask = in_band & (odds >= odds_low) & (odds < odds_high)
+            if not mask.any():
+                continue
+            wins = np.concatenate(([0], np.cumsum(won[mask])))
+            gains = np.concatenate(([0.0], np.cumsum(profit[mask])))
+            bets = np.searchsorted(neg_pct[mask], -thresholds, side='right')
+            out[vi, oi, :, 0] = bets
+            out[vi, oi, :, 1] = wins[bets]
+            out[vi, oi, :, 2] = gains[bets]
+    return out
+
+
+def segments(history, grid):
+    """(tip_type, league, row index) for every segment the grid asks for"""
+    everything = np.arange(len(history.pct))
+    league_counts = np.bincount(history.league, minlength=len(history.leagues))
+    top_leagues = np.argsort(-league_counts, kind='stable')[:grid.max_leagues]
+
+    for tip_type in grid.tip_types:
+        if tip_type is None:
+            rows = everything
+        elif tip_type in history.tip_types:
+            rows = np.flatnonzero(history.tip_type == history.tip_types.index(tip_type))
+        else:
+            continue
+        yield tip_type, None, rows
+        for code in top_leagues:
+            league_rows = rows[history.league[rows] == code]
+            if len(league_rows):
+                yield tip_type, history.leagues[code], league_rows
+
+
+def _format(tip_type, league, cells, grid):
+    vi, oi, ti = np.nonzero(cells[..., 0] >= max(grid.min_bets, 1))
+    bets, wins, profit = cells[vi, oi, ti].T
+    hit_rate = np.round(wins / bets, 4).tolist()
+    roi = np.round(profit / bets, 4).tolist()
+    profit = np.round(profit, 2).tolist()
+    results = []
+    for i, (v, o, t) in enumerate(zip(vi.tolist(), oi.tolist(), ti.tolist())):
+        results.append({
+            'tip_type': tip_type or 'all',
+            'league': league or 'all',
+            'threshold': grid.thresholds[t],
+            'volume': list(grid.volume_bands[v]),
+            'odds': list(grid.odds_ranges[o]),
+            'bets': int(bets[i]),
+            'wins': int(wins[i]),
+            'hit_rate': hit_rate[i],
+            'profit': profit[i],
+            'roi': roi[i],
+        })
+    return results
+
+
+def run_grid(history, grid, workers=None):
+    """Evaluate every segment of the grid; results sorted by ROI, best first"""
+    work = list(segments(history, grid))
+    args = [
+        (history.pct[rows], history.odds[rows], history.volume[rows], history.outcome[rows],
+         grid.thresholds, grid.volume_bands, grid.odds_ranges)
+        for _, _, rows in work
+    ]
+    if workers == 1 or len(work) < 2 or len(history.pct) < PARALLEL_MIN_ROWS:
+        cells = [evaluate_segment(*a) for a in args]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            cells = list(pool.map(evaluate_segment, *zip(*args)))
+
+    results = []
+    for (tip_type, league, _), segment_cells in zip(work, cells):
+        results.extend(_format(tip_type, league, segment_cells, grid))
+    results.sort(key=lambda r: (-r['roi'], -r['bets']))
+    return results
+
+
+def data_version():
+    """Changes whenever MatchTip rows are added, removed or updated.
+
+    The explicit version bumped by saves, deletes and queryset updates;
+    ``updated_at`` cannot be used because ``update()`` skips ``auto_now``.
+    """
+    from .readcache import tips_version
+
+    return tips_version()[0]
+
+
+def settle(outcomes):
+    """Record results from ``(match_id, market, pick, result)`` tuples.
+
+    An empty market or pick matches every tip of the match. Returns the
+    number of tips updated; raises ValueError on an unknown result before
+    anything is written.
+    """
+    from django.utils import timezone
+
+    from .models import MatchTip
+
+    outcomes = list(outcomes)
+    for match_id, market, pick, result in outcomes:
+        if result not in OUTCOMES and result != 'pending':
+            raise ValueError(f'Unknown result for {match_id}: {result!r}')
+
+    updated = 0
+    now = timezone.now()
+    with transaction.atomic():
+        for match_id, market, pick, result in outcomes:
+            queryset = MatchTip.objects.filter(match_id=match_id)
+            if market:
+                queryset = queryset.filter(market=market)
+            if pick:
+                queryset = queryset.filter(pick=pick)
+            updated += queryset.update(result=result, updated_at=now)
+    return updated
+
+
+def backtest(grid=None, date_from=None, date_to=None, tip_type=None, league=None,
+             workers=None, timeout=24 * 3600):
+    """Cached ``run_grid`` over the filtered history"""
+    grid = grid or Grid()
+    filters = [date_from, date_to, tip_type, league]
+    key = grid.cache_key(filters, data_version())
+    results = cache.get(key)
+    if results is None:
+        history = load_history(date_from, date_to, tip_type, league)
+        results = run_grid(history, grid, workers=workers)
+        cache.set(key, results, timeout)
+    return results
@@ -0,0 +1,165 @@
+"""Streaming export of MatchTip history.
+
+Rows come from ``values_list(...).iterator(chunk_size)``, which uses a
+server-side cursor on PostgreSQL, and are encoded one chunk at a time, so
+memory stays flat however many rows match. Used by ``/api/tips/export/``
+and ``manage.py export_tips``.
+"""
+import csv
+import io
+import json
+from datetime import datetime, time, timedelta, timezone
+from itertools import islice
+
+from .models import MatchTip
+
+FIELDS = (
+    'id', 'match_id', 'tip_type', 'league', 'home_team', 'away_team', 'match_time',
+    'market', 'pick', 'odds', 'percentage', 'total_money', 'dominant_money',
+    'confidence_level', 'is_live', 'is_major_league', 'result', 'created_at',
+)
+DECIMAL_FIELDS = {'odds', 'percentage', 'total_money', 'dominant_money'}
+DATETIME_FIELDS = {'match_time', 'created_at'}
+
+FORMATS = {
+    'csv': ('text/csv', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'arrow': ('application/vnd.apache.arrow.stream', 'arrows'),
+}
+
+DEFAULT_CHUNK_SIZE = 2000
+
+
+def export_queryset(date_from=None, date_to=None, tip_type=None, league=None):
+    """MatchTip rows as tuples of FIELDS, oldest kickoff first.
+
+    Dates are ``YYYY-MM-DD`` strings (inclusive, UTC); raises ValueError on
+    bad input.
+    """
+    queryset = MatchTip.objects.all()
+    if date_from:
+        start = datetime.strptime(date_from, '%Y-%m-%d')
+        queryset = queryset.filter(match_time__gte=datetime.combine(start, time.min, timezone.utc))
+    if date_to:
+        end = datetime.strptime(date_to, '%Y-%m-%d') + timedelta(days=1)
+        queryset = queryset.filter(match_time__lt=datetime.combine(end, time.min, timezone.utc))
+    if tip_type:
+        if tip_type not in dict(MatchTip.TIP_TYPES):
+            raise ValueError(f'Unknown tip_type: {tip_type}')
+        queryset = queryset.filter(tip_type=tip_type)
+    if league:
+        queryset = queryset.filter(league=league)
+    return queryset.order_by('match_time', 'id').values_list(*FIELDS)
+
+
+def chunked(rows, size):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def csv_chunks(chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(FIELDS)
+    for chunk in chunks:
+        for row in chunk:
+            writer.writerow([
+                value.isoformat() if isinstance(value, datetime) else value for value in row
+            ])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def ndjson_chunks(chunks):
+    decimal_at = [i for i, name in enumerate(FIELDS) if name in DECIMAL_FIELDS]
+    datetime_at = [i for i, name in enumerate(FIELDS) if name in DATETIME_FIELDS]
+    for chunk in chunks:
+        lines = []
+        for row in chunk:
+            row = list(row)
+            for i in decimal_at:
+                row[i] = None if row[i] is None else float(row[i])
+            for i in datetime_at:
+                row[i] = row[i].isoformat()
+            lines.append(json.dumps(dict(zip(FIELDS, row)), separators=(',', ':')))
+        yield '\n'.join(lines) + '\n'
+
+
+class _Sink:
+    """Write-only file the Arrow stream writer fills and we drain per batch"""
+
+    def __init__(self):
+        self.parts = []
+        self.closed = False
+
+    def write(self, data):
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.parts)
+        self.parts = []
+        return data
+
+
+def arrow_chunks(chunks):
+    """Arrow IPC stream, one record batch per chunk.
+
+    pyarrow is imported here, before streaming starts, so a missing
+    install surfaces as ImportError to the caller.
+    """
+    import pyarrow as pa
+
+    return _arrow_batches(pa, chunks)
+
+
+def _arrow_batches(pa, chunks):
+    types = {
+        'id': pa.int64(),
+        'match_time': pa.timestamp('us', tz='UTC'),
+        'created_at': pa.timestamp('us', tz='UTC'),
+        'is_live': pa.bool_(),
+        'is_major_league': pa.bool_(),
+    }
+    for name in DECIMAL_FIELDS:
+        types[name] = pa.float64()
+    schema = pa.schema([(name, types.get(name, pa.string())) for name in FIELDS])
+
+    sink = _Sink()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for chunk in chunks:
+            columns = list(zip(*chunk))
+            arrays = []
+            for name, values in zip(FIELDS, columns):
+                if name in DECIMAL_FIELDS:
+                    values = [None if v is None else float(v) for v in values]
+                arrays.append(pa.array(values, type=schema.field(name).type))
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            yield sink.drain()
+    yield sink.drain()
+
+
+ENCODERS = {
+    'csv': csv_chunks,
+    'ndjson': ndjson_chunks,
+    'arrow': arrow_chunks,
+}
+
+
+def stream_export(fmt, queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Encoded chunks (str for text formats, bytes for arrow) of an export"""
+    rows = queryset.iterator(chunk_size=chunk_size)
+    return ENCODERS[fmt](chunked(rows, chunk_size))
@@ -0,0 +1,191 @@
+import logging
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+ADDED, CHANGED, REMOVED = 'added', 'changed', 'removed'
+
+
+def tip_id(record):
+    """Public identity of a tip in delta responses"""
+    return {
+        'league': record.league,
+        'match': f"{record.home} vs {record.away}",
+        'market': record.market,
+        'pick': record.pick,
+    }
+
+
+class DeltaFeed:
+    """Versioned change log of full-day snapshots, shared through the cache.
+
+    Each (tip_type, exclude_major, date, threshold) feed keeps the last
+    reported state of every tip and a monotonically increasing version.
+    Recording a new snapshot diffs it against that state; the version only
+    moves when a tip is added, removed, or its percentage/money moved past
+    the configured epsilon, so quiet periods keep the same version (and
+    ETag). Per-version deltas are retained for ``retain`` versions.
+    """
+
+    def __init__(self, cache, retain=50, pct_epsilon=0.5, money_epsilon=0.05,
+                 timeout=2 * 24 * 3600, lock_wait=5):
+        self.cache = cache
+        self.retain = retain
+        self.pct_epsilon = pct_epsilon
+        self.money_epsilon = money_epsilon
+        self.timeout = timeout
+        self.lock_wait = lock_wait
+        self.listeners = []
+
+    def add_listener(self, listener):
+        """Call ``listener(store_key, threshold, version, delta)`` when a feed advances"""
+        self.listeners.append(listener)
+
+    @staticmethod
+    def feed_key(tip_type, exclude_major, f_date, threshold):
+        return f"{tip_type}:{int(bool(exclude_major))}:{f_date}:{threshold}"
+
+    def version(self, feed_key):
+        return self.cache.get(f"feed:{feed_key}:version", 0)
+
+    @staticmethod
+    def etag(feed_key, version):
+        return f'"{feed_key}:{version}"'
+
+    def moved(self, old, new):
+        if abs(new.percentage - old.percentage) >= self.pct_epsilon:
+            return True
+        for field in ('total_money', 'dominant_money'):
+            before, after = getattr(old, field), getattr(new, field)
+            if abs(after - before) > self.money_epsilon * max(abs(before), 1):
+                return True
+        return old.odds != new.odds
+
+    def diff(self, state, records):
+        """Return (delta, new_state) for a snapshot against the reported state"""
+        delta = {}
+        new_state = {}
+        for record in records:
+            key = record.key
+            old = state.get(key)
+            if old is None:
+                delta[key] = (ADDED, record)
+                new_state[key] = record
+            elif self.moved(old, record):
+                delta[key] = (CHANGED, record)
+                new_state[key] = record
+            else:
+                # Keep the last reported values so slow drift still crosses epsilon
+                new_state[key] = old
+        for key, old in state.items():
+            if key not in new_state:
+                delta[key] = (REMOVED, old)
+        return delta, new_state
+
+    def record(self, store_key, threshold, records, built_at=None):
+        """Fold a full-day snapshot, filtered to ``threshold``, into its feed.
+
+        Registered as a SnapshotStore listener for fresh publishes; the
+        delta endpoint also calls it with the snapshot it served, which may
+        have been built at a lower threshold. ``built_at`` (default now)
+        orders the calls: a snapshot no newer than the one last folded in
+        is ignored, so a worker holding an older copy never rolls the feed
+        back. Calls for one feed are serialized by a cache lock; a caller
+        waits up to ``lock_wait`` seconds for it, since the holder may be
+        folding an older snapshot than its own.
+        """
+        tip_type, exclude_major, f_date = store_key
+        feed_key = self.feed_key(tip_type, exclude_major, f_date, threshold)
+        built_at = time.time() if built_at is None else built_at
+        lock = f"feed:{feed_key}:lock"
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_wait
+        while not self.cache.add(lock, token, 30):
+            if time.monotonic() >= deadline:
+                logger.warning(
+                    "feed %s busy, snapshot not folded in", feed_key,
+                    extra={"feed": feed_key, "built_at": built_at},
+                )
+                return
+            time.sleep(0.05)
+        try:
+            if built_at <= self.cache.get(f"feed:{feed_key}:built_at", 0):
+                return
+            state = self.cache.get(f"feed:{feed_key}:state", {})
+            delta, new_state = self.diff(state, records)
+            if not delta:
+                self.cache.set(f"feed:{feed_key}:built_at", built_at, self.timeout)
+                return
+            version = self.version(feed_key) + 1
+            self.cache.set_many({
+                f"feed:{feed_key}:delta:{version}": delta,
+                f"feed:{feed_key}:state": new_state,
+                f"feed:{feed_key}:version": version,
+                f"feed:{feed_key}:built_at": built_at,
+            }, self.timeout)
+            self.cache.delete(f"feed:{feed_key}:delta:{version - self.retain}")
+            logger.info(
+                "feed %s advanced to v%d (%d changes)", feed_key, version, len(delta),
+                extra={"feed": feed_key, "version": version, "changes": len(delta)},
+            )
+        finally:
+            # Past its timeout the lock may be another caller's
+            if self.cache.get(lock) == token:
+                self.cache.delete(lock)
+        for listener in self.listeners:
+            try:
+                listener(store_key, threshold, version, delta)
+            except Exception:
+                logger.exception("feed listener failed", extra={"feed": feed_key})
+
+    def changes_since(self, feed_key, since):
+        """Composite delta from ``since`` to the current version.
+
+        Returns ``(version, changes, full)``; ``changes`` maps each kind to a
+        list of records. When ``since`` is 0, older than the retained history
+        or newer than the feed (whose state was lost), ``full`` is True and
+        every current tip is listed as added.
+        """
+        version = self.version(feed_key)
+        if 0 < since == version:
+            return version, {ADDED: [], CHANGED: [], REMOVED: []}, False
+
+        deltas = {}
+        if 0 < since < version and version - since <= self.retain:
+            deltas = self.cache.get_many(
+                [f"feed:{feed_key}:delta:{v}" for v in range(since + 1, version + 1)]
+            )
+        if since <= 0 or len(deltas) != version - since:
+            state = self.cache.get(f"feed:{feed_key}:state", {})
+            return version, {ADDED: list(state.values()), CHANGED: [], REMOVED: []}, True
+
+        combined = {}
+        for v in range(since + 1, version + 1):
+            for key, (kind, record) in deltas[f"feed:{feed_key}:delta:{v}"].items():
+                previous = combined.get(key, (None, None))[0]
+                if previous == ADDED and kind == REMOVED:
+                    # Never seen by this client
+                    del combined[key]
+                elif previous == ADDED:
+                    combined[key] = (ADDED, record)
+                elif previous == REMOVED and kind == ADDED:
+                    combined[key] = (CHANGED, record)
+                else:
+                    combined[key] = (kind, record)
+
+        changes = {ADDED: [], CHANGED: [], REMOVED: []}
+        for kind, record in combined.values():
+            changes[kind].append(record)
+        return version, changes, False
+
+
+delta_feed = DeltaFeed(
+    cache,
+    retain=getattr(settings, 'FEED_RETAIN_VERSIONS', 50),
+    pct_epsilon=getattr(settings, 'FEED_PERCENT_EPSILON', 0.5),
+    money_epsilon=getattr(settings, 'FEED_MONEY_EPSILON', 0.05),
+)
@@ -0,0 +1,123 @@
+"""Idempotency-Key support for charged endpoints.
+
+The first request with a given key runs normally; a successful response
+(and so the charge it made) is stored in the shared cache for ``IDEMPOTENCY_TTL``
+seconds. Retries with the same key get that response back without
+rescanning or recharging. A retry that arrives while the first request is
+still running waits for it instead of starting a second scan.
+"""
+import hashlib
+import json
+import time
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+from .metrics import IDEMPOTENCY
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+# Response headers worth replaying
+REPLAYED_HEADERS = ('ETag',)
+
+
+def fingerprint(request):
+    """Hash of what the request asks for, to refuse key reuse with other parameters.
+
+    Covers the body even on GET: MatchTipAPIView reads its parameters from
+    ``request.data`` before the query string.
+    """
+    data = request.data
+    if hasattr(data, 'lists'):
+        data = sorted(data.lists())
+    payload = {
+        'method': request.method,
+        'path': request.path,
+        'query': sorted(request.query_params.lists()),
+        'body': data,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def cache_keys(user_id, path, key):
+    """(result key, lock key) of an Idempotency-Key"""
+    scope = hashlib.sha256(f"{user_id}:{path}:{key}".encode()).hexdigest()
+    return f"idempotency:{scope}:result", f"idempotency:{scope}:lock"
+
+
+def release(lock_key, token):
+    # Only drop our own lock: after it expired another request may hold it.
+    # get/delete is not atomic, but the window is two cache round trips
+    # against a lock that outlives the slowest scan.
+    if cache.get(lock_key) == token:
+        cache.delete(lock_key)
+
+
+def replay(stored):
+    response = Response(stored['data'], status=stored['status'])
+    for name, value in stored['headers'].items():
+        response[name] = value
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(view_method):
+    """Make an APIView handler honour the Idempotency-Key request header"""
+    @wraps(view_method)
+    def wrapper(self, request, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if not key:
+            return view_method(self, request, *args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return Response({'error': f'{HEADER} must be at most {MAX_KEY_LENGTH} characters'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        result_key, lock_key = cache_keys(request.user.pk, request.path, key)
+        request_hash = fingerprint(request)
+        token = uuid.uuid4().hex
+        ttl = getattr(settings, 'IDEMPOTENCY_TTL', 24 * 3600)
+        deadline = time.monotonic() + getattr(settings, 'IDEMPOTENCY_WAIT_SECONDS', 30)
+        waited = False
+
+        while True:
+            stored = cache.get(result_key)
+            if stored is not None:
+                if stored['fingerprint'] != request_hash:
+                    IDEMPOTENCY.labels(result='mismatch').inc()
+                    return Response({'error': f'{HEADER} was already used with different parameters'},
+                                    status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+                IDEMPOTENCY.labels(result='waited' if waited else 'replayed').inc()
+                return replay(stored)
+
+            # The lock outlives the slowest scan; a crashed owner frees it on expiry
+            if cache.add(lock_key, token, getattr(settings, 'IDEMPOTENCY_LOCK_SECONDS', 300)):
+                break
+            if time.monotonic() >= deadline:
+                IDEMPOTENCY.labels(result='conflict').inc()
+                return Response({'error': f'A request with this {HEADER} is still in progress'},
+                                status=status.HTTP_409_CONFLICT)
+            waited = True
+            time.sleep(0.1)
+
+        IDEMPOTENCY.labels(result='executed').inc()
+        try:
+            response = view_method(self, request, *args, **kwargs)
+            # Only successful results (the ones that scanned and charged) are
+            # final; errors stay retryable, e.g. after topping up credits, and
+            # a 304 (delta polling) charged nothing and is only valid now
+            if isinstance(response, Response) and 200 <= response.status_code < 300:
+                cache.set(result_key, {
+                    'fingerprint': request_hash,
+                    'status': response.status_code,
+                    'data': response.data,
+                    'headers': {h: response[h] for h in REPLAYED_HEADERS if response.has_header(h)},
+                }, ttl)
+            return response
+        finally:
+            release(lock_key, token)
+
+    return wrapper
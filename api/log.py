@@ -0,0 +1,110 @@
+import contextvars
+import copy
+import json
+import logging
+import queue
+import sys
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+request_id_var = contextvars.ContextVar('request_id', default='-')
+scan_id_var = contextvars.ContextVar('scan_id', default='-')
+
+# Attributes every LogRecord has; anything else was passed via ``extra=``
+_RESERVED = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+_TRACEBACKS = logging.Formatter()
+
+
+def new_id():
+    return uuid.uuid4().hex[:12]
+
+
+@contextmanager
+def scan_context(scan_id=None):
+    """Tag every log line emitted inside the block with a scan ID"""
+    token = scan_id_var.set(scan_id or new_id())
+    try:
+        yield scan_id_var.get()
+    finally:
+        scan_id_var.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Copy the request/scan IDs onto the record.
+
+    Runs on the emitting thread, before the record is queued, so the IDs
+    come from the caller's context and not the listener thread's.
+    """
+    def filter(self, record):
+        record.request_id = request_id_var.get()
+        record.scan_id = scan_id_var.get()
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+    def format(self, record):
+        payload = {
+            'ts': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RESERVED:
+                payload[key] = value
+        if record.exc_info:
+            payload['exc'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload['exc'] = record.exc_text
+        return json.dumps(payload, default=str)
+
+
+class QueueListenerHandler(QueueHandler):
+    """QueueHandler that owns a background listener writing to stdout.
+
+    Request threads only pay for ``put_nowait`` on a bounded queue; the
+    stream write happens on the listener thread. When the sink falls behind
+    and the queue is full, records are dropped and counted instead of
+    blocking the caller.
+    """
+    def __init__(self, maxsize=10000, stream=None):
+        super().__init__(queue.Queue(maxsize=maxsize))
+        self.dropped = 0
+        sink = logging.StreamHandler(stream or sys.stdout)
+        sink.setFormatter(JsonFormatter())
+        self.listener = QueueListener(self.queue, sink, respect_handler_level=True)
+        self.listener.start()
+
+    def prepare(self, record):
+        """Render message and traceback before queueing, keeping them apart.
+
+        QueueHandler's own version folds the traceback into ``msg``; here it
+        travels as ``exc_text`` so the JSON line keeps it under ``exc``.
+        """
+        record = copy.copy(record)
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _TRACEBACKS.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def close(self):
+        """Write out what is queued and stop the listener, once.
+
+        Called by ``logging.shutdown`` at exit and by dictConfig when it
+        replaces the handler.
+        """
+        listener, self.listener = self.listener, None
+        if listener is not None:
+            listener.stop()
+        super().close()
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
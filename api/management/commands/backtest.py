@@ -0,0 +1,95 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.backtest import Grid, backtest
+
+
+def parse_range(value):
+    """'60:96:1' -> (60, 61, ..., 95); '69,75,85' -> (69, 75, 85)"""
+    if ':' in value:
+        start, stop, *step = (float(v) for v in value.split(':'))
+        step = step[0] if step else 1
+        values = []
+        while start < stop:
+            values.append(round(start, 4))
+            start += step
+        return tuple(values)
+    return tuple(float(v) for v in value.split(','))
+
+
+def parse_bands(value):
+    """'0-inf,50-200' -> ((0, inf), (50, 200))"""
+    bands = []
+    for band in value.split(','):
+        low, high = band.split('-')
+        bands.append((float(low), float(high)))
+    return tuple(bands)
+
+
+class Command(BaseCommand):
+    help = 'Hit rate and ROI of tip thresholds over settled MatchTip history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', help='YYYY-MM-DD, inclusive')
+        parser.add_argument('--to', dest='date_to', help='YYYY-MM-DD, inclusive')
+        parser.add_argument('--tip-type', help='restrict the history to one tip type')
+        parser.add_argument('--league', help='restrict the history to one league')
+        parser.add_argument('--thresholds', help='start:stop[:step] or a comma list')
+        parser.add_argument('--volume-bands', help='low-high,... (use inf for no upper bound)')
+        parser.add_argument('--odds-ranges', help='low-high,...')
+        parser.add_argument('--by-tip-type', action='store_true', help='also break down per tip type')
+        parser.add_argument('--leagues', type=int, default=0, help='also break down the N biggest leagues')
+        parser.add_argument('--min-bets', type=int, default=30)
+        parser.add_argument('--workers', type=int, help='processes (default: CPU count)')
+        parser.add_argument('--top', type=int, default=20)
+        parser.add_argument('--json', action='store_true', help='print every result as JSON')
+
+    def handle(self, *args, **options):
+        try:
+            grid = Grid()._replace(
+                max_leagues=options['leagues'],
+                min_bets=options['min_bets'],
+            )
+            if options['thresholds']:
+                grid = grid._replace(thresholds=parse_range(options['thresholds']))
+            if options['volume_bands']:
+                grid = grid._replace(volume_bands=parse_bands(options['volume_bands']))
+            if options['odds_ranges']:
+                grid = grid._replace(odds_ranges=parse_bands(options['odds_ranges']))
+            if options['by_tip_type']:
+                grid = grid._replace(tip_types=(None, 'normal', 'underdog'))
+        except ValueError as e:
+            raise CommandError(f'Bad grid: {e}')
+
+        started = time.perf_counter()
+        try:
+            results = backtest(
+                grid,
+                date_from=options['date_from'],
+                date_to=options['date_to'],
+                tip_type=options['tip_type'],
+                league=options['league'],
+                workers=options['workers'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+        elapsed = time.perf_counter() - started
+
+        if options['json']:
+            self.stdout.write(json.dumps(results))
+            return
+
+        self.stdout.write(f"{len(results)} cells with >= {grid.min_bets} bets in {elapsed:.2f}s")
+        self.stdout.write(
+            f"{'tip_type':<9} {'league':<24} {'thr':>5} {'volume':>13} {'odds':>11} "
+            f"{'bets':>6} {'hit':>6} {'roi':>7}"
+        )
+        for r in results[:options['top']]:
+            volume = '{:g}-{:g}'.format(*r['volume'])
+            odds = '{:g}-{:g}'.format(*r['odds'])
+            self.stdout.write(
+                f"{r['tip_type']:<9} {r['league'][:24]:<24} {r['threshold']:>5g} {volume:>13} {odds:>11} "
+                f"{r['bets']:>6} {r['hit_rate']:>6.1%} {r['roi']:>7.1%}"
+            )
@@ -0,0 +1,52 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.export import DEFAULT_CHUNK_SIZE, FORMATS, export_queryset, stream_export
+
+
+class Command(BaseCommand):
+    help = 'Stream MatchTip history to a file (or stdout) as CSV, NDJSON or Arrow'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=sorted(FORMATS), default='csv')
+        parser.add_argument('--from', dest='date_from', help='YYYY-MM-DD, inclusive')
+        parser.add_argument('--to', dest='date_to', help='YYYY-MM-DD, inclusive')
+        parser.add_argument('--tip-type')
+        parser.add_argument('--league')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE)
+        parser.add_argument('--output', '-o', default='-', help='file path, - for stdout')
+
+    def handle(self, *args, **options):
+        try:
+            queryset = export_queryset(
+                date_from=options['date_from'],
+                date_to=options['date_to'],
+                tip_type=options['tip_type'],
+                league=options['league'],
+            )
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        fmt = options['format']
+        try:
+            chunks = stream_export(fmt, queryset, chunk_size=options['chunk_size'])
+        except ImportError as e:
+            raise CommandError(f'{fmt} export needs an extra package: {e}')
+
+        binary = fmt == 'arrow'
+        if options['output'] == '-':
+            out = sys.stdout.buffer if binary else sys.stdout
+            close = False
+        else:
+            out = open(options['output'], 'wb') if binary else open(options['output'], 'w', newline='')
+            close = True
+
+        try:
+            for chunk in chunks:
+                out.write(chunk)
+        finally:
+            if close:
+                out.close()
+            else:
+                out.flush()
@@ -0,0 +1,83 @@
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+# What a worker imports before it can take work
+TARGETS = {
+    'web': 'from django.urls import get_resolver\nget_resolver().url_patterns',
+    'celery': 'from tip_api import celery_app\ncelery_app.loader.import_default_modules()',
+}
+
+BOOT = '''
+import time
+started = time.perf_counter()
+import django
+django.setup()
+{target}
+print(time.perf_counter() - started)
+'''
+
+LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)\s*$')
+
+
+def profile(target, env):
+    """(seconds to boot, {module: (self_us, cumulative_us, depth)}) from a fresh interpreter"""
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', BOOT.format(target=TARGETS[target])],
+        env=env, capture_output=True, text=True,
+    )
+    if result.returncode:
+        raise CommandError(f'{target} boot failed:\n{result.stderr[-2000:]}')
+    modules = {}
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            modules[name] = (int(self_us), int(cumulative_us), len(indent) // 2)
+    return float(result.stdout.strip().splitlines()[-1]), modules
+
+
+class Command(BaseCommand):
+    help = 'Cold-start time of a web or Celery worker and the import cost per module'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', choices=sorted(TARGETS), default='web')
+        parser.add_argument('--repeat', type=int, default=3, help='fresh interpreters to boot')
+        parser.add_argument('--sort', choices=('cumulative', 'self'), default='cumulative')
+        parser.add_argument('--limit', type=int, default=25)
+        parser.add_argument('--max-depth', type=int, help='0 = modules imported directly by the boot')
+        parser.add_argument('--match', help='only modules containing this string, e.g. api.')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, sys.path)))
+        runs = [profile(options['target'], env) for _ in range(max(options['repeat'], 1))]
+
+        # Per-module minimum over the runs filters out scheduling noise
+        modules = {}
+        for _, run in runs:
+            for name, (self_us, cumulative_us, depth) in run.items():
+                best = modules.get(name)
+                if best is None or cumulative_us < best[1]:
+                    modules[name] = (self_us, cumulative_us, depth)
+
+        rows = [
+            (name, self_us, cumulative_us) for name, (self_us, cumulative_us, depth) in modules.items()
+            if (options['max_depth'] is None or depth <= options['max_depth'])
+            and (not options['match'] or options['match'] in name)
+        ]
+        column = 2 if options['sort'] == 'cumulative' else 1
+        rows.sort(key=lambda row: -row[column])
+
+        seconds = [boot for boot, _ in runs]
+        self.stdout.write(
+            f"{options['target']} boot: {statistics.median(seconds) * 1000:.1f} ms "
+            f"(median of {len(seconds)}, min {min(seconds) * 1000:.1f} ms), "
+            f"{len(modules)} modules imported"
+        )
+        self.stdout.write(f"{'cumulative ms':>14} {'self ms':>9}  module")
+        for name, self_us, cumulative_us in rows[:options['limit']]:
+            self.stdout.write(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
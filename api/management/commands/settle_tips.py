@@ -0,0 +1,32 @@
+import csv
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.backtest import settle
+
+
+class Command(BaseCommand):
+    help = 'Set MatchTip results (won/lost/void) from a CSV with match_id,market,pick,result columns'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV file, - for stdin; market and pick may be empty')
+
+    def handle(self, *args, **options):
+        if options['path'] == '-':
+            rows = list(csv.DictReader(sys.stdin))
+        else:
+            with open(options['path'], newline='') as f:
+                rows = list(csv.DictReader(f))
+
+        try:
+            outcomes = [
+                (row['match_id'], row.get('market') or '', row.get('pick') or '', (row['result'] or '').strip().lower())
+                for row in rows
+            ]
+            updated = settle(outcomes)
+        except KeyError as e:
+            raise CommandError(f'Missing column: {e}')
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(f"{updated} tips settled from {len(outcomes)} rows")
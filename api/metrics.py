@@ -0,0 +1,177 @@
+import hmac
+import ipaddress
+import os
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.http import Http404, HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST, REGISTRY, CollectorRegistry, Counter, Gauge, Histogram,
+    generate_latest, multiprocess,
+)
+
+# With several gunicorn workers every process keeps its own counters. Setting
+# PROMETHEUS_MULTIPROC_DIR makes prometheus_client write samples to shared
+# mmap files in that directory, which are aggregated at scrape time.
+MULTIPROC_DIR = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+if MULTIPROC_DIR:
+    # Only gunicorn's on_starting hook creates it; runserver and the Celery
+    # processes share the image's environment, and unlabeled metrics below
+    # open their sample file as soon as they are defined
+    os.makedirs(MULTIPROC_DIR, exist_ok=True)
+
+# Upstream (betwatch) traffic
+UPSTREAM_REQUESTS = Counter(
+    'tip_upstream_requests_total',
+    'Upstream page requests by HTTP status and proxy',
+    ['status', 'proxy'],
+)
+UPSTREAM_LATENCY = Histogram(
+    'tip_upstream_request_seconds',
+    'Upstream page request latency by HTTP status and proxy',
+    ['status', 'proxy'],
+    buckets=(0.1, 0.25, 0.5, 1, 2, 4, 8, 15, 30),
+)
+UPSTREAM_BYTES = Counter(
+    'tip_upstream_bytes_total',
+    'Upstream response bytes transferred (compressed, as billed by proxies)',
+    ['proxy'],
+)
+PAGE_CACHE = Counter(
+    'tip_upstream_page_cache_total',
+    'Upstream page cache outcomes (revalidated = 304 served from cache)',
+    ['result'],
+)
+
+# Scanner
+SCAN_PAGES = Histogram(
+    'tip_scan_pages',
+    'Upstream pages fetched per scan',
+    ['tip_type'],
+    buckets=(1, 2, 3, 5, 8, 13, 21, 34),
+)
+SCAN_MATCHES = Histogram(
+    'tip_scan_matches',
+    'Unique matches returned per scan',
+    ['tip_type'],
+    buckets=(0, 1, 5, 10, 25, 50, 100, 250, 500, 1000),
+)
+SCAN_ROWS = Counter(
+    'tip_scan_rows_total',
+    'Upstream rows passed to process_match',
+    ['tip_type'],
+)
+SCAN_DEDUP_DROPS = Counter(
+    'tip_scan_dedup_dropped_total',
+    'Upstream rows dropped because their match key was already seen',
+    ['tip_type'],
+)
+SCAN_CACHE = Counter(
+    'tip_scan_cache_total',
+    'Per-date scan lookups (hit/miss: shared cache, snapshot/stale: snapshot store)',
+    ['result'],
+)
+SNAPSHOT_STORE_BYTES = Gauge(
+    'tip_snapshot_store_bytes',
+    'Approximate memory held by the in-process snapshot store',
+    multiprocess_mode='livesum',
+)
+
+# Billing and API
+CREDITS_CHARGED = Counter(
+    'tip_credits_charged_total',
+    'Credits deducted for API calls',
+    ['tip_type', 'proxy'],
+)
+RATE_LIMIT_REJECTIONS = Counter(
+    'tip_rate_limit_rejections_total',
+    'Requests rejected by APIRateLimitMiddleware',
+)
+READ_CACHE = Counter(
+    'tip_read_cache_total',
+    'Versioned /api/tips/ response cache lookups (hit, miss, not_modified)',
+    ['result'],
+)
+IDEMPOTENCY = Counter(
+    'tip_idempotency_total',
+    'Idempotency-Key handling (executed, replayed, waited, conflict, mismatch)',
+    ['result'],
+)
+DB_QUERIES = Histogram(
+    'tip_db_queries_per_request',
+    'SQL queries executed per request by endpoint',
+    ['endpoint'],
+    buckets=(0, 1, 2, 5, 10, 20, 50, 100, 250),
+)
+DB_QUERY_SECONDS = Histogram(
+    'tip_db_query_seconds_per_request',
+    'Total SQL time per request by endpoint',
+    ['endpoint'],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5),
+)
+N_PLUS_ONE = Counter(
+    'tip_db_n_plus_one_total',
+    'Requests that ran one SQL statement shape repeatedly (likely N+1)',
+    ['endpoint'],
+)
+
+# Notifications
+NOTIFICATIONS = Counter(
+    'tip_notifications_total',
+    'Tips fanned out to subscribers by channel',
+    ['channel'],
+)
+WEBHOOK_DELIVERIES = Counter(
+    'tip_webhook_deliveries_total',
+    'Webhook delivery attempts by outcome',
+    ['result'],
+)
+
+
+def proxy_label(proxy):
+    """Low-cardinality label for a proxy URL, without credentials"""
+    if not proxy:
+        return 'direct'
+    parsed = urlparse(proxy)
+    if parsed.port:
+        return f"{parsed.hostname}:{parsed.port}"
+    return parsed.hostname or 'unknown'
+
+
+def get_registry():
+    if MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return registry
+    return REGISTRY
+
+
+def scrape_allowed(request):
+    """Scrapers come from METRICS_ALLOWED_IPS or present METRICS_TOKEN.
+
+    Only the socket peer (REMOTE_ADDR) is checked, never X-Forwarded-For,
+    which any client can set.
+    """
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        header = request.META.get('HTTP_AUTHORIZATION', '')
+        if hmac.compare_digest(header.encode(), f"Bearer {token}".encode()):
+            return True
+    try:
+        addr = ipaddress.ip_address(request.META.get('REMOTE_ADDR', ''))
+    except ValueError:
+        return False
+    if addr.version == 6 and addr.ipv4_mapped:
+        addr = addr.ipv4_mapped
+    return any(
+        addr in ipaddress.ip_network(net.strip(), strict=False)
+        for net in getattr(settings, 'METRICS_ALLOWED_IPS', [])
+        if net.strip()
+    )
+
+
+def metrics_view(request):
+    """Prometheus scrape endpoint; 404 for anyone but the scrapers"""
+    if not scrape_allowed(request):
+        raise Http404
+    return HttpResponse(generate_latest(get_registry()), content_type=CONTENT_TYPE_LATEST)
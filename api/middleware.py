@@ -1,8 +1,18 @@
+import logging
+
+from django.conf import settings
 from django.utils import timezone
 from django.core.cache import cache
+from django.db import connection
 from rest_framework.response import Response
 from rest_framework import status
 
+from .metrics import DB_QUERIES, DB_QUERY_SECONDS, N_PLUS_ONE, RATE_LIMIT_REJECTIONS
+from .log import request_id_var, new_id
+from .queries import QueryRecorder
+
+logger = logging.getLogger(__name__)
+
 class APIRateLimitMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
@@ -15,6 +25,7 @@ class APIRateLimitMiddleware:
             # Check if user has exceeded rate limit
             request_count = cache.get(cache_key, 0)
             if request_count >= 100:  # 100 requests per minute limit
+                RATE_LIMIT_REJECTIONS.inc()
                 return Response({
                     'error': 'Rate limit exceeded',
                     'message': 'Maximum 100 requests per minute allowed'
@@ -23,4 +34,54 @@ class APIRateLimitMiddleware:
             # Increment counter
             cache.set(cache_key, request_count + 1, timeout=60)
         
-        return self.get_response(request)
\ No newline at end of file
+        return self.get_response(request)
+
+class QueryMetricsMiddleware:
+    """Count and time SQL per request, flag N+1 patterns, export by endpoint.
+    
+    With ``QUERY_DEBUG_HEADER`` on (defaults to DEBUG) responses carry an
+    ``X-DB-Queries`` header with the count, time and number of N+1 shapes.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.debug_header = getattr(settings, 'QUERY_DEBUG_HEADER', settings.DEBUG)
+    
+    def __call__(self, request):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            response = self.get_response(request)
+        
+        # Label by URL pattern rather than raw path to keep cardinality bounded
+        match = getattr(request, 'resolver_match', None)
+        endpoint = match.route if match else 'unmatched'
+        DB_QUERIES.labels(endpoint=endpoint).observe(recorder.count)
+        DB_QUERY_SECONDS.labels(endpoint=endpoint).observe(recorder.seconds)
+        
+        repeated = recorder.n_plus_one()
+        if repeated:
+            N_PLUS_ONE.labels(endpoint=endpoint).inc()
+            shape, times = repeated[0]
+            logger.warning(
+                "N+1 queries on %s: %d x %s", endpoint, times, shape[:200],
+                extra={"endpoint": endpoint, "repeats": times, "shape": shape[:500],
+                       "queries": recorder.count},
+            )
+        if self.debug_header:
+            response['X-DB-Queries'] = recorder.header()
+        return response
+
+
+class RequestIdMiddleware:
+    """Bind a request ID to every log line emitted while serving the request"""
+    def __init__(self, get_response):
+        self.get_response = get_response
+    
+    def __call__(self, request):
+        request_id = request.headers.get('X-Request-ID') or new_id()
+        token = request_id_var.set(request_id[:64])
+        try:
+            response = self.get_response(request)
+        finally:
+            request_id_var.reset(token)
+        response['X-Request-ID'] = request_id[:64]
+        return response
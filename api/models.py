@@ -1,9 +1,19 @@
 from django.db import models
+from django.dispatch import Signal
+from django.db.models.functions import Upper
 from django.contrib.auth.models import AbstractUser
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 import uuid
 
+def uuid_hex():
+    return uuid.uuid4().hex
+
+def trigram(field):
+    """Index expression for icontains searches, which compare UPPER(field) LIKE UPPER(...)"""
+    return OpClass(Upper(field), name='gin_trgm_ops')
+
 class User(AbstractUser):
     api_key = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
     credit_balance = models.IntegerField(default=1000, validators=[MinValueValidator(0)])
@@ -24,20 +34,21 @@ class User(AbstractUser):
     
     class Meta:
         db_table = 'users'
+        indexes = [
+            GinIndex(trigram('username'), name='users_username_trgm'),
+        ]
     
     def __str__(self):
         return self.username
     
-    def has_sufficient_credits(self, use_proxy=False):
-        if use_proxy:
-            return self.credit_balance >= 100
-        return self.credit_balance >= 200
+    def request_cost(self, use_proxy=False, scans=1):
+        return (100 if use_proxy else 200) * scans
     
-    def deduct_credits(self, use_proxy=False):
-        if use_proxy:
-            deduction = 100
-        else:
-            deduction = 200
+    def has_sufficient_credits(self, use_proxy=False, scans=1):
+        return self.credit_balance >= self.request_cost(use_proxy, scans)
+    
+    def deduct_credits(self, use_proxy=False, scans=1):
+        deduction = self.request_cost(use_proxy, scans)
         
         if self.credit_balance >= deduction:
             self.credit_balance -= deduction
@@ -45,6 +56,22 @@ class User(AbstractUser):
             return True
         return False
 
+# Sent after queryset writes to MatchTip, which skip post_save/post_delete
+tips_bulk_changed = Signal()
+
+class MatchTipQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        rows = super().update(**kwargs)
+        if rows:
+            tips_bulk_changed.send(sender=self.model)
+        return rows
+    
+    def bulk_create(self, objs, *args, **kwargs):
+        created = super().bulk_create(objs, *args, **kwargs)
+        if created:
+            tips_bulk_changed.send(sender=self.model)
+        return created
+
 class MatchTip(models.Model):
     TIP_TYPES = [
         ('normal', 'Normal'),
@@ -76,14 +103,28 @@ class MatchTip(models.Model):
     is_live = models.BooleanField(default=False)
     is_major_league = models.BooleanField(default=False)
     
+    # Settled outcome of the pick, used by backtests
+    result = models.CharField(max_length=10, default='pending', choices=[
+        ('pending', 'Pending'),
+        ('won', 'Won'),
+        ('lost', 'Lost'),
+        ('void', 'Void'),
+    ])
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = MatchTipQuerySet.as_manager()
+    
     class Meta:
         db_table = 'match_tips'
         indexes = [
             models.Index(fields=['match_time', 'tip_type']),
             models.Index(fields=['confidence_level', 'tip_type']),
+            GinIndex(
+                trigram('league'), trigram('home_team'), trigram('away_team'),
+                name='match_tips_search_trgm',
+            ),
         ]
     
     def __str__(self):
@@ -101,6 +142,9 @@ class APIRequestLog(models.Model):
     class Meta:
         db_table = 'api_request_logs'
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['timestamp', 'id']),
+        ]
 
 class Subscription(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='subscriptions')
@@ -112,6 +156,35 @@ class Subscription(models.Model):
     class Meta:
         db_table = 'subscriptions'
 
+class TipSubscription(models.Model):
+    """Push new or changed tips matching these filters to a webhook and/or SSE"""
+    TIP_TYPES = [
+        ('any', 'Any'),
+        ('normal', 'Normal'),
+        ('underdog', 'Underdog'),
+    ]
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='tip_subscriptions')
+    tip_type = models.CharField(max_length=20, choices=TIP_TYPES, default='any')
+    league = models.CharField(max_length=255, blank=True, default='')
+    min_percentage = models.DecimalField(
+        max_digits=5, decimal_places=2, default=85,
+        validators=[MinValueValidator(0), MaxValueValidator(100)]
+    )
+    webhook_url = models.URLField(max_length=500, blank=True, default='')
+    secret = models.CharField(max_length=64, default=uuid_hex, editable=False)
+    is_active = models.BooleanField(default=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        db_table = 'tip_subscriptions'
+        indexes = [
+            models.Index(fields=['is_active', 'tip_type']),
+        ]
+    
+    def __str__(self):
+        return f"{self.user} {self.tip_type} {self.league or '*'} >= {self.min_percentage}%"
+
 class CreditTransaction(models.Model):
     TRANSACTION_TYPES = [
         ('api_call', 'API Call'),
@@ -124,11 +197,14 @@ class CreditTransaction(models.Model):
     transaction_type = models.CharField(max_length=20, choices=TRANSACTION_TYPES)
     amount = models.IntegerField()
     description = models.TextField()
-    created_at = models.DateTimeField(auto_now_add_add=True)
+    created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         db_table = 'credit_transactions'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at', 'id']),
+        ]
 
 class Proxy(models.Model):
     host = models.CharField(max_length=255)
@@ -0,0 +1,382 @@
+"""Push new and changed tips to subscribers.
+
+The DeltaFeed reports what moved in each freshly ingested snapshot. For
+every added/changed tip, ``Notifier.dispatch`` queues a fan-out job (a
+Celery task, or a background thread without a broker). The job looks up
+the matching ``TipSubscription`` rows in an in-memory index, drops tips
+already sent, groups the rest per subscriber and hands them to the
+delivery channels: one webhook job per subscription (retried with
+backoff) and one SSE message per user when streams are enabled. The
+thread that ingested the snapshot only builds the events.
+"""
+import hashlib
+import hmac
+import ipaddress
+import json
+import logging
+import queue
+import random
+import socket
+import threading
+from bisect import bisect_right
+from collections import defaultdict
+from typing import NamedTuple
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .feed import REMOVED
+from .metrics import NOTIFICATIONS, WEBHOOK_DELIVERIES
+from .models import TipSubscription
+
+logger = logging.getLogger(__name__)
+
+ANY = 'any'
+
+
+class Target(NamedTuple):
+    """What fan-out needs from a subscription, without holding model instances"""
+    id: int
+    user_id: int
+    webhook_url: str
+    secret: str
+
+
+class SubscriptionIndex:
+    """Active subscriptions bucketed by (tip_type, league).
+
+    Each bucket keeps its subscriptions sorted by ``min_percentage``, so the
+    subscriptions a tip satisfies are a prefix found with one bisect. A tip
+    probes at most four buckets (exact/any tip type x exact/any league)
+    regardless of how many subscriptions exist.
+    """
+
+    def __init__(self, subscriptions):
+        buckets = defaultdict(list)
+        for sub in subscriptions:
+            target = Target(sub.id, sub.user_id, sub.webhook_url, sub.secret)
+            buckets[(sub.tip_type, sub.league)].append((float(sub.min_percentage), target))
+        self.buckets = {}
+        self.size = 0
+        for key, entries in buckets.items():
+            entries.sort(key=lambda entry: entry[0])
+            self.buckets[key] = ([e[0] for e in entries], [e[1] for e in entries])
+            self.size += len(entries)
+
+    def __len__(self):
+        return self.size
+
+    def match(self, tip_type, league, percentage):
+        for key in ((tip_type, league), (tip_type, ''), (ANY, league), (ANY, '')):
+            bucket = self.buckets.get(key)
+            if bucket is not None:
+                thresholds, targets = bucket
+                yield from targets[:bisect_right(thresholds, percentage)]
+
+
+class LocalBroker:
+    """In-process pub/sub for SSE when no Redis is configured (single worker)"""
+
+    def __init__(self, maxsize=1000):
+        self.maxsize = maxsize
+        self.lock = threading.Lock()
+        self.queues = defaultdict(set)
+
+    def publish(self, user_id, message):
+        with self.lock:
+            listeners = list(self.queues.get(user_id, ()))
+        for q in listeners:
+            try:
+                q.put_nowait(message)
+            except queue.Full:
+                pass
+
+    def listen(self, user_id, timeout):
+        """Yield messages for user_id, or None every ``timeout`` seconds of silence"""
+        q = queue.Queue(maxsize=self.maxsize)
+        with self.lock:
+            self.queues[user_id].add(q)
+        try:
+            while True:
+                try:
+                    yield q.get(timeout=timeout)
+                except queue.Empty:
+                    yield None
+        finally:
+            with self.lock:
+                self.queues[user_id].discard(q)
+                if not self.queues[user_id]:
+                    del self.queues[user_id]
+
+
+class RedisBroker:
+    """Redis pub/sub for SSE, shared by every worker process"""
+
+    def __init__(self, url):
+        import redis
+
+        self.client = redis.Redis.from_url(url)
+
+    @staticmethod
+    def channel(user_id):
+        return f"tips:stream:{user_id}"
+
+    def publish(self, user_id, message):
+        self.client.publish(self.channel(user_id), message)
+
+    def listen(self, user_id, timeout):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.channel(user_id))
+        try:
+            while True:
+                message = pubsub.get_message(timeout=timeout)
+                yield message['data'].decode() if message else None
+        finally:
+            pubsub.close()
+
+
+class CeleryDelivery:
+    """Fan-out and webhook jobs for the Celery worker, which retries webhooks with backoff"""
+
+    def send(self, subscription_id, url, secret, body):
+        from .tasks import deliver_webhook
+
+        deliver_webhook.delay(subscription_id, url, secret, body)
+
+    def fan_out(self, tip_type, events):
+        from .tasks import fan_out_tips
+
+        fan_out_tips.delay(tip_type, events)
+
+
+class ThreadDelivery:
+    """Fan-out and webhook jobs on a background thread, for when no Celery
+    broker is configured.
+
+    Eager Celery would match subscriptions and POST (and retry) inline,
+    inside whichever request ingested the snapshot. Here one daemon thread
+    works through a bounded queue and failed attempts are re-queued by
+    timers with the task's backoff, so a slow subscriber holds up neither
+    requests nor other deliveries. Pending jobs are lost on restart;
+    production runs the Celery worker.
+    """
+
+    def __init__(self, max_retries=8, backoff=5, backoff_max=600, maxsize=1000):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def submit(self, func, *args):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name="webhook-delivery", daemon=True)
+                self.thread.start()
+        self.queue.put_nowait((func, args))
+
+    def send(self, subscription_id, url, secret, body, attempt=0):
+        self.submit(self.deliver, subscription_id, url, secret, body, attempt)
+
+    def fan_out(self, tip_type, events):
+        from .tasks import fan_out_tips
+
+        self.submit(fan_out_tips, tip_type, events)
+
+    def run(self):
+        while True:
+            func, args = self.queue.get()
+            try:
+                func(*args)
+            except Exception:
+                logger.exception("background notification job failed", extra={"job": func.__name__})
+
+    def deliver(self, subscription_id, url, secret, body, attempt):
+        import requests
+
+        from .tasks import RetryableDelivery, post_webhook
+
+        try:
+            post_webhook(subscription_id, url, secret, body)
+        except (requests.RequestException, RetryableDelivery) as e:
+            if attempt >= self.max_retries:
+                WEBHOOK_DELIVERIES.labels(result='failed').inc()
+                logger.warning(
+                    "webhook gave up subscription=%s: %s", subscription_id, e,
+                    extra={"subscription": subscription_id, "attempts": attempt + 1},
+                )
+                return
+            WEBHOOK_DELIVERIES.labels(result='retry').inc()
+            # Same schedule as the Celery task: exponential, capped, full jitter
+            delay = random.uniform(0, min(self.backoff * 2 ** attempt, self.backoff_max))
+            timer = threading.Timer(delay, self.retry, args=(subscription_id, url, secret, body, attempt + 1))
+            timer.daemon = True
+            timer.start()
+
+    def retry(self, subscription_id, *job):
+        try:
+            self.queue.put_nowait((self.deliver, (subscription_id, *job)))
+        except queue.Full:
+            WEBHOOK_DELIVERIES.labels(result='failed').inc()
+            logger.warning("webhook queue full, dropped retry", extra={"subscription": subscription_id})
+
+
+class Notifier:
+    """DeltaFeed listener fanning tips out to webhooks and SSE streams.
+
+    ``broker`` is None when SSE is disabled; tips then only go to webhooks.
+    """
+
+    def __init__(self, cache, broker, delivery, dedupe_timeout=6 * 3600):
+        self.cache = cache
+        self.broker = broker
+        self.delivery = delivery
+        self.dedupe_timeout = dedupe_timeout
+        self.lock = threading.Lock()
+        self._index = None
+        self._version = None
+
+    def version(self):
+        return self.cache.get('tip_subscriptions:version', 0)
+
+    def invalidate(self):
+        """Make every worker rebuild its index on the next dispatch"""
+        if not self.cache.add('tip_subscriptions:version', 1, None):
+            try:
+                self.cache.incr('tip_subscriptions:version')
+            except ValueError:
+                self.cache.set('tip_subscriptions:version', 1, None)
+
+    def index(self):
+        version = self.version()
+        with self.lock:
+            if self._index is None or self._version != version:
+                self._index = SubscriptionIndex(
+                    TipSubscription.objects.filter(is_active=True).only(
+                        'id', 'user_id', 'tip_type', 'league', 'min_percentage',
+                        'webhook_url', 'secret',
+                    )
+                )
+                self._version = version
+            return self._index
+
+    @staticmethod
+    def sent_key(tip_type, event):
+        # Several feeds (thresholds, exclude_major) report the same tip
+        raw = repr((
+            tip_type, event['league'], event['match'], event['market'], event['pick'],
+            event['percentage'], event['odds'],
+        ))
+        return 'notify:' + hashlib.sha1(raw.encode()).hexdigest()
+
+    def dispatch(self, store_key, threshold, version, delta):
+        """DeltaFeed listener: hand the added/changed tips to the delivery backend.
+
+        Runs on the thread that ingested the snapshot, so it only builds the
+        events; matching them to subscriptions happens in ``fan_out``.
+        """
+        tip_type = store_key[0]
+        events = [
+            {'event': kind, 'tip_type': tip_type, **record.as_dict()}
+            for kind, record in delta.values() if kind != REMOVED
+        ]
+        if not events:
+            return
+        try:
+            self.delivery.fan_out(tip_type, events)
+        except Exception:
+            logger.exception("fan-out enqueue failed", extra={"store_key": str(store_key), "version": version})
+
+    def fan_out(self, tip_type, events):
+        """Match events to subscriptions and queue one webhook job per
+        subscription and one stream message per user"""
+        index = self.index()
+        if not len(index):
+            return
+
+        webhooks = defaultdict(list)
+        streams = defaultdict(dict)
+        for event in events:
+            targets = list(index.match(tip_type, event['league'], event['percentage']))
+            if not targets:
+                continue
+            if not self.cache.add(self.sent_key(tip_type, event), 1, self.dedupe_timeout):
+                continue
+            tip = (event['league'], event['match'], event['market'], event['pick'])
+            for target in targets:
+                if target.webhook_url:
+                    webhooks[target].append(event)
+                if self.broker is None:
+                    continue
+                # One SSE event per tip per user, listing every subscription it hit
+                entry = streams[target.user_id].setdefault(tip, {**event, 'subscriptions': []})
+                entry['subscriptions'].append(target.id)
+
+        for target, target_events in webhooks.items():
+            body = json.dumps({'subscription': target.id, 'tips': target_events}, default=str)
+            try:
+                self.delivery.send(target.id, target.webhook_url, target.secret, body)
+            except Exception:
+                logger.exception("webhook enqueue failed", extra={"subscription": target.id})
+                continue
+            NOTIFICATIONS.labels(channel='webhook').inc(len(target_events))
+
+        for user_id, user_events in streams.items():
+            message = json.dumps(list(user_events.values()), default=str)
+            try:
+                self.broker.publish(user_id, message)
+            except Exception:
+                logger.exception("stream publish failed", extra={"user": user_id})
+                continue
+            NOTIFICATIONS.labels(channel='sse').inc(len(user_events))
+
+        logger.info(
+            "notified %d webhooks, %d streams", len(webhooks), len(streams),
+            extra={"tip_type": tip_type, "tips": len(events)},
+        )
+
+
+def sign(secret, body):
+    """Value of the X-Tip-Signature header for a webhook body"""
+    return 'sha256=' + hmac.new(secret.encode(), body.encode(), hashlib.sha256).hexdigest()
+
+
+def check_webhook_url(url):
+    """Raise ValueError unless url is http(s) and its host only resolves to public addresses.
+
+    Keeps subscribers from pointing the server at loopback, private,
+    link-local (cloud metadata) or otherwise reserved addresses.
+    """
+    parts = urlsplit(url)
+    if parts.scheme not in ('http', 'https') or not parts.hostname:
+        raise ValueError('Webhook URL must be an http(s) URL with a host')
+    try:
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        addresses = {info[4][0] for info in socket.getaddrinfo(parts.hostname, port, proto=socket.IPPROTO_TCP)}
+    except (ValueError, socket.gaierror):
+        raise ValueError(f'Webhook host {parts.hostname} does not resolve')
+    for address in addresses:
+        ip = ipaddress.ip_address(address.split('%', 1)[0])
+        if getattr(ip, 'ipv4_mapped', None):
+            ip = ip.ipv4_mapped
+        if not ip.is_global or ip.is_multicast:
+            raise ValueError('Webhook URL must not point to a private, loopback or reserved address')
+
+
+notifier = Notifier(
+    cache,
+    (RedisBroker(settings.REDIS_URL) if settings.REDIS_URL else LocalBroker())
+    if getattr(settings, 'SSE_ENABLED', False) else None,
+    # Without a broker Celery runs tasks eagerly, i.e. inline in the request
+    ThreadDelivery() if getattr(settings, 'CELERY_TASK_ALWAYS_EAGER', False) else CeleryDelivery(),
+    dedupe_timeout=getattr(settings, 'NOTIFY_DEDUPE_SECONDS', 6 * 3600),
+)
+
+
+@receiver([post_save, post_delete], sender=TipSubscription)
+def subscriptions_changed(sender, **kwargs):
+    notifier.invalidate()
@@ -0,0 +1,160 @@
+"""Incremental decoding of upstream pages.
+
+Upstream pages are one JSON object, ``{"data": [...], "remaining": ...}``.
+``PageStream`` reads the body chunk by chunk and decodes ``data`` one entry
+at a time with ``json.JSONDecoder.raw_decode``, so a page never exists as a
+full object tree: only the current entry and the unread part of a chunk
+are held. The other top-level keys are small and decoded whole.
+"""
+import codecs
+import json
+import re
+
+WHITESPACE = re.compile(r"[ \t\n\r]*")
+DELIMITERS = frozenset(" \t\n\r,]}:")
+decoder = json.JSONDecoder()
+
+
+class PageStream:
+    """Read-only mapping over a streamed page object.
+
+    ``page["data"]`` is an iterator of entries, produced as the body is
+    read. Other keys are decoded on demand; asking for one that comes after
+    ``data`` skips through the rest of the array. Malformed input raises
+    ``json.JSONDecodeError`` (a ``ValueError``) at the point it is read.
+    """
+
+    def __init__(self, chunks, array_key="data"):
+        self.chunks = iter(chunks)
+        self.array_key = array_key
+        self.text = codecs.getincrementaldecoder("utf-8")()
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+        self.meta = {}
+        self.entries = None
+        # start -> (key -> value -> after)* -> done; "array" while in data
+        self.state = "start"
+
+    def __contains__(self, key):
+        if key in self.meta or (key == self.array_key and self.entries is not None):
+            return True
+        return self.read_until(key)
+
+    def __getitem__(self, key):
+        if key == self.array_key and key not in self.meta:
+            if self.entries is None and not self.read_until(key):
+                raise KeyError(key)
+            return self.entries
+        if key not in self.meta and not self.read_until(key):
+            raise KeyError(key)
+        return self.meta[key]
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def finish(self):
+        """Parse the rest of the page and read the body to its end.
+
+        Callers are usually done once they have ``data`` and ``remaining``,
+        which leaves the closing brace (and any keys after them) unread;
+        draining lets the chunk source see the whole body, e.g. to cache
+        it. Raises ``json.JSONDecodeError`` if the page is cut short or
+        followed by anything but whitespace.
+        """
+        self.read_until(None)
+        if self.peek():
+            raise json.JSONDecodeError("Extra data", self.buf, self.pos)
+
+    def read_until(self, key):
+        """Parse forward until ``key`` is available; False at the end of the page"""
+        while self.state != "done":
+            if self.state == "array":
+                for _ in self.entries:
+                    pass
+            name = self.next_key()
+            if name is None:
+                break
+            if name == self.array_key and self.peek() == "[":
+                self.pos += 1
+                self.state = "array"
+                self.entries = self.iter_entries()
+            else:
+                self.meta[name] = self.value()
+                self.state = "after"
+            if name == key:
+                return True
+        return False
+
+    def next_key(self):
+        if self.state == "start":
+            self.expect("{")
+            if self.peek() == "}":
+                self.pos += 1
+                self.state = "done"
+                return None
+        elif self.expect(",}") == "}":
+            self.state = "done"
+            return None
+        name = self.value()
+        if not isinstance(name, str):
+            raise json.JSONDecodeError("Expecting property name", self.buf, self.pos)
+        self.expect(":")
+        return name
+
+    def iter_entries(self):
+        if self.peek() == "]":
+            self.pos += 1
+            self.state = "after"
+            return
+        while True:
+            yield self.value()
+            if self.expect(",]") == "]":
+                self.state = "after"
+                return
+
+    def fill(self):
+        """Append the next chunk to the buffer; False once the body is exhausted"""
+        if self.eof:
+            return False
+        try:
+            text = self.text.decode(next(self.chunks))
+        except StopIteration:
+            self.eof = True
+            text = self.text.decode(b"", final=True)
+        self.buf = self.buf[self.pos:] + text
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character, "" at the end of the body"""
+        while True:
+            self.pos = WHITESPACE.match(self.buf, self.pos).end()
+            if self.pos < len(self.buf) or not self.fill():
+                return self.buf[self.pos:self.pos + 1]
+
+    def expect(self, chars):
+        char = self.peek()
+        if not char or char not in chars:
+            raise json.JSONDecodeError(f"Expecting one of {chars!r}", self.buf, self.pos)
+        self.pos += 1
+        return char
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = decoder.raw_decode(self.buf, self.pos)
+            except json.JSONDecodeError:
+                # Most likely cut off at the chunk boundary
+                if not self.fill():
+                    raise
+                continue
+            # Valid values end at a delimiter; a number cut at the chunk
+            # boundary ("1.5" of "1.55") does not, so read on
+            if self.buf[end:end + 1] in DELIMITERS or not self.fill():
+                self.pos = end
+                return value
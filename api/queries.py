@@ -0,0 +1,92 @@
+"""SQL instrumentation: per-request query counts, time and N+1 detection.
+
+``QueryRecorder`` is a ``connection.execute_wrapper`` that counts and
+times every statement and groups them by shape (the SQL with literals and
+IN-lists collapsed). The same shape running many times in one request is
+the signature of an N+1: a query issued once per row of an earlier one.
+``QueryMetricsMiddleware`` reports this per request; ``query_budget``
+enforces it in tests.
+"""
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from django.db import connections
+
+# Same statement shape this many times in one request counts as N+1
+N_PLUS_ONE_THRESHOLD = 5
+
+_IN_LIST = re.compile(r'\bIN \((?:%s|\?)(?:, (?:%s|\?))*\)', re.IGNORECASE)
+_NUMBER = re.compile(r'\b\d+(?:\.\d+)?\b')
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_SPACE = re.compile(r'\s+')
+
+
+def normalize(sql):
+    """Statement shape: literals become ?, IN-lists become IN (...)"""
+    sql = _STRING.sub('?', sql)
+    sql = _NUMBER.sub('?', sql)
+    sql = _IN_LIST.sub('IN (...)', sql)
+    return _SPACE.sub(' ', sql).strip()
+
+
+class QueryRecorder:
+    """Execute wrapper that counts, times and groups SQL by shape"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.seconds += time.perf_counter() - started
+            self.count += 1
+            self.shapes[normalize(sql)] += 1
+
+    def n_plus_one(self, threshold=N_PLUS_ONE_THRESHOLD):
+        """Shapes repeated at least ``threshold`` times, most repeated first"""
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+    def header(self, threshold=N_PLUS_ONE_THRESHOLD):
+        """Value of the X-DB-Queries debug header"""
+        return (
+            f"count={self.count}; time_ms={self.seconds * 1000:.1f}; "
+            f"n_plus_one={len(self.n_plus_one(threshold))}"
+        )
+
+    def report(self):
+        return '\n'.join(f"{n:>4} x {shape}" for shape, n in self.shapes.most_common())
+
+
+@contextmanager
+def record_queries(using='default'):
+    recorder = QueryRecorder()
+    with connections[using].execute_wrapper(recorder):
+        yield recorder
+
+
+@contextmanager
+def query_budget(max_queries, n_plus_one_threshold=N_PLUS_ONE_THRESHOLD, using='default'):
+    """Fail when the block runs more than ``max_queries`` or any N+1 shape.
+
+    Usage in tests::
+
+        with query_budget(3):
+            self.client.get('/api/tips/')
+    """
+    with record_queries(using) as recorder:
+        yield recorder
+    if recorder.count > max_queries:
+        raise AssertionError(
+            f"{recorder.count} queries over a budget of {max_queries}:\n{recorder.report()}"
+        )
+    repeated = recorder.n_plus_one(n_plus_one_threshold)
+    if repeated:
+        raise AssertionError(
+            "N+1 query pattern:\n" + '\n'.join(f"{n:>4} x {shape}" for shape, n in repeated)
+        )
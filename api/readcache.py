@@ -0,0 +1,137 @@
+"""Read-through cache of rendered MatchTip responses.
+
+Every MatchTip write bumps a global data version (post_save/post_delete;
+queryset ``update``/``bulk_create``, which skip those, send
+``tips_bulk_changed``). Cached responses are keyed by that version plus
+the action, its normalized query and the host and scheme (pagination
+links are absolute), so a write makes every older entry unreachable and
+they simply age out; nothing is purged. The
+same key doubles as the ETag, and the time of the last write as
+Last-Modified, so clients revalidate with 304s. Actions whose result also
+depends on the clock (today, upcoming) are keyed on the current day or
+minute as well, and their Last-Modified is never earlier than the start
+of that bucket.
+"""
+import hashlib
+import time
+from functools import wraps
+
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseNotModified
+from django.utils.http import http_date, parse_http_date_safe, parse_etags
+
+from .metrics import READ_CACHE
+from .models import MatchTip, tips_bulk_changed
+
+VERSION_KEY = 'matchtips:version'
+MODIFIED_KEY = 'matchtips:modified'
+TIMEOUT = 24 * 3600
+
+# Length in seconds of the buckets time-dependent actions are keyed on;
+# days start at midnight UTC, like timezone.now().date() in the views
+BUCKETS = {
+    'day': 24 * 3600,
+    'minute': 60,
+}
+
+
+def tips_version():
+    """(version, last write as a timestamp) of MatchTip data"""
+    state = cache.get_many([VERSION_KEY, MODIFIED_KEY])
+    if VERSION_KEY not in state:
+        # First use (or the cache was flushed): start a fresh epoch
+        now = time.time()
+        cache.add(MODIFIED_KEY, now, None)
+        cache.add(VERSION_KEY, int(now), None)
+        state = cache.get_many([VERSION_KEY, MODIFIED_KEY])
+    return state.get(VERSION_KEY, 0), state.get(MODIFIED_KEY, 0)
+
+
+def bump_tips_version():
+    """Invalidate every cached MatchTip response"""
+    cache.set(MODIFIED_KEY, time.time(), None)
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, int(time.time()), None)
+
+
+@receiver([post_save, post_delete, tips_bulk_changed], sender=MatchTip)
+def tips_changed(sender, **kwargs):
+    bump_tips_version()
+
+
+def bucket_start(bucket):
+    """Timestamp at which the current day/minute bucket began"""
+    size = BUCKETS[bucket]
+    return int(time.time() // size * size)
+
+
+def response_key(request, action, version, started=None):
+    params = sorted(
+        (name, values) for name, values in request.query_params.lists() if any(values)
+    )
+    raw = repr((
+        action, request.accepted_renderer.format, params, started,
+        request.scheme, request.get_host(),
+    ))
+    return f"tips:response:{version}:{hashlib.sha1(raw.encode()).hexdigest()}"
+
+
+def not_modified(request, etag, modified):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match:
+        return etag in parse_etags(if_none_match) or if_none_match.strip() == '*'
+    since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return since is not None and int(modified) <= since
+
+
+def versioned_cache(bucket=None):
+    """Serve a viewset action from the versioned cache.
+
+    Needs ``CachedResponseMixin`` on the viewset, which stores the
+    rendered response of a miss.
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            version, modified = tips_version()
+            started = bucket_start(bucket) if bucket else None
+            if started is not None:
+                # A new bucket changes the result even without writes
+                modified = max(modified, started)
+            key = response_key(request, method.__name__, version, started)
+            etag = f'"{key.rsplit(":", 1)[1][:20]}-{version}"'
+
+            if not_modified(request, etag, modified):
+                READ_CACHE.labels(result='not_modified').inc()
+                response = HttpResponseNotModified()
+            else:
+                hit = cache.get(key)
+                if hit is not None:
+                    READ_CACHE.labels(result='hit').inc()
+                    content, content_type = hit
+                    response = HttpResponse(content, content_type=content_type)
+                else:
+                    READ_CACHE.labels(result='miss').inc()
+                    response = method(self, request, *args, **kwargs)
+                    response.cache_key = key
+            response['ETag'] = etag
+            response['Last-Modified'] = http_date(modified)
+            return response
+        return wrapper
+    return decorator
+
+
+class CachedResponseMixin:
+    """Store responses of ``versioned_cache`` misses once they are rendered"""
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        key = getattr(response, 'cache_key', None)
+        if key and response.status_code == 200:
+            response.render()
+            cache.set(key, (response.content, response['Content-Type']), TIMEOUT)
+        return response
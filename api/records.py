@@ -0,0 +1,49 @@
+"""Scan result rows.
+
+Kept apart from ``scanners`` so the snapshot store can load without
+pulling in ``requests`` and the scanner classes.
+"""
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+# Dominant percentage from which a tip is flagged hot
+HOT_PCT = 85
+
+
+class MatchRecord(NamedTuple):
+    """One processed upstream row; tuple-backed to keep scans light"""
+    league: str
+    home: str
+    away: str
+    market: str
+    code: str
+    pick: str
+    kickoff: datetime
+    kickoff_ts: float
+    odds: Optional[float]
+    percentage: float
+    total_money: float
+    dominant_money: float
+    
+    @property
+    def key(self):
+        return (self.league, self.home, self.away, self.market, self.code)
+    
+    @property
+    def is_hot(self):
+        return self.percentage >= HOT_PCT
+    
+    def as_dict(self):
+        """Public match shape returned by /api/matches/"""
+        return {
+            "league": self.league,
+            "match": f"{self.home} vs {self.away}",
+            "match_kickoff": self.kickoff.isoformat(),
+            "pick": self.pick,
+            "odds": self.odds,
+            "percentage": self.percentage,
+            "market": self.market,
+            "is_hot": self.percentage >= HOT_PCT,
+            "total_money": self.total_money,
+            "dominant_money": self.dominant_money,
+        }
@@ -1,11 +1,105 @@
 import requests
+import contextvars
+import heapq
 import json
+import logging
+import threading
 import time
 import random
-from datetime import datetime, date
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from operator import attrgetter
+from typing import NamedTuple, Optional
 from urllib.parse import urlparse
 
+from django.conf import settings
+
+from .metrics import (
+    UPSTREAM_REQUESTS, UPSTREAM_LATENCY, UPSTREAM_BYTES, PAGE_CACHE,
+    SCAN_PAGES, SCAN_MATCHES, SCAN_ROWS, SCAN_DEDUP_DROPS, SCAN_CACHE, proxy_label,
+)
+from .log import scan_context
+from .pagestream import PageStream
+from .records import MatchRecord
+
+logger = logging.getLogger(__name__)
+
+class RateLimiter:
+    """Thread-safe minimum spacing between request starts"""
+    def __init__(self, interval=2.0):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.next_slot = 0.0
+    
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+class CachedPage(NamedTuple):
+    etag: Optional[str]
+    last_modified: Optional[str]
+    body: bytes
+
+class PageCache:
+    """Size-bounded LRU of upstream page bodies with their validators.
+    
+    Lets ``make_request`` revalidate a page with If-None-Match /
+    If-Modified-Since and reuse the stored body on 304 instead of
+    downloading it again. Shared by every scanner in the process.
+    """
+    def __init__(self, max_bytes=32 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.pages = OrderedDict()
+        self.size = 0
+    
+    def get(self, url):
+        with self.lock:
+            page = self.pages.get(url)
+            if page is not None:
+                self.pages.move_to_end(url)
+            return page
+    
+    def put(self, url, page):
+        if len(page.body) > self.max_bytes:
+            return
+        with self.lock:
+            old = self.pages.pop(url, None)
+            if old is not None:
+                self.size -= len(old.body)
+            self.pages[url] = page
+            self.size += len(page.body)
+            while self.size > self.max_bytes:
+                _, evicted = self.pages.popitem(last=False)
+                self.size -= len(evicted.body)
+    
+    def discard(self, url):
+        with self.lock:
+            old = self.pages.pop(url, None)
+            if old is not None:
+                self.size -= len(old.body)
+
+page_cache = PageCache(getattr(settings, 'UPSTREAM_PAGE_CACHE_BYTES', 32 * 1024 * 1024))
+
 class TipScanner:
+    tip_type = "normal"
+    # Dates scanned concurrently by one fetch; they share one RateLimiter
+    max_parallel_dates = 4
+    # Seconds a per-date scan result stays reusable in the snapshot cache
+    snapshot_ttl = 120
+    # Older store snapshots up to this age are served while a background
+    # scan refreshes them
+    snapshot_stale_ttl = getattr(settings, 'SNAPSHOT_STALE_SECONDS', 600)
+    # Decode pages entry by entry while they download instead of loading
+    # the whole document
+    stream_pages = getattr(settings, 'UPSTREAM_STREAM_PAGES', True)
+    stream_chunk_size = 64 * 1024
+    
     def __init__(self, proxy=None):
         self.base_url = "your_url_here"
         self.session = requests.Session()
@@ -21,55 +115,128 @@ class TipScanner:
             ", Connection: keep-alive"
         )
         
-        self.session.headers.update({"User-Agent": user_agent_string})
+        self.session.headers.update({
+            "User-Agent": user_agent_string,
+            # gzip/deflate, plus br when the brotli package is installed
+            "Accept-Encoding": requests.utils.DEFAULT_ACCEPT_ENCODING,
+        })
         self.proxy = proxy
         self.request_count = 0
-        self.last_request_time = None
+        self.rate_limiter = RateLimiter(2.0)
+        self.page_cache = page_cache
     
-    def make_request(self, url, step):
-        """Make a single request with optional proxy"""
+    def make_request(self, url, step, stream=False):
+        """Make a single request with optional proxy; returns the page body.
+        
+        Pages seen before are requested conditionally with their stored
+        ETag/Last-Modified; a 304 returns the cached body. With ``stream``
+        the body comes back as an iterable of byte chunks, read from the
+        socket as it is consumed.
+        """
         self.request_count += 1
         
-        # Rate limiting
-        if self.last_request_time:
-            time_since_last = (datetime.utcnow() - self.last_request_time).total_seconds()
-            if time_since_last < 2.0:
-                wait_time = 2.0 - time_since_last
-                time.sleep(wait_time)
+        # Rate limiting, shared by every thread of this scan
+        self.rate_limiter.wait()
         
         try:
-            print(f"[REQUEST] Step {step}")
+            logger.debug("request step=%s", step, extra={"step": step})
             
             kwargs = {
                 'timeout': 30,
-                'headers': self.session.headers
+                'stream': stream,
             }
             
+            cached = self.page_cache.get(url) if self.page_cache is not None else None
+            if cached is not None:
+                kwargs['headers'] = {}
+                if cached.etag:
+                    kwargs['headers']['If-None-Match'] = cached.etag
+                if cached.last_modified:
+                    kwargs['headers']['If-Modified-Since'] = cached.last_modified
+            
             if self.proxy:
                 kwargs['proxies'] = {
                     'http': self.proxy,
                     'https': self.proxy
                 }
             
-            response = requests.get(url, **kwargs)
-            self.last_request_time = datetime.utcnow()
+            started = time.perf_counter()
+            try:
+                response = self.session.get(url, **kwargs)
+            except Exception:
+                self.observe_request("error", time.perf_counter() - started)
+                raise
+            self.observe_request(str(response.status_code), time.perf_counter() - started)
+            if stream and response.status_code == 200:
+                return self.stream_body(url, response)
+            self.observe_bytes(response, len(response.content))
             
+            if response.status_code == 304 and cached is not None:
+                PAGE_CACHE.labels(result="revalidated").inc()
+                return (cached.body,) if stream else cached.body
             if response.status_code == 200:
-                return response
+                self.remember_page(url, response, response.content)
+                return response.content
             else:
-                print(f"[ERROR] HTTP {response.status_code} for step {step}")
+                logger.warning(
+                    "upstream HTTP %s step=%s", response.status_code, step,
+                    extra={"step": step, "status": response.status_code},
+                )
                 return None
                 
         except Exception as e:
-            print(f"[ERROR] Request failed: {e}")
+            logger.warning("request failed step=%s: %s", step, e, extra={"step": step})
             return None
     
+    def stream_body(self, url, response):
+        """Yield the body in chunks; cache it once fully read if it has validators"""
+        keep = self.page_cache is not None and (
+            "ETag" in response.headers or "Last-Modified" in response.headers
+        )
+        chunks = []
+        size = 0
+        try:
+            for chunk in response.iter_content(self.stream_chunk_size):
+                size += len(chunk)
+                if keep:
+                    chunks.append(chunk)
+                yield chunk
+        finally:
+            response.close()
+            self.observe_bytes(response, size)
+        self.remember_page(url, response, b"".join(chunks))
+    
+    def remember_page(self, url, response, body):
+        if self.page_cache is None:
+            return
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if etag or last_modified:
+            PAGE_CACHE.labels(result="stored").inc()
+            self.page_cache.put(url, CachedPage(etag, last_modified, body))
+        else:
+            # Nothing to revalidate with; do not keep a stale body around
+            PAGE_CACHE.labels(result="uncacheable").inc()
+            self.page_cache.discard(url)
+    
+    def observe_bytes(self, response, size):
+        # Bytes read off the socket, i.e. before decompression
+        raw = getattr(response.raw, "tell", None)
+        wire = raw() if raw else size
+        UPSTREAM_BYTES.labels(proxy=proxy_label(self.proxy)).inc(wire)
+    
+    def observe_request(self, status, elapsed):
+        labels = {"status": status, "proxy": proxy_label(self.proxy)}
+        UPSTREAM_REQUESTS.labels(**labels).inc()
+        UPSTREAM_LATENCY.labels(**labels).observe(elapsed)
+    
     def fire_request(self, step, f_date, min_percent=69, max_percent=100, 
-                    min_vol=50, max_vol=103, exclude_major_leagues=False):
+                    min_vol=50, max_vol=103, exclude_major_leagues=False,
+                    live_only=False, order_by_time=False):
         """Make request to betwatch.fr"""
         params = (
-            f"live_only=false&prematch_only=false&finished_only=false&favorite_only=false"
-            f"&utc=1&step={step}&date={f_date}&order_by_time=false"
+            f"live_only={str(live_only).lower()}&prematch_only=false&finished_only=false&favorite_only=false"
+            f"&utc=1&step={step}&date={f_date}&order_by_time={str(order_by_time).lower()}"
             f"&not_countries=&not_leagues={'228,2005,39218,3784863,12251791,12374160,12375833,141,10932509,11086347,12199359,59,55,57,81,117,13' if exclude_major_leagues else ''}"
             f"&min_vol={min_vol}&max_vol={max_vol}"
             f"&min_percent={min_percent}&max_percent={max_percent}"
@@ -77,82 +244,96 @@ class TipScanner:
         )
         
         url = f"{self.base_url}{params}"
-        print(f"[REQUEST] URL: {url[:100]}...")
         
-        response = self.make_request(url, step)
+        if self.stream_pages:
+            chunks = self.make_request(url, step, stream=True)
+            return PageStream(chunks) if chunks is not None else None
+        
+        body = self.make_request(url, step)
         
-        if response:
+        if body is not None:
             try:
-                data = response.json()
-                if "data" in data:
-                    print(f"[SUCCESS] Got {len(data['data'])} matches")
+                data = json.loads(body)
+                if "data" in data and logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(
+                        "got %d matches step=%s", len(data["data"]), step,
+                        extra={"step": step, "rows": len(data["data"])},
+                    )
                 return data
             except json.JSONDecodeError as e:
-                print(f"[ERROR] JSON decode failed: {e}")
+                logger.warning("JSON decode failed step=%s: %s", step, e, extra={"step": step})
                 return None
         
         return None
     
     def process_match(self, data, out_list, seen):
-        """Process matches and append unique ones"""
+        """Process matches and append unique ones as MatchRecord.
+        
+        Single pass per row: cheap rejections come first, the dominant
+        outcome is found without building per-row dicts, and the kickoff
+        is only parsed for rows that survive the dedup check. ``seen``
+        holds hashes of the match keys. ``data`` may be any iterable of
+        rows, e.g. a streamed page; returns the number of rows read.
+        """
+        rows = 0
+        dropped = 0
         for match in data:
-            home = match.get("htn", "") or match.get("home", "")
-            away = match.get("atn", "") or match.get("away", "")
+            rows += 1
+            total_money = match.get("v", 0)
+            outcomes = match.get("i")
+            if total_money <= 0 or not outcomes:
+                continue
+            ce = match.get("ce")
+            if not ce:
+                continue
             
-            try:
-                ce = match.get("ce")
-                if not ce:
+            # Dominant outcome by rounded percentage; first one wins ties
+            dominant = None
+            dominant_pct = None
+            for item in outcomes:
+                if len(item) < 2:
                     continue
-                match_time = datetime.fromisoformat(ce.replace("Z", "+00:00"))
-            except Exception:
+                pct = round((item[1] / total_money) * 100, 2)
+                if dominant is None or pct > dominant_pct:
+                    dominant = item
+                    dominant_pct = pct
+            if dominant is None:
                 continue
             
+            home = match.get("htn", "") or match.get("home", "")
+            away = match.get("atn", "") or match.get("away", "")
             league = match.get("ln", match.get("league", "Unknown"))
-            total_money = match.get("v", 0)
             market_name = match.get("n", "Unknown Market")
+            dominant_code = dominant[0]
             
-            if total_money <= 0 or not match.get("i"):
-                continue
-            
-            outcomes = match["i"]
-            money_split = {item[0]: item[1] for item in outcomes if len(item) >= 2}
-            odds_split = {
-                item[0]: (item[3] if len(item) > 3 else None) for item in outcomes
-            }
-            
-            if not money_split:
+            match_key = hash((league, home, away, market_name, dominant_code))
+            if match_key in seen:
+                dropped += 1
                 continue
             
-            percentages = {
-                code: round((money / total_money) * 100, 2)
-                for code, money in money_split.items()
-            }
-            
-            dominant_code = max(percentages, key=percentages.get)
-            dominant_pct = percentages[dominant_code]
-            
-            odds_for_dominant = odds_split.get(dominant_code)
-            
-            match_key = f"{league}|{home}|{away}|{market_name}|{dominant_code}"
-            if match_key in seen:
+            try:
+                match_time = datetime.fromisoformat(ce.replace("Z", "+00:00"))
+            except Exception:
                 continue
             seen.add(match_key)
             
-            dominant_money = money_split.get(dominant_code, 0)
-            
-            match_item = {
-                "league": league,
-                "match": f"{home} vs {away}",
-                "match_kickoff": match_time.isoformat(),
-                "pick": self.get_label(dominant_code, home, away),
-                "odds": odds_for_dominant,
-                "percentage": dominant_pct,
-                "market": market_name,
-                "is_hot": dominant_pct >= 85,
-                "total_money": total_money,
-                "dominant_money": dominant_money,
-            }
-            out_list.append(match_item)
+            if match_time.tzinfo is None:
+                kickoff_ts = match_time.replace(tzinfo=timezone.utc).timestamp()
+            else:
+                kickoff_ts = match_time.timestamp()
+            
+            out_list.append(MatchRecord(
+                league, home, away, market_name, dominant_code,
+                self.get_label(dominant_code, home, away),
+                match_time, kickoff_ts,
+                dominant[3] if len(dominant) > 3 else None,
+                dominant_pct, total_money, dominant[1],
+            ))
+        
+        SCAN_ROWS.labels(tip_type=self.tip_type).inc(rows)
+        if dropped:
+            SCAN_DEDUP_DROPS.labels(tip_type=self.tip_type).inc(dropped)
+        return rows
     
     def get_label(self, code, home, away):
         if code == "1":
@@ -167,17 +348,145 @@ class TipScanner:
             return code
     
     def fetch_matches_once(self, threshold_pct=69, limit=None, live_only=False, 
-                          exclude_major=False, time_order=False, proxy=None):
-        """Fetch matches and ensure uniqueness"""
-        today = date.today()
-        f_date = today.strftime("%Y-%m-%d")
+                          exclude_major=False, time_order=False, proxy=None,
+                          dates=None, cache=None, store=None):
+        """Fetch matches and ensure uniqueness.
+        
+        Returns MatchRecord tuples; call ``as_dict()`` on each to get the
+        public JSON shape. ``dates`` (``date`` objects or ``YYYY-MM-DD`` strings, default today
+        in UTC) are scanned in parallel and merged, deduplicating matches
+        that appear under several dates. ``cache`` is any object with the
+        Django cache ``get``/``set`` API; per-date results are reused from it.
+        ``store`` is a ``SnapshotStore``: fresh full-day snapshots answer the
+        query in memory, and full-day scans are published to it.
+        """
+        if proxy:
+            self.proxy = proxy
+        
+        if dates:
+            dates = [d if isinstance(d, str) else d.strftime("%Y-%m-%d") for d in dates]
+        else:
+            dates = [datetime.now(timezone.utc).strftime("%Y-%m-%d")]
+        
+        query = {
+            "threshold_pct": threshold_pct,
+            "limit": limit,
+            "live_only": live_only,
+            "exclude_major": exclude_major,
+            "time_order": time_order,
+            "cache": cache,
+            "store": store,
+        }
+        
+        with scan_context():
+            logger.info(
+                "scan started tip_type=%s dates=%s threshold=%s", self.tip_type, ",".join(dates), threshold_pct,
+                extra={"tip_type": self.tip_type, "dates": dates, "threshold": threshold_pct,
+                       "live_only": live_only, "time_order": time_order},
+            )
+            started = time.perf_counter()
+            
+            if len(dates) == 1:
+                match_list = self.scan_date(dates[0], **query)
+            else:
+                workers = min(len(dates), self.max_parallel_dates)
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    # copy_context keeps the scan_id on the worker threads' log lines
+                    futures = [
+                        pool.submit(contextvars.copy_context().run, self.scan_date, f_date, **query)
+                        for f_date in dates
+                    ]
+                    match_list = self.merge_dates([f.result() for f in futures], time_order)
+            
+            logger.info(
+                "scan finished matches=%d", len(match_list),
+                extra={"matches": len(match_list), "dates": dates,
+                       "elapsed_ms": round((time.perf_counter() - started) * 1000)},
+            )
+        
+        if limit:
+            return match_list[:limit]
+        return match_list
+    
+    def merge_dates(self, results, time_order=False):
+        """Merge per-date results (each deduplicated already) across dates"""
+        if time_order:
+            merged = heapq.merge(*results, key=attrgetter("kickoff_ts"))
+        else:
+            merged = (item for result in results for item in result)
+        
+        match_list = []
+        seen = set()
+        for item in merged:
+            key = item.key
+            if key in seen:
+                continue
+            seen.add(key)
+            match_list.append(item)
+        return match_list
+    
+    def snapshot_key(self, f_date, threshold_pct, exclude_major, live_only, time_order):
+        return (
+            f"scan:v3:{self.tip_type}:{f_date}:{threshold_pct}:"
+            f"{int(bool(exclude_major))}:{int(bool(live_only))}:{int(bool(time_order))}"
+        )
+    
+    def store_key(self, f_date, exclude_major):
+        return (self.tip_type, bool(exclude_major), f_date)
+    
+    def scan_date(self, f_date, threshold_pct=69, limit=None, live_only=False,
+                  exclude_major=False, time_order=False, cache=None, store=None,
+                  allow_stale=True):
+        """Scan every page for one date.
+        
+        ``live_only`` and ``time_order`` are pushed to the upstream query and
+        re-checked locally. With ``time_order`` the ``limit`` earliest kickoffs
+        are kept in a bounded heap; paging stops as soon as more pages cannot
+        change the result. A store snapshot past ``snapshot_ttl`` but within
+        ``snapshot_stale_ttl`` is served as is while a background thread
+        rescans the day (``allow_stale=False`` disables that). ``live_only``
+        scans never use the store: upstream decides which matches are live,
+        and the full-day snapshot cannot tell.
+        """
+        store_key = self.store_key(f_date, exclude_major)
+        if store is not None and not live_only:
+            max_age = self.snapshot_stale_ttl if allow_stale else self.snapshot_ttl
+            snapshot = store.get(store_key, max_age=max_age, threshold=threshold_pct)
+            if snapshot is not None:
+                if time.time() - snapshot.built_at > self.snapshot_ttl:
+                    SCAN_CACHE.labels(result="stale").inc()
+                    self.refresh_in_background(f_date, snapshot.threshold, exclude_major, cache, store)
+                else:
+                    SCAN_CACHE.labels(result="snapshot").inc()
+                return snapshot.query(threshold=threshold_pct, time_order=time_order, limit=limit)
+        
+        cache_key = None
+        if cache is not None:
+            cache_key = self.snapshot_key(f_date, threshold_pct, exclude_major, live_only, time_order)
+            cached = cache.get(cache_key)
+            # A scan cut short by an earlier limit is still the exact prefix
+            # any request with a limit no larger than its length needs
+            if cached is not None:
+                matches, complete, scanned_at = cached
+                if complete or (limit and len(matches) >= limit):
+                    SCAN_CACHE.labels(result="hit").inc()
+                    # Another worker's scan; a no-op once this store holds it
+                    if store is not None and complete and not live_only and not time_order:
+                        store.publish(store_key, matches, threshold_pct, built_at=scanned_at)
+                    return matches
+            SCAN_CACHE.labels(result="miss").inc()
+        
         step = 1
+        pages = 0
         remaining = True
+        complete = False
+        failed = False
         match_list = []
         seen = set()
-        
-        if proxy:
-            self.proxy = proxy
+        # Max-heap (negated keys) of the `limit` earliest kickoffs seen so far
+        heap = []
+        seq = 0
+        now = time.time()
         
         while remaining:
             req = self.fire_request(
@@ -186,28 +495,108 @@ class TipScanner:
                 min_percent=threshold_pct,
                 max_percent=100,
                 exclude_major_leagues=exclude_major,
+                live_only=live_only,
+                order_by_time=time_order,
             )
             
-            if not req or "data" not in req:
+            page = []
+            try:
+                if not req or "data" not in req:
+                    failed = True
+                    break
+                # A streamed page is decoded (and downloaded) right here
+                rows = self.process_match(req["data"] or (), page, seen)
+                remaining = req.get("remaining", False)
+                if isinstance(req, PageStream):
+                    # Read the body to its end so make_request can cache it
+                    req.finish()
+            except (ValueError, requests.RequestException) as e:
+                logger.warning("page read failed step=%s: %s", step, e, extra={"step": step})
+                failed = True
                 break
+            pages += 1
             
-            if not req["data"]:
-                remaining = False
+            if not rows:
+                complete = True
                 break
             
-            self.process_match(req["data"], match_list, seen)
+            page_latest = None
+            for item in page:
+                kickoff = item.kickoff_ts
+                if page_latest is None or kickoff > page_latest:
+                    page_latest = kickoff
+                if live_only and kickoff > now:
+                    continue
+                if not time_order:
+                    match_list.append(item)
+                    continue
+                seq += 1
+                entry = (-kickoff, -seq, item)
+                if not limit or len(heap) < limit:
+                    heapq.heappush(heap, entry)
+                elif entry > heap[0]:
+                    heapq.heapreplace(heap, entry)
+            
+            if not remaining:
+                complete = True
+            
+            # Early exit: the first `limit` matches are already known, or
+            # (with upstream time ordering) later pages can only kick off
+            # after the latest match we are keeping.
+            if limit and not time_order and len(match_list) >= limit:
+                remaining = False
+            elif (limit and time_order and len(heap) >= limit
+                  and page_latest is not None
+                  and -page_latest <= heap[0][0]):
+                remaining = False
             
-            remaining = req.get("remaining", False)
             if remaining:
                 step += 1
-            
-            time.sleep(random.uniform(0.3, 0.8))
+                time.sleep(random.uniform(0.3, 0.8))
+        
+        if time_order:
+            match_list = [item for _, _, item in sorted(heap, reverse=True)]
+        
+        SCAN_PAGES.labels(tip_type=self.tip_type).observe(pages)
+        SCAN_MATCHES.labels(tip_type=self.tip_type).observe(len(match_list))
+        logger.debug(
+            "date scanned date=%s pages=%d matches=%d", f_date, pages, len(match_list),
+            extra={"date": f_date, "pages": pages, "matches": len(match_list)},
+        )
+        
+        if cache_key and not failed:
+            cache.set(cache_key, (match_list, complete, now), self.snapshot_ttl)
+        # Only an unfiltered, unordered full-day scan holds every row
+        if store is not None and complete and not live_only and not time_order:
+            store.publish(store_key, match_list, threshold_pct, built_at=now)
         
-        if limit:
-            return match_list[:limit]
         return match_list
 
+    def refresh_in_background(self, f_date, threshold_pct, exclude_major, cache, store):
+        """Rescan a full day into the store on a daemon thread, once per key"""
+        store_key = self.store_key(f_date, exclude_major)
+        if not store.begin_refresh(store_key):
+            return
+        
+        def refresh():
+            try:
+                self.scan_date(
+                    f_date, threshold_pct=threshold_pct, exclude_major=exclude_major,
+                    cache=cache, store=store, allow_stale=False,
+                )
+            except Exception:
+                logger.exception("background refresh failed", extra={"date": f_date})
+            finally:
+                store.end_refresh(store_key)
+        
+        threading.Thread(
+            target=contextvars.copy_context().run, args=(refresh,),
+            name=f"snapshot-refresh-{f_date}", daemon=True,
+        ).start()
+
 class UnderdogTipScanner(TipScanner):
+    tip_type = "underdog"
+    
     def __init__(self, proxy=None):
         super().__init__(proxy)
         
@@ -217,11 +606,12 @@ class UnderdogTipScanner(TipScanner):
         self.min_vol = 51
         self.max_vol = 103
     
-    def fire_request(self, step, f_date, min_percent=69, max_percent=100):
-        """Override fire_request with underdog parameters"""
+    def fire_request(self, step, f_date, min_percent=69, max_percent=100,
+                    exclude_major_leagues=False, live_only=False, order_by_time=False):
+        """Override fire_request with underdog parameters (major leagues are always excluded)"""
         params = (
-            f"live_only=false&prematch_only=false&finished_only=false&favorite_only=false"
-            f"&utc=1&step={step}&date={f_date}&order_by_time=false"
+            f"live_only={str(live_only).lower()}&prematch_only=false&finished_only=false&favorite_only=false"
+            f"&utc=1&step={step}&date={f_date}&order_by_time={str(order_by_time).lower()}"
             f"&not_countries={self.not_countries}&not_leagues={self.not_leagues}"
             f"&min_vol={self.min_vol}&max_vol={self.max_vol}"
             f"&min_percent={min_percent}&max_percent={max_percent}"
@@ -229,18 +619,24 @@ class UnderdogTipScanner(TipScanner):
         )
         
         url = f"{self.base_url}{params}"
-        print(f"[UNDERDOG REQUEST] Step {step}")
         
-        response = self.make_request(url, step)
+        if self.stream_pages:
+            chunks = self.make_request(url, step, stream=True)
+            return PageStream(chunks) if chunks is not None else None
+        
+        body = self.make_request(url, step)
         
-        if response:
+        if body is not None:
             try:
-                data = response.json()
-                if "data" in data:
-                    print(f"[UNDERDOG SUCCESS] Step {step}: {len(data['data'])} matches")
+                data = json.loads(body)
+                if "data" in data and logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(
+                        "got %d underdog matches step=%s", len(data["data"]), step,
+                        extra={"step": step, "rows": len(data["data"])},
+                    )
                 return data
             except json.JSONDecodeError as e:
-                print(f"[UNDERDOG ERROR] JSON decode failed: {e}")
+                logger.warning("underdog JSON decode failed step=%s: %s", step, e, extra={"step": step})
                 return None
         
         return None
\ No newline at end of file
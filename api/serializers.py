@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import User, MatchTip, APIRequestLog, Subscription, CreditTransaction
+from .models import User, MatchTip, APIRequestLog, Subscription, CreditTransaction, TipSubscription
 from django.contrib.auth import authenticate
 import uuid
 
@@ -30,24 +30,20 @@ class UserRegistrationSerializer(serializers.ModelSerializer):
 
     def create(self, validated_data):
         referral_code = validated_data.pop("referral_code", None)
-        user = User.objects.create_user(
+        # Resolve the inviter first so the user is written in a single INSERT
+        inviter = None
+        if referral_code:
+            inviter = User.objects.filter(referral_code=referral_code).first()
+
+        return User.objects.create_user(
             username=validated_data["username"],
             email=validated_data["email"],
             password=validated_data["password"],
             referral_code=str(uuid.uuid4())[:8],
             credit_balance=1000,
+            invited_by=inviter,
         )
 
-        if referral_code:
-            try:
-                inviter = User.objects.get(referral_code=referral_code)
-                user.invited_by = inviter
-                user.save()
-            except User.DoesNotExist:
-                pass
-
-        return user
-
 
 class LoginSerializer(serializers.Serializer):
     username = serializers.CharField()
@@ -84,6 +80,7 @@ class MatchTipSerializer(serializers.ModelSerializer):
             "is_live",
             "is_major_league",
             "is_hot",
+            "result",
             "created_at",
         ]
 
@@ -104,3 +101,29 @@ class CreditTransactionSerializer(serializers.ModelSerializer):
     class Meta:
         model = CreditTransaction
         fields = "__all__"
+
+
+class TipSubscriptionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TipSubscription
+        fields = [
+            "id",
+            "tip_type",
+            "league",
+            "min_percentage",
+            "webhook_url",
+            "secret",
+            "is_active",
+            "created_at",
+        ]
+        read_only_fields = ["secret", "created_at"]
+
+    def validate_webhook_url(self, value):
+        if value:
+            from .notifications import check_webhook_url
+
+            try:
+                check_webhook_url(value)
+            except ValueError as e:
+                raise serializers.ValidationError(str(e))
+        return value
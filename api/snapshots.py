@@ -0,0 +1,601 @@
+import contextvars
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from datetime import datetime
+from django.conf import settings
+
+from .metrics import SNAPSHOT_STORE_BYTES
+from .records import HOT_PCT, MatchRecord
+
+logger = logging.getLogger(__name__)
+
+# Snapshot file: magic, little-endian u32 header length, JSON header, then
+# the raw column arrays, each starting on an 8-byte boundary
+FILE_MAGIC = b'TIPSNAP1'
+FILE_COLUMNS = (
+    'league', 'market', 'home', 'away', 'code', 'kickoff',
+    'kickoff_ts', 'pct', 'odds', 'total_money', 'dominant_money',
+    'by_pct', 'pct_desc', 'by_time', 'time_asc',
+)
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+class Dictionary:
+    """Encode repeated values (leagues, teams, kickoffs) as small ints"""
+    __slots__ = ('values', 'codes')
+
+    def __init__(self):
+        self.values = []
+        self.codes = {}
+
+    def encode(self, value):
+        code = self.codes.get(value)
+        if code is None:
+            code = self.codes[value] = len(self.values)
+            self.values.append(value)
+        return code
+
+
+class Snapshot:
+    """Immutable, array-backed copy of one scan's processed matches.
+
+    Rows are stored column-wise (``array`` for numbers, dictionary-encoded
+    codes for repeated strings and kickoffs) and indexed by percentage,
+    kickoff, league and market so filters never walk rows they cannot
+    return. Build one from the ``MatchRecord`` list a scan produced;
+    ``query`` returns ``MatchRecord`` too.
+    """
+    __slots__ = (
+        'key', 'threshold', 'built_at', 'size',
+        'league', 'market', 'home', 'away', 'code', 'pick', 'kickoff',
+        'kickoff_ts', 'pct', 'odds', 'total_money', 'dominant_money',
+        'leagues', 'markets', 'teams', 'codes', 'kickoffs',
+        'league_codes', 'market_codes', 'int_columns',
+        'by_pct', 'pct_desc', 'by_time', 'time_asc', 'by_league', 'by_market',
+        'source',
+    )
+
+    def __init__(self, matches, key=None, threshold=0, built_at=None):
+        self.key = key
+        self.threshold = threshold
+        self.built_at = time.time() if built_at is None else built_at
+        self.size = len(matches)
+        self.source = None
+
+        leagues, markets, teams = Dictionary(), Dictionary(), Dictionary()
+        codes, kickoffs = Dictionary(), Dictionary()
+        self.league = array('I')
+        self.market = array('I')
+        self.home = array('I')
+        self.away = array('I')
+        self.code = array('I')
+        self.kickoff = array('I')
+        self.kickoff_ts = array('d')
+        self.pct = array('d')
+        self.odds = array('d')
+        self.total_money = array('d')
+        self.dominant_money = array('d')
+        self.pick = []
+
+        # Remember which money columns were all ints so they round-trip exactly
+        ints = {'total_money': True, 'dominant_money': True}
+        for m in matches:
+            self.league.append(leagues.encode(m.league))
+            self.market.append(markets.encode(m.market))
+            self.home.append(teams.encode(m.home))
+            self.away.append(teams.encode(m.away))
+            self.code.append(codes.encode(m.code))
+            self.kickoff.append(kickoffs.encode(m.kickoff))
+            self.kickoff_ts.append(m.kickoff_ts)
+            self.pct.append(m.percentage)
+            self.odds.append(math.nan if m.odds is None else m.odds)
+            self.total_money.append(m.total_money)
+            self.dominant_money.append(m.dominant_money)
+            ints['total_money'] = ints['total_money'] and isinstance(m.total_money, int)
+            ints['dominant_money'] = ints['dominant_money'] and isinstance(m.dominant_money, int)
+            self.pick.append(m.pick)
+
+        self.leagues = leagues.values
+        self.markets = markets.values
+        self.teams = teams.values
+        self.codes = codes.values
+        self.kickoffs = kickoffs.values
+        self.league_codes = leagues.codes
+        self.market_codes = markets.codes
+        self.int_columns = frozenset(name for name, is_int in ints.items() if is_int)
+
+        rows = range(self.size)
+        # Percentage index, highest first: rows >= t are a prefix of by_pct
+        self.by_pct = array('I', sorted(rows, key=lambda i: -self.pct[i]))
+        self.pct_desc = array('d', (-self.pct[i] for i in self.by_pct))
+        # Kickoff index, earliest first (stable, so ties keep scan order)
+        self.by_time = array('I', sorted(rows, key=self.kickoff_ts.__getitem__))
+        self.time_asc = array('d', (self.kickoff_ts[i] for i in self.by_time))
+        # League/market postings, each in kickoff order
+        self.by_league = {}
+        self.by_market = {}
+        for i in self.by_time:
+            self.by_league.setdefault(self.league[i], array('I')).append(i)
+            self.by_market.setdefault(self.market[i], array('I')).append(i)
+
+    def row(self, i):
+        odds = self.odds[i]
+        total_money = self.total_money[i]
+        dominant_money = self.dominant_money[i]
+        if 'total_money' in self.int_columns:
+            total_money = int(total_money)
+        if 'dominant_money' in self.int_columns:
+            dominant_money = int(dominant_money)
+        return MatchRecord(
+            self.leagues[self.league[i]],
+            self.teams[self.home[i]],
+            self.teams[self.away[i]],
+            self.markets[self.market[i]],
+            self.codes[self.code[i]],
+            self.pick[i],
+            self.kickoffs[self.kickoff[i]],
+            self.kickoff_ts[i],
+            None if math.isnan(odds) else odds,
+            self.pct[i],
+            total_money,
+            dominant_money,
+        )
+
+    def query(self, threshold=None, league=None, market=None, hot_only=False,
+              time_order=False, limit=None):
+        """Return matching rows as MatchRecord.
+
+        Candidates come from the most selective index available; with
+        ``time_order`` they are walked in kickoff order so the scan stops
+        after ``limit`` hits. There is no live filter: which matches are
+        live is decided upstream and not recorded per row.
+        """
+        threshold = max(threshold or 0, HOT_PCT if hot_only else 0)
+        league_code = market_code = None
+        if league is not None:
+            league_code = self.league_codes.get(league)
+            if league_code is None:
+                return []
+        if market is not None:
+            market_code = self.market_codes.get(market)
+            if market_code is None:
+                return []
+        # Rows at or above the threshold are a prefix of the percentage index
+        pct_end = bisect_right(self.pct_desc, -threshold) if threshold else self.size
+
+        if league_code is not None:
+            candidates = self.by_league[league_code]
+        elif market_code is not None:
+            candidates = self.by_market[market_code]
+        elif time_order:
+            candidates = self.by_time
+        else:
+            candidates = self.by_pct[:pct_end]
+
+        if not time_order:
+            # Scan order; walking every row is cheaper than sorting a big prefix
+            if league_code is None and market_code is None and len(candidates) > self.size // 4:
+                candidates = range(self.size)
+            else:
+                candidates = sorted(candidates)
+
+        out = []
+        for i in candidates:
+            if self.pct[i] < threshold:
+                continue
+            if league_code is not None and self.league[i] != league_code:
+                continue
+            if market_code is not None and self.market[i] != market_code:
+                continue
+            out.append(self.row(i))
+            if limit and len(out) >= limit:
+                break
+        return out
+
+    def dump(self, fp):
+        """Write the snapshot in the compact file format ``load`` maps back"""
+        columns = [(name, getattr(self, name)) for name in FILE_COLUMNS]
+        postings = {}
+        for name in ('by_league', 'by_market'):
+            flat = array('I')
+            spans = {}
+            for code, rows in getattr(self, name).items():
+                spans[code] = (len(flat), len(flat) + len(rows))
+                flat.extend(rows)
+            postings[name] = list(spans.items())
+            columns.append((name, flat))
+
+        layout = {}
+        offset = 0
+        for name, column in columns:
+            layout[name] = (column.typecode, offset, len(column))
+            offset = _align(offset + len(column) * column.itemsize)
+
+        header = json.dumps({
+            'key': list(self.key) if isinstance(self.key, tuple) else self.key,
+            'threshold': self.threshold,
+            'built_at': self.built_at,
+            'size': self.size,
+            'byteorder': sys.byteorder,
+            'itemsize': {'I': array('I').itemsize, 'd': array('d').itemsize},
+            'columns': layout,
+            'postings': postings,
+            'int_columns': sorted(self.int_columns),
+            'leagues': self.leagues,
+            'markets': self.markets,
+            'teams': self.teams,
+            'codes': self.codes,
+            'kickoffs': [k.isoformat() for k in self.kickoffs],
+            'pick': list(self.pick),
+        }, separators=(',', ':')).encode()
+
+        start = len(FILE_MAGIC) + 4 + len(header)
+        fp.write(FILE_MAGIC)
+        fp.write(struct.pack('<I', len(header)))
+        fp.write(header)
+        fp.write(b'\0' * (_align(start) - start))
+        for name, column in columns:
+            data = column.tobytes()
+            fp.write(data)
+            fp.write(b'\0' * (_align(len(data)) - len(data)))
+
+    @classmethod
+    def load(cls, path):
+        """Map a snapshot file read-only.
+
+        Numeric columns and indexes are memoryviews over the mapping, so
+        every worker loading the same file shares its pages; only the
+        dictionaries and picks are materialised.
+        """
+        with open(path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mapped[:len(FILE_MAGIC)] != FILE_MAGIC:
+            raise ValueError(f"{path} is not a snapshot file")
+        (header_len,) = struct.unpack_from('<I', mapped, len(FILE_MAGIC))
+        start = len(FILE_MAGIC) + 4
+        header = json.loads(mapped[start:start + header_len])
+        if header['byteorder'] != sys.byteorder or header['itemsize'] != {
+            'I': array('I').itemsize, 'd': array('d').itemsize,
+        }:
+            raise ValueError(f"{path} was written on an incompatible platform")
+
+        view = memoryview(mapped)
+        data_start = _align(start + header_len)
+        columns = {}
+        for name, (typecode, offset, count) in header['columns'].items():
+            begin = data_start + offset
+            end = begin + count * header['itemsize'][typecode]
+            columns[name] = view[begin:end].cast(typecode)
+
+        self = cls.__new__(cls)
+        key = header['key']
+        self.key = (key[0], bool(key[1]), key[2]) if isinstance(key, list) else key
+        self.threshold = header['threshold']
+        self.built_at = header['built_at']
+        self.size = header['size']
+        self.source = mapped
+        for name in FILE_COLUMNS:
+            setattr(self, name, columns[name])
+        for name in ('by_league', 'by_market'):
+            flat = columns[name]
+            setattr(self, name, {code: flat[begin:end] for code, (begin, end) in header['postings'][name]})
+        self.int_columns = frozenset(header['int_columns'])
+        self.leagues = header['leagues']
+        self.markets = header['markets']
+        self.teams = header['teams']
+        self.codes = header['codes']
+        self.kickoffs = [datetime.fromisoformat(k) for k in header['kickoffs']]
+        self.pick = header['pick']
+        self.league_codes = {value: code for code, value in enumerate(self.leagues)}
+        self.market_codes = {value: code for code, value in enumerate(self.markets)}
+        return self
+
+    def memory_bytes(self):
+        """Approximate resident size of the columns, dictionaries and indexes.
+
+        Columns of a loaded snapshot are views over a shared mapping and
+        only count their view objects.
+        """
+        total = 0
+        for name in ('league', 'market', 'home', 'away', 'code', 'kickoff',
+                     'kickoff_ts', 'pct', 'odds', 'total_money', 'dominant_money',
+                     'by_pct', 'pct_desc', 'by_time', 'time_asc'):
+            total += sys.getsizeof(getattr(self, name))
+        for values in (self.pick, self.leagues, self.markets, self.teams, self.codes, self.kickoffs):
+            total += sys.getsizeof(values) + sum(sys.getsizeof(v) for v in values)
+        for postings in (self.by_league, self.by_market):
+            total += sys.getsizeof(postings) + sum(sys.getsizeof(v) for v in postings.values())
+        return total
+
+
+class SnapshotStore:
+    """Process-wide map of the latest Snapshots per (tip_type, exclude_major, date).
+
+    A key holds one snapshot per scan threshold, so scans at 69% and 75%
+    do not replace each other; ``get`` answers from the newest one whose
+    threshold covers the request, and a newer snapshot at a lower
+    threshold drops the older ones it covers. ``publish`` builds the new snapshot outside the lock and swaps it in,
+    so readers always see either the old or the new one, never a partial
+    build. Least recently published snapshots are evicted once the count
+    or the total memory budget is exceeded. A day with more than
+    ``max_rows`` rows is not published at all: a cut-down copy would answer
+    every later query for that day as if it were complete, so those days
+    keep going through the scan path.
+
+    With a ``directory``, every published snapshot is also written there
+    (atomically, one file per key and threshold) by a background writer
+    thread, so the fsync never runs on a request. ``get`` falls back to the
+    newest qualifying file when memory has nothing fresh enough, which is
+    how restarted workers warm up and how workers pick up each other's
+    scans. Files are looked up in an in-memory index that is only rebuilt
+    when the directory's mtime moves, so a miss costs one ``stat``.
+    """
+
+    def __init__(self, max_snapshots=32, max_bytes=64 * 1024 * 1024, max_rows=50000,
+                 directory=None, max_file_age=2 * 24 * 3600):
+        self.max_snapshots = max_snapshots
+        self.max_bytes = max_bytes
+        self.max_rows = max_rows
+        self.directory = directory
+        self.max_file_age = max_file_age
+        self.lock = threading.Lock()
+        self.snapshots = OrderedDict()
+        self.sizes = {}
+        self.listeners = []
+        self.refreshing = set()
+        # Snapshots waiting for the writer thread, latest per file
+        self.pending = OrderedDict()
+        self.writer = None
+        # file prefix -> {threshold: (mtime, path)}, as of directory mtime files_version
+        self.index_lock = threading.Lock()
+        self.files = {}
+        self.files_version = None
+
+    def add_listener(self, listener):
+        """Call ``listener(key, threshold, matches, built_at=...)`` after every publish"""
+        self.listeners.append(listener)
+
+    def install(self, key, snapshot):
+        size = snapshot.memory_bytes()
+        with self.lock:
+            for slot, other in list(self.snapshots.items()):
+                if slot[0] == key and (
+                    other.threshold == snapshot.threshold
+                    or (other.threshold > snapshot.threshold and other.built_at <= snapshot.built_at)
+                ):
+                    del self.snapshots[slot]
+                    del self.sizes[slot]
+            slot = (key, snapshot.threshold)
+            self.snapshots[slot] = snapshot
+            self.sizes[slot] = size
+            while self.snapshots and (
+                len(self.snapshots) > self.max_snapshots
+                or sum(self.sizes.values()) > self.max_bytes
+            ):
+                evicted, _ = self.snapshots.popitem(last=False)
+                del self.sizes[evicted]
+            SNAPSHOT_STORE_BYTES.set(sum(self.sizes.values()))
+
+    def publish(self, key, matches, threshold, built_at=None):
+        """Build and install a snapshot of a complete day scanned at ``built_at``.
+
+        Returns None if the day is too big. Matches no newer than the
+        snapshot already held for this key and threshold (e.g. the same
+        cached scan served again) are not rebuilt; that snapshot is
+        returned instead.
+        """
+        if built_at is not None:
+            with self.lock:
+                current = self.snapshots.get((key, threshold))
+            if current is not None and current.built_at >= built_at:
+                return current
+        if self.max_rows is not None and len(matches) > self.max_rows:
+            logger.warning(
+                "snapshot not published rows=%d max_rows=%d", len(matches), self.max_rows,
+                extra={"key": str(key), "rows": len(matches), "max_rows": self.max_rows},
+            )
+            return None
+        snapshot = Snapshot(matches, key=key, threshold=threshold, built_at=built_at)
+        self.install(key, snapshot)
+        if self.directory:
+            self.schedule_persist(snapshot)
+        for listener in self.listeners:
+            try:
+                listener(key, threshold, matches, built_at=snapshot.built_at)
+            except Exception:
+                logger.exception("snapshot listener failed", extra={"key": str(key)})
+        return snapshot
+
+    @staticmethod
+    def file_prefix(key):
+        tip_type, exclude_major, f_date = key
+        return f"{tip_type}-{int(bool(exclude_major))}-{f_date}-"
+
+    def schedule_persist(self, snapshot):
+        """Hand snapshot to the writer thread; a newer one for the same file replaces it"""
+        with self.lock:
+            file_key = (snapshot.key, snapshot.threshold)
+            self.pending.pop(file_key, None)
+            self.pending[file_key] = snapshot
+            if self.writer is None:
+                self.writer = threading.Thread(
+                    target=contextvars.copy_context().run, args=(self.write_pending,),
+                    name="snapshot-persist", daemon=True,
+                )
+                self.writer.start()
+
+    def write_pending(self):
+        """Writer thread: persist queued snapshots, exit once the queue is empty"""
+        while True:
+            with self.lock:
+                if not self.pending:
+                    self.writer = None
+                    return
+                _, snapshot = self.pending.popitem(last=False)
+            try:
+                self.persist(snapshot)
+            except Exception:
+                logger.exception("snapshot persist failed", extra={"key": str(snapshot.key)})
+
+    def flush(self, timeout=None):
+        """Wait for queued snapshot files to be written"""
+        writer = self.writer
+        if writer is not None:
+            writer.join(timeout)
+
+    def persist(self, snapshot):
+        """Write snapshot to its file via a temp file and rename"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{self.file_prefix(snapshot.key)}{snapshot.threshold}.snap")
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                snapshot.dump(f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        self.prune()
+
+    def prune(self):
+        cutoff = time.time() - self.max_file_age
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.stat().st_mtime < cutoff:
+                    os.unlink(entry.path)
+            except OSError:
+                pass
+
+    def scan_files(self):
+        """Index the snapshot files in the directory by key prefix"""
+        files = {}
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.snap'):
+                continue
+            prefix, _, file_threshold = entry.name[:-len('.snap')].rpartition('-')
+            try:
+                files.setdefault(prefix + '-', {})[float(file_threshold)] = (
+                    entry.stat().st_mtime, entry.path,
+                )
+            except (ValueError, OSError):
+                continue
+        return files
+
+    def indexed_files(self, key):
+        """{threshold: (mtime, path)} of the files for key.
+
+        Writing, replacing or pruning a file (by any worker) moves the
+        directory's mtime; the directory is rescanned only when it did.
+        """
+        try:
+            # Read before scanning: a change during the scan triggers another
+            version = os.stat(self.directory).st_mtime_ns
+        except FileNotFoundError:
+            return {}
+        with self.index_lock:
+            if version != self.files_version:
+                self.files = self.scan_files()
+                # mtime ticks are coarse, so a change later in the same tick
+                # would not move it; keep rescanning until it is a second old
+                recent = time.time_ns() - version < 1_000_000_000
+                self.files_version = None if recent else version
+            return dict(self.files.get(self.file_prefix(key), {}))
+
+    def load(self, key, max_age=None, threshold=None, newer_than=0):
+        """Newest snapshot file for key that is fresh enough and covers threshold"""
+        best = None
+        for file_threshold, (mtime, path) in self.indexed_files(key).items():
+            if threshold is not None and threshold < file_threshold:
+                continue
+            if max_age is not None and time.time() - mtime > max_age:
+                continue
+            if mtime <= newer_than:
+                continue
+            if best is None or mtime > best[0]:
+                best = (mtime, path)
+        if best is None:
+            return None
+        try:
+            snapshot = Snapshot.load(best[1])
+        except (OSError, ValueError):
+            logger.exception("snapshot load failed", extra={"path": best[1]})
+            return None
+        # mtime is only a prefilter; the header has the real build time
+        if snapshot.built_at <= newer_than or (
+            max_age is not None and time.time() - snapshot.built_at > max_age
+        ):
+            return None
+        self.install(key, snapshot)
+        logger.info(
+            "snapshot loaded from disk rows=%d", snapshot.size,
+            extra={"key": str(key), "rows": snapshot.size, "path": best[1]},
+        )
+        return snapshot
+
+    def get(self, key, max_age=None, threshold=None):
+        """Latest snapshot for key if it is fresh enough and covers threshold"""
+        newest = None
+        with self.lock:
+            for (slot_key, _), candidate in self.snapshots.items():
+                if slot_key != key or (threshold is not None and threshold < candidate.threshold):
+                    continue
+                if newest is None or candidate.built_at > newest.built_at:
+                    newest = candidate
+        if newest is not None and (max_age is None or time.time() - newest.built_at <= max_age):
+            return newest
+        if self.directory:
+            return self.load(
+                key, max_age=max_age, threshold=threshold,
+                newer_than=newest.built_at if newest is not None else 0,
+            )
+        return None
+
+    def begin_refresh(self, key):
+        """Claim the background refresh of key; False if one is running"""
+        with self.lock:
+            if key in self.refreshing:
+                return False
+            self.refreshing.add(key)
+            return True
+
+    def end_refresh(self, key):
+        with self.lock:
+            self.refreshing.discard(key)
+
+    def memory_bytes(self):
+        with self.lock:
+            return sum(self.sizes.values())
+
+    def stats(self):
+        with self.lock:
+            return {
+                'snapshots': len(self.snapshots),
+                'rows': sum(s.size for s in self.snapshots.values()),
+                'memory_bytes': sum(self.sizes.values()),
+                'max_bytes': self.max_bytes,
+                'refreshing': len(self.refreshing),
+            }
+
+
+snapshot_store = SnapshotStore(
+    max_snapshots=getattr(settings, 'SNAPSHOT_STORE_MAX_SNAPSHOTS', 32),
+    max_bytes=getattr(settings, 'SNAPSHOT_STORE_MAX_BYTES', 64 * 1024 * 1024),
+    max_rows=getattr(settings, 'SNAPSHOT_STORE_MAX_ROWS', 50000),
+    directory=getattr(settings, 'SNAPSHOT_DIR', None),
+)
@@ -0,0 +1,125 @@
+import logging
+
+import requests
+from celery import shared_task
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+from .metrics import WEBHOOK_DELIVERIES
+
+logger = logging.getLogger(__name__)
+
+
+class RetryableDelivery(Exception):
+    """Webhook answered with a status worth retrying (429/5xx)"""
+
+
+def post_webhook(subscription_id, url, secret, body):
+    """POST one batch of tips to a subscriber's webhook.
+
+    Raises ``requests.RequestException`` or ``RetryableDelivery`` when the
+    attempt is worth retrying; otherwise returns the response status, or
+    None when the URL is refused by ``check_webhook_url``.
+    """
+    from .notifications import check_webhook_url, sign
+
+    # Checked on every attempt: the host may have been re-pointed since
+    # the subscription was saved
+    try:
+        check_webhook_url(url)
+    except ValueError as e:
+        WEBHOOK_DELIVERIES.labels(result='blocked').inc()
+        logger.warning(
+            "webhook blocked subscription=%s: %s", subscription_id, e,
+            extra={"subscription": subscription_id},
+        )
+        return None
+
+    response = requests.post(
+        url,
+        data=body.encode(),
+        headers={
+            'Content-Type': 'application/json',
+            'X-Tip-Subscription': str(subscription_id),
+            'X-Tip-Signature': sign(secret, body),
+        },
+        timeout=10,
+        # A redirect could lead anywhere, including internal addresses
+        allow_redirects=False,
+    )
+
+    if response.status_code == 429 or response.status_code >= 500:
+        raise RetryableDelivery(f"webhook returned {response.status_code}")
+    if response.status_code >= 300:
+        # The subscriber rejected the payload; retrying will not help
+        WEBHOOK_DELIVERIES.labels(result='rejected').inc()
+        logger.warning(
+            "webhook rejected subscription=%s status=%d", subscription_id, response.status_code,
+            extra={"subscription": subscription_id, "status": response.status_code},
+        )
+        return response.status_code
+    WEBHOOK_DELIVERIES.labels(result='delivered').inc()
+    return response.status_code
+
+
+@shared_task(
+    bind=True,
+    autoretry_for=(requests.RequestException, RetryableDelivery),
+    retry_backoff=5,
+    retry_backoff_max=600,
+    retry_jitter=True,
+    max_retries=8,
+    acks_late=True,
+)
+def deliver_webhook(self, subscription_id, url, secret, body):
+    """POST a batch of tips to a subscriber's webhook, retrying with backoff"""
+    try:
+        return post_webhook(subscription_id, url, secret, body)
+    except (requests.RequestException, RetryableDelivery):
+        retry_result = 'retry' if self.request.retries < self.max_retries else 'failed'
+        WEBHOOK_DELIVERIES.labels(result=retry_result).inc()
+        raise
+
+
+@shared_task(acks_late=True)
+def fan_out_tips(tip_type, events):
+    """Match freshly ingested tips to subscriptions and queue their deliveries"""
+    from .notifications import notifier
+
+    notifier.fan_out(tip_type, events)
+
+
+@shared_task
+def ingest_tips():
+    """Scan today's tips for every tip type into the snapshot store.
+
+    Scheduled by celery beat (``INGEST_INTERVAL_SECONDS``) so feeds advance
+    and subscribers are notified without anyone polling /api/matches/.
+    Each day is scanned in full at the lowest threshold and with major
+    leagues included, which covers every tip a subscription can match. A
+    snapshot still fresh in this worker's store is not rescanned, and runs
+    do not overlap.
+    """
+    from .scanners import TipScanner, UnderdogTipScanner
+    from .snapshots import snapshot_store
+
+    lock = 'ingest_tips:lock'
+    if not cache.add(lock, 1, settings.INGEST_INTERVAL_SECONDS * 5):
+        logger.info("tip ingestion already running")
+        return 0
+    try:
+        f_date = timezone.now().date().strftime('%Y-%m-%d')
+        scanned = 0
+        for scanner in (TipScanner(), UnderdogTipScanner()):
+            try:
+                scanner.scan_date(
+                    f_date, threshold_pct=settings.INGEST_MIN_PERCENT,
+                    cache=cache, store=snapshot_store, allow_stale=False,
+                )
+                scanned += 1
+            except Exception:
+                logger.exception("tip ingestion failed", extra={"tip_type": scanner.tip_type, "date": f_date})
+        return scanned
+    finally:
+        cache.delete(lock)
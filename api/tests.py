@@ -1,3 +1,1455 @@
-from django.test import TestCase
+import io
+import json
+import math
+import os
+import threading
+import time
+from datetime import timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .feed import ADDED, CHANGED, DeltaFeed
+from .pagestream import PageStream
+from .models import (
+    APIRequestLog, CreditTransaction, MatchTip, Proxy, TipSubscription, User,
+)
+from .queries import N_PLUS_ONE_THRESHOLD, query_budget
+from .records import MatchRecord
+from .snapshots import Snapshot, snapshot_store
+
+# Rows created per model; comfortably above the N+1 threshold so a per-row
+# query shows up both as an N+1 shape and as a blown budget
+ROWS = N_PLUS_ONE_THRESHOLD * 3
+
+# Maximum SQL queries per request, including authentication; detail
+# endpoints are fetched for one of the user's own rows
+API_BUDGETS = {
+    ('get', 'tips-list'): 2,
+    ('get', 'tips-detail'): 1,
+    ('get', 'tips-today'): 1,
+    ('get', 'tips-upcoming'): 1,
+    ('get', 'logs-list'): 2,
+    ('get', 'logs-detail'): 1,
+    ('get', 'credit-transactions-list'): 2,
+    ('get', 'credit-transactions-detail'): 1,
+    ('get', 'subscriptions-list'): 2,
+    ('get', 'subscriptions-detail'): 1,
+    ('get', 'profile'): 0,
+    ('get', 'health'): 0,
+    ('get', 'api-docs'): 0,
+}
+
+# Charged scans against a stubbed upstream (debit, request log, credit
+# transaction), and the staff export (one streamed query)
+SCAN_BUDGETS = {
+    ('get', 'matches'): 3,
+    ('post', 'matches-batch'): 3,
+    ('get', 'tips-export'): 1,
+}
+
+# Session, user, count, filtered count, page of rows (+ list_filter choices).
+# Large-table admins skip the unfiltered count.
+ADMIN_BUDGETS = {
+    'user': 5,
+    'matchtip': 4,
+    'apirequestlog': 4,
+    'proxy': 6,
+    'credittransaction': 4,
+    'tipsubscription': 5,
+}
+
+
+class QueryBudgetTests(TestCase):
+    """Fail when a change pushes an endpoint over its declared query budget"""
+
+    @classmethod
+    def setUpTestData(cls):
+        now = timezone.now()
+        cls.users = [
+            User.objects.create_user(username=f'user{i}', password='secret', referral_code=f'ref{i}')
+            for i in range(ROWS)
+        ]
+        cls.user = cls.users[0]
+        MatchTip.objects.bulk_create([
+            MatchTip(
+                match_id=str(i), league=f'League {i % 3}', home_team=f'Home {i}',
+                away_team=f'Away {i}', match_time=now + timedelta(hours=i - ROWS // 2),
+                pick='1', odds=Decimal('1.80'), percentage=Decimal('86.50'), market='1X2',
+                total_money=Decimal('1000'), dominant_money=Decimal('865'), confidence_level='high',
+            )
+            for i in range(ROWS)
+        ])
+        APIRequestLog.objects.bulk_create([
+            APIRequestLog(user=user, endpoint='/api/matches/', parameters={}, credits_used=200, response_count=3)
+            for user in cls.users for _ in range(2)
+        ])
+        CreditTransaction.objects.bulk_create([
+            CreditTransaction(user=user, transaction_type='api_call', amount=-200, description='API call')
+            for user in cls.users for _ in range(2)
+        ])
+        TipSubscription.objects.bulk_create([
+            TipSubscription(user=user, league=f'League {i % 3}') for i, user in enumerate(cls.users)
+        ] + [TipSubscription(user=cls.user) for _ in range(ROWS)])
+        Proxy.objects.bulk_create([
+            Proxy(host=f'10.0.0.{i}', port=8080, last_used=now - timedelta(minutes=5), success_rate=i)
+            for i in range(ROWS)
+        ])
+        cls.admin = User.objects.create_superuser('admin', 'admin@example.com', 'secret')
+
+    def api_client(self):
+        client = APIClient()
+        client.force_authenticate(self.user)
+        return client
+
+    def detail_kwargs(self, name):
+        model = {
+            'tips-detail': MatchTip, 'logs-detail': APIRequestLog,
+            'credit-transactions-detail': CreditTransaction, 'subscriptions-detail': TipSubscription,
+        }.get(name)
+        if model is None:
+            return None
+        rows = model.objects.all() if model is MatchTip else model.objects.filter(user=self.user)
+        return {'pk': rows.values_list('pk', flat=True).first()}
+
+    def test_api_endpoints(self):
+        client = self.api_client()
+        for (method, name), budget in API_BUDGETS.items():
+            with self.subTest(endpoint=name):
+                url = reverse(name, kwargs=self.detail_kwargs(name))
+                with query_budget(budget):
+                    response = getattr(client, method)(url)
+                self.assertLess(response.status_code, 400)
+
+    def test_admin_changelists(self):
+        self.client.force_login(self.admin)
+        for model, budget in ADMIN_BUDGETS.items():
+            with self.subTest(changelist=model):
+                with query_budget(budget):
+                    response = self.client.get(reverse(f'admin:api_{model}_changelist'))
+                self.assertEqual(response.status_code, 200)
+
+    def test_login(self):
+        client = APIClient()
+        # authenticate, token lookup, then insert (inside a savepoint) on first login
+        with query_budget(5):
+            response = client.post(reverse('login'), {'username': 'user1', 'password': 'secret'})
+        self.assertEqual(response.status_code, 200)
+        with query_budget(2):
+            client.post(reverse('login'), {'username': 'user1', 'password': 'secret'})
+
+    def test_register(self):
+        client = APIClient()
+        # username check, inviter lookup, user insert, token insert
+        with query_budget(4):
+            response = client.post(reverse('register'), {
+                'username': 'new', 'email': 'new@example.com', 'password': 'secret',
+                'referral_code': 'ref1',
+            })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(User.objects.get(username='new').invited_by, self.users[1])
+
+    def test_best_proxy(self):
+        from utils.proxy_manager import ProxyManager
+
+        manager = ProxyManager()
+        with query_budget(2):
+            proxy = manager.get_best_proxy()
+        self.assertEqual(proxy, f'http://10.0.0.{ROWS - 1}:8080')
+
+    def test_detects_n_plus_one(self):
+        with self.assertRaises(AssertionError):
+            with query_budget(100):
+                for log in APIRequestLog.objects.all()[:ROWS]:
+                    log.user.username
+
+    def test_debug_header(self):
+        with self.settings(QUERY_DEBUG_HEADER=True):
+            response = self.api_client().get(reverse('tips-list'))
+        self.assertRegex(response['X-DB-Queries'], r'^count=\d+; time_ms=[\d.]+; n_plus_one=0$')
+
+
+class LogPipelineTests(SimpleTestCase):
+    """JSON lines from the queue handler, written by its listener thread"""
+
+    def setUp(self):
+        import logging
+
+        from .log import ContextFilter, QueueListenerHandler
+
+        self.stream = io.StringIO()
+        self.handler = QueueListenerHandler(stream=self.stream)
+        self.handler.addFilter(ContextFilter())
+        self.addCleanup(self.handler.close)
+        self.logger = logging.getLogger('api.tests.log')
+        self.logger.addHandler(self.handler)
+        self.logger.propagate = False
+        self.logger.setLevel(logging.INFO)
+        self.addCleanup(self.logger.removeHandler, self.handler)
+
+    def lines(self):
+        # Stopping the listener writes out everything queued
+        self.handler.close()
+        return [json.loads(line) for line in self.stream.getvalue().splitlines()]
+
+    def test_json_shape(self):
+        self.logger.info("scanned %d pages", 3, extra={'date': '2024-01-01'})
+        try:
+            raise ValueError('boom')
+        except ValueError:
+            self.logger.exception("scan failed")
+        scanned, failed = self.lines()
+        self.assertEqual(
+            set(scanned), {'ts', 'level', 'logger', 'msg', 'request_id', 'scan_id', 'date'},
+        )
+        self.assertEqual(
+            (scanned['level'], scanned['logger'], scanned['msg'], scanned['date']),
+            ('INFO', 'api.tests.log', 'scanned 3 pages', '2024-01-01'),
+        )
+        self.assertEqual((scanned['request_id'], scanned['scan_id']), ('-', '-'))
+        self.assertEqual(failed['msg'], 'scan failed')
+        self.assertIn('ValueError: boom', failed['exc'])
+
+    def test_context_fields(self):
+        import contextvars
+
+        from .log import request_id_var, scan_context
+
+        token = request_id_var.set('req-1')
+        self.addCleanup(request_id_var.reset, token)
+        with scan_context('scan-1'):
+            self.logger.info("on the caller")
+            # The IDs are read on the emitting thread, not the listener's
+            worker = threading.Thread(
+                target=contextvars.copy_context().run, args=(self.logger.info, "on a scan worker"),
+            )
+            worker.start()
+            worker.join()
+        self.logger.info("after the scan")
+        self.assertEqual(
+            [(line['msg'], line['request_id'], line['scan_id']) for line in self.lines()],
+            [('on the caller', 'req-1', 'scan-1'), ('on a scan worker', 'req-1', 'scan-1'),
+             ('after the scan', 'req-1', '-')],
+        )
+
+    def test_shutdown(self):
+        listener = self.handler.listener
+        for i in range(100):
+            self.logger.info("line %d", i)
+        self.assertEqual(len(self.lines()), 100)
+        self.assertIsNone(listener._thread)
+        # logging.shutdown closes it again at exit
+        self.handler.close()
+
+    def test_full_queue_drops(self):
+        from .log import QueueListenerHandler
+
+        handler = QueueListenerHandler(maxsize=1, stream=self.stream)
+        # Nothing drains the queue once the listener is stopped
+        handler.close()
+        self.logger.removeHandler(self.handler)
+        self.logger.addHandler(handler)
+        self.addCleanup(self.logger.removeHandler, handler)
+        for i in range(3):
+            self.logger.warning("line %d", i)
+        self.assertEqual((handler.queue.qsize(), handler.dropped), (1, 2))
+
+    def test_silenced_in_tests(self):
+        import logging
+
+        from django.conf import settings
+
+        self.assertTrue(settings.TESTING)
+        self.assertEqual([type(h) for h in logging.getLogger().handlers], [logging.NullHandler])
+
+
+class ReadCacheTests(TestCase):
+    """Versioned response cache on /api/tips/"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader', password='secret', referral_code='reader')
+        cls.tip = MatchTip.objects.create(
+            match_id='1', league='League', home_team='Home', away_team='Away',
+            match_time=timezone.now() + timedelta(hours=1), pick='1', odds=Decimal('1.80'),
+            percentage=Decimal('86.50'), market='1X2', total_money=Decimal('1000'),
+            dominant_money=Decimal('865'), confidence_level='high',
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_hit_skips_database(self):
+        first = self.client.get(reverse('tips-list'), {'league': 'League', 'page': 1})
+        with query_budget(0):
+            second = self.client.get(reverse('tips-list'), {'page': 1, 'league': 'League', 'end_date': ''})
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_not_modified(self):
+        first = self.client.get(reverse('tips-upcoming'))
+        response = self.client.get(reverse('tips-upcoming'), HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        response = self.client.get(reverse('tips-upcoming'), HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+
+    def test_bucket_rollover(self):
+        from unittest import mock
+
+        first = self.client.get(reverse('tips-upcoming'))
+        # A minute later the list may differ although nothing was written
+        with mock.patch('time.time', return_value=time.time() + 120):
+            response = self.client.get(reverse('tips-upcoming'), HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+            self.assertEqual(response.status_code, 200)
+            self.assertNotEqual(response['ETag'], first['ETag'])
+            response = self.client.get(reverse('tips-upcoming'), HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+            self.assertEqual(response.status_code, 304)
+
+    def test_write_invalidates(self):
+        first = self.client.get(reverse('tips-list'))
+        self.tip.pick = '2'
+        self.tip.save()
+        second = self.client.get(reverse('tips-list'), HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertNotEqual(first['ETag'], second['ETag'])
+        self.assertEqual(second.json()['results'][0]['pick'], '2')
+
+    def test_bulk_update_invalidates(self):
+        first = self.client.get(reverse('tips-list'))
+        MatchTip.objects.filter(pk=self.tip.pk).update(pick='X')
+        second = self.client.get(reverse('tips-list'), HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second.json()['results'][0]['pick'], 'X')
+
+    def test_links_follow_host(self):
+        for i in range(25):
+            MatchTip.objects.create(
+                match_id=str(i + 2), league='League', home_team=f'Home {i}', away_team='Away',
+                match_time=self.tip.match_time, pick='1', odds=Decimal('1.80'),
+                percentage=Decimal('86.50'), market='1X2', total_money=Decimal('1000'),
+                dominant_money=Decimal('865'), confidence_level='high',
+            )
+        internal = self.client.get(reverse('tips-list'), HTTP_HOST='10.0.0.5:8000')
+        public = self.client.get(reverse('tips-list'), HTTP_HOST='api.example.com', secure=True)
+        self.assertTrue(internal.json()['next'].startswith('http://10.0.0.5:8000/'))
+        self.assertTrue(public.json()['next'].startswith('https://api.example.com/'))
+
+
+def match_record(home, percentage, total_money=1000, league='League'):
+    kickoff = timezone.now().replace(microsecond=0) + timedelta(hours=2)
+    return MatchRecord(
+        league, home, 'Away', '1X2', '1', home, kickoff, kickoff.timestamp(),
+        1.8, percentage, total_money, round(total_money * percentage / 100),
+    )
+
+
+class SnapshotTests(SimpleTestCase):
+    """Index-backed Snapshot.query agrees with a plain filter over the rows"""
+
+    def setUp(self):
+        import random
+
+        rng = random.Random(7)
+        base = timezone.now().replace(microsecond=0)
+        self.rows = []
+        for i in range(300):
+            kickoff = base + timedelta(minutes=rng.randint(-600, 600))
+            self.rows.append(MatchRecord(
+                f'League {i % 7}', f'Home {i}', f'Away {i}', rng.choice(['1X2', 'Over/Under 2.5']),
+                '1', f'Home {i}', kickoff, kickoff.timestamp(), rng.choice([None, 1.5, 2.25]),
+                float(rng.randint(6900, 10000)) / 100, rng.randint(50, 5000), rng.randint(10, 50),
+            ))
+        self.snapshot = Snapshot(self.rows, key=('normal', False, '2024-01-01'), threshold=69)
+
+    def expected(self, threshold=0, league=None, market=None):
+        return [
+            m for m in self.rows
+            if m.percentage >= threshold
+            and (league is None or m.league == league)
+            and (market is None or m.market == market)
+        ]
+
+    def test_filters(self):
+        cases = [
+            {}, {'threshold': 75}, {'threshold': 99.5}, {'league': 'League 3'},
+            {'market': '1X2', 'threshold': 80}, {'league': 'League 1', 'threshold': 90},
+            {'league': 'Nowhere'},
+        ]
+        for case in cases:
+            with self.subTest(**case):
+                self.assertEqual(self.snapshot.query(**case), self.expected(**case))
+
+    def test_hot_only(self):
+        self.assertEqual(self.snapshot.query(hot_only=True, threshold=75), self.expected(threshold=85))
+
+    def test_time_order_limit(self):
+        for case in ({'threshold': 75}, {}, {'league': 'League 2'}):
+            with self.subTest(**case):
+                expected = sorted(self.expected(**case), key=lambda m: m.kickoff_ts)[:10]
+                got = self.snapshot.query(time_order=True, limit=10, **case)
+                self.assertEqual([m.kickoff_ts for m in got], [m.kickoff_ts for m in expected])
+                self.assertTrue(all(m in self.rows for m in got))
+
+    def test_oversized_day_not_published(self):
+        from .snapshots import SnapshotStore
+
+        store = SnapshotStore(max_rows=100)
+        key = ('normal', False, '2024-01-01')
+        self.assertIsNone(store.publish(key, self.rows, 69))
+        self.assertIsNone(store.get(key))
+        self.assertEqual(store.publish(key, self.rows[:100], 69).size, 100)
+
+    def test_thresholds_kept_apart(self):
+        from .snapshots import SnapshotStore
+
+        store = SnapshotStore()
+        key = ('normal', False, '2024-01-01')
+        low = store.publish(key, self.expected(threshold=69), 69, built_at=100)
+        high = store.publish(key, self.expected(threshold=75), 75, built_at=200)
+        self.assertIs(store.get(key, threshold=69), low)
+        self.assertIs(store.get(key, threshold=80), high)
+        # A newer scan at 69% covers the 75% one, which is dropped
+        newer = store.publish(key, self.expected(threshold=69), 69, built_at=300)
+        self.assertIs(store.get(key, threshold=80), newer)
+        self.assertEqual(store.stats()['snapshots'], 1)
+
+    def test_same_scan_not_rebuilt(self):
+        from .snapshots import SnapshotStore
+
+        store = SnapshotStore()
+        key = ('normal', False, '2024-01-01')
+        calls = []
+        store.add_listener(lambda *args, **kwargs: calls.append(kwargs['built_at']))
+        first = store.publish(key, self.rows, 69, built_at=100)
+        self.assertIs(store.publish(key, self.rows, 69, built_at=100), first)
+        self.assertIsNot(store.publish(key, self.rows, 69, built_at=101), first)
+        self.assertEqual(calls, [100, 101])
+
+
+def upstream_row(i, percentage, kickoff, live=False, league='League'):
+    total = 1000
+    dominant = round(total * percentage / 100)
+    return {
+        'htn': f'Home {i}', 'atn': f'Away {i}', 'ln': league, 'n': '1X2',
+        'ce': kickoff.strftime('%Y-%m-%dT%H:%M:%SZ'), 'v': total,
+        'i': [['1', dominant, 0, 1.5], ['2', total - dominant, 0, 2.5]],
+        # Only the stub reads this: upstream's own notion of live
+        'live': live,
+    }
+
+
+def stub_scanner(rows, page_size=10, tip_type='normal'):
+    """TipScanner whose upstream is ``rows``, filtered and paged like betwatch"""
+    from .scanners import TipScanner
+
+    class StubScanner(TipScanner):
+        def fire_request(self, step, f_date, min_percent=69, max_percent=100, min_vol=50,
+                         max_vol=103, exclude_major_leagues=False, live_only=False,
+                         order_by_time=False):
+            self.requests.append({'step': step, 'date': f_date, 'min_percent': min_percent,
+                                  'live_only': live_only, 'order_by_time': order_by_time})
+            # A dict maps each date to its own rows
+            day = rows.get(f_date, []) if isinstance(rows, dict) else rows
+            picked = [
+                r for r in day
+                if max(i[1] for i in r['i']) * 100 / r['v'] >= min_percent
+                and (not live_only or r['live'])
+            ]
+            if order_by_time:
+                picked.sort(key=lambda r: r['ce'])
+            begin = (step - 1) * page_size
+            return {'data': picked[begin:begin + page_size], 'remaining': begin + page_size < len(picked)}
+
+    StubScanner.tip_type = tip_type
+    scanner = StubScanner()
+    scanner.requests = []
+    return scanner
+
+
+class ScanPathTests(SimpleTestCase):
+    """scan_date against a stubbed upstream, with and without the snapshot store"""
+
+    def setUp(self):
+        from unittest import mock
+
+        patcher = mock.patch('api.scanners.time.sleep')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.date = timezone.now().strftime('%Y-%m-%d')
+        now = timezone.now().replace(microsecond=0)
+        self.rows = []
+        for i in range(45):
+            kickoff = now + timedelta(minutes=(i * 37) % 600 - 300)
+            # Upstream says a match is live from kickoff until 100 minutes later
+            live = now - timedelta(minutes=100) < kickoff <= now
+            self.rows.append(upstream_row(i, 69 + (i * 7) % 31, kickoff, live=live))
+
+    def scan(self, scanner, store=None, **query):
+        return scanner.fetch_matches_once(dates=[self.date], store=store, **query)
+
+    def test_store_matches_scan(self):
+        from .snapshots import SnapshotStore
+
+        store = SnapshotStore()
+        self.scan(stub_scanner(self.rows), store=store, threshold_pct=69)
+        cases = [
+            {'threshold_pct': 69}, {'threshold_pct': 80}, {'threshold_pct': 75, 'limit': 5},
+            {'threshold_pct': 69, 'time_order': True, 'limit': 7}, {'threshold_pct': 90, 'time_order': True},
+        ]
+        for query in cases:
+            with self.subTest(**query):
+                stored = stub_scanner(self.rows)
+                got = self.scan(stored, store=store, **query)
+                self.assertEqual(stored.requests, [])
+                self.assertEqual(got, self.scan(stub_scanner(self.rows), **query))
+
+    def test_live_only_goes_upstream(self):
+        from .snapshots import SnapshotStore
+
+        store = SnapshotStore()
+        self.scan(stub_scanner(self.rows), store=store, threshold_pct=69)
+        scanner = stub_scanner(self.rows)
+        got = self.scan(scanner, store=store, threshold_pct=69, live_only=True)
+        self.assertTrue(scanner.requests)
+        self.assertTrue(all(request['live_only'] for request in scanner.requests))
+        # Finished matches kicked off in the past too, but upstream leaves them out
+        expected = {r['htn'] for r in self.rows if r['live']}
+        self.assertEqual({m.home for m in got}, expected)
+        self.assertLess(len(expected), sum(1 for m in store.get(scanner.store_key(self.date, False)).query()
+                                          if m.kickoff_ts <= time.time()))
+
+
+    def test_time_order_bounded(self):
+        scanner = stub_scanner(self.rows)
+        got = self.scan(scanner, threshold_pct=69, time_order=True, limit=5)
+        expected = sorted(self.scan(stub_scanner(self.rows), threshold_pct=69), key=lambda m: m.kickoff_ts)[:5]
+        self.assertEqual(got, expected)
+        # Upstream orders by kickoff: page 2 cannot hold anything earlier
+        self.assertEqual([r['step'] for r in scanner.requests], [1])
+        self.assertTrue(all(r['order_by_time'] for r in scanner.requests))
+
+        scanner = stub_scanner(self.rows, page_size=3)
+        got = self.scan(scanner, threshold_pct=80, time_order=True, limit=4)
+        expected = sorted(self.scan(stub_scanner(self.rows), threshold_pct=80), key=lambda m: m.kickoff_ts)[:4]
+        self.assertEqual(got, expected)
+        # Four kept: the heap fills on page 2, which ends after all of them
+        self.assertEqual(len(scanner.requests), 2)
+
+    def test_limit_stops_paging(self):
+        scanner = stub_scanner(self.rows)
+        got = self.scan(scanner, threshold_pct=69, limit=7)
+        self.assertEqual(got, self.scan(stub_scanner(self.rows), threshold_pct=69)[:7])
+        self.assertEqual(len(scanner.requests), 1)
+
+        scanner = stub_scanner(self.rows)
+        self.assertEqual(len(self.scan(scanner, threshold_pct=69)), len(self.rows))
+        self.assertEqual(len(scanner.requests), math.ceil(len(self.rows) / 10))
+
+    def test_live_only_rechecked(self):
+        # Upstream flags a match live a little before kickoff; it is dropped locally
+        soon = upstream_row(99, 95, timezone.now() + timedelta(minutes=5), live=True)
+        live = [r for r in self.rows if r['live']]
+        scanner = stub_scanner(self.rows + [soon], page_size=2)
+        got = self.scan(scanner, threshold_pct=69, live_only=True)
+        self.assertEqual({m.home for m in got}, {r['htn'] for r in live})
+        # Paging stops once `limit` live matches are in
+        scanner = stub_scanner([soon] + self.rows, page_size=2)
+        got = self.scan(scanner, threshold_pct=69, live_only=True, limit=2)
+        self.assertEqual(len(got), 2)
+        self.assertEqual(len(scanner.requests), 2)
+
+
+    def test_dates_merged(self):
+        now = timezone.now().replace(microsecond=0)
+        first, second = str(now.date()), str(now.date() + timedelta(days=1))
+        shared = upstream_row(1, 80, now + timedelta(hours=30))
+        rows = {
+            first: [upstream_row(0, 75, now + timedelta(hours=5)), shared],
+            second: [shared, upstream_row(2, 90, now + timedelta(hours=28))],
+        }
+        scanner = stub_scanner(rows)
+        got = scanner.fetch_matches_once(threshold_pct=69, dates=[first, second])
+        # A match listed under both dates appears once
+        self.assertEqual([m.home for m in got], ['Home 0', 'Home 1', 'Home 2'])
+        self.assertEqual({r['date'] for r in scanner.requests}, {first, second})
+        got = stub_scanner(rows).fetch_matches_once(threshold_pct=69, dates=[first, second],
+                                                    time_order=True, limit=2)
+        self.assertEqual([m.home for m in got], ['Home 0', 'Home 2'])
+
+
+class SnapshotFileTests(SimpleTestCase):
+    """Snapshot files are written off the request thread and found via the index"""
+
+    key = ('normal', False, '2024-01-01')
+
+    def setUp(self):
+        import shutil
+        import tempfile
+
+        from .snapshots import SnapshotStore
+
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, True)
+        # A just-changed directory is rescanned on every miss
+        past = time.time() - 60
+        os.utime(self.directory, (past, past))
+        self.store = SnapshotStore(directory=self.directory)
+        self.matches = [match_record(f'Home {i}', 70 + i) for i in range(20)]
+
+    def test_written_by_writer_thread(self):
+        from unittest import mock
+
+        writers = []
+        real_fsync = os.fsync
+        with mock.patch('api.snapshots.os.fsync', side_effect=lambda fd: (
+            writers.append(threading.current_thread()), real_fsync(fd),
+        )):
+            self.store.publish(self.key, self.matches, 69)
+            self.store.flush()
+        self.assertEqual(len(writers), 1)
+        self.assertIsNot(writers[0], threading.current_thread())
+
+        from .snapshots import SnapshotStore
+
+        restarted = SnapshotStore(directory=self.directory)
+        self.assertEqual(restarted.get(self.key, threshold=75).query(), self.matches)
+
+    def test_miss_does_not_rescan(self):
+        from unittest import mock
+
+        from .snapshots import SnapshotStore
+
+        reader = SnapshotStore(directory=self.directory)
+        with mock.patch('api.snapshots.os.scandir', wraps=os.scandir) as scandir:
+            self.assertIsNone(reader.get(self.key))
+            self.assertIsNone(reader.get(self.key))
+            self.assertEqual(scandir.call_count, 1)
+
+            # Another worker's scan is picked up on the next miss
+            self.store.publish(self.key, self.matches, 69)
+            self.store.flush()
+            self.assertEqual(reader.get(self.key).size, 20)
+
+
+class DeltaFeedTests(TestCase):
+    """Versions and composite deltas of one feed"""
+
+    store_key = ('normal', False, '2024-01-01')
+
+    def setUp(self):
+        cache.clear()
+        self.feed = DeltaFeed(cache, retain=3)
+        self.feed_key = DeltaFeed.feed_key('normal', False, '2024-01-01', 75)
+
+    def test_since_zero_is_full(self):
+        self.assertEqual(self.feed.changes_since(self.feed_key, 0), (0, {
+            'added': [], 'changed': [], 'removed': [],
+        }, True))
+        tip = match_record('Home', 80)
+        self.feed.record(self.store_key, 75, [tip])
+        version, changes, full = self.feed.changes_since(self.feed_key, 0)
+        self.assertEqual((version, changes[ADDED], full), (1, [tip], True))
+
+    def test_changes_since(self):
+        first, second = match_record('Home', 80), match_record('Other', 90)
+        self.feed.record(self.store_key, 75, [first])
+        moved = first._replace(percentage=82)
+        self.feed.record(self.store_key, 75, [moved, second])
+        version, changes, full = self.feed.changes_since(self.feed_key, 1)
+        self.assertEqual((version, full), (2, False))
+        self.assertEqual(changes[ADDED], [second])
+        self.assertEqual(changes[CHANGED], [moved])
+        self.assertEqual(self.feed.changes_since(self.feed_key, 2)[1][ADDED], [])
+
+    def test_waits_for_lock(self):
+        lock = f"feed:{self.feed_key}:lock"
+        cache.set(lock, 'other worker', 30)
+        threading.Timer(0.2, cache.delete, args=(lock,)).start()
+        self.feed.record(self.store_key, 75, [match_record('Home', 80)])
+        self.assertEqual(self.feed.version(self.feed_key), 1)
+        self.assertIsNone(cache.get(lock))
+
+    def test_evicted_deltas_fall_back_to_full(self):
+        tips = []
+        for i in range(5):
+            tips.append(match_record(f'Home {i}', 80))
+            self.feed.record(self.store_key, 75, list(tips))
+        # Versions 3-5 are retained, so since=2 is still a delta
+        version, changes, full = self.feed.changes_since(self.feed_key, 2)
+        self.assertEqual((version, full, changes[ADDED]), (5, False, tips[2:]))
+        version, changes, full = self.feed.changes_since(self.feed_key, 1)
+        self.assertEqual((version, full, changes[ADDED]), (5, True, tips))
+
+    def test_older_snapshot_ignored(self):
+        self.feed.record(self.store_key, 75, [match_record('Home', 80)], built_at=20)
+        self.feed.record(self.store_key, 75, [], built_at=10)
+        self.assertEqual(self.feed.version(self.feed_key), 1)
+
+
+class TodaySnapshotMixin:
+    """Today's normal-mode snapshot in the store, so /api/matches/ never goes upstream"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='delta', password='secret', referral_code='delta')
+        cls.proxy = Proxy.objects.create(host='10.0.0.1', port=8080, success_rate=90)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        # Published by a normal-mode (69%) scan of today
+        self.store_key = ('normal', False, timezone.now().date().strftime('%Y-%m-%d'))
+        self.tips = [match_record('Home', 70), match_record('Other', 80)]
+        snapshot_store.install(self.store_key, Snapshot(self.tips, key=self.store_key, threshold=69))
+        self.addCleanup(self.evict)
+
+    def evict(self):
+        with snapshot_store.lock:
+            for slot in [slot for slot in snapshot_store.snapshots if slot[0] == self.store_key]:
+                del snapshot_store.snapshots[slot]
+                del snapshot_store.sizes[slot]
+
+    def delta(self, since, headers=None, **params):
+        # The view reads its parameters from the body first, even on GET
+        return self.client.generic(
+            'GET', f"{reverse('matches')}?since={since}",
+            json.dumps({'mode': 'safe', **params}), content_type='application/json',
+            headers=headers,
+        )
+
+
+class DeltaEndpointTests(TodaySnapshotMixin, TestCase):
+    """/api/matches/?since= served from the snapshot store"""
+
+    def test_lower_threshold_snapshot(self):
+        response = self.delta(0)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['version'], response.data['full']), (1, True))
+        self.assertEqual([m['match'] for m in response.data['added']], ['Other vs Away'])
+
+        response = self.delta(1, use_proxy=True)
+        self.assertEqual(response.status_code, 304)
+        # Answered from the store: no proxy was taken
+        self.proxy.refresh_from_db()
+        self.assertIsNone(self.proxy.last_used)
+
+        response = self.delta(0)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['added']), 1)
+
+    def test_unavailable_day_not_charged(self):
+        from unittest import mock
+
+        scanner = stub_scanner([])
+        scanner.fire_request = lambda *args, **kwargs: None
+        balance = self.user.credit_balance
+        with mock.patch('api.views.make_scanner', return_value=scanner):
+            response = self.delta(0, **{'from': '2024-01-02'})
+        self.assertEqual(response.status_code, 503)
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.credit_balance, balance)
+
+    def test_narrowing_parameters_refused(self):
+        for params in ({'live_only': True}, {'time_order': True}, {'limit': 5}):
+            with self.subTest(**params):
+                response = self.delta(0, **params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(next(iter(params)), response.data['error'])
+
+
+class IdempotencyTests(TodaySnapshotMixin, TestCase):
+    """Idempotency-Key on /api/matches/"""
+
+    def balance(self):
+        self.user.refresh_from_db()
+        return self.user.credit_balance
+
+    def test_replay(self):
+        headers = {'Idempotency-Key': 'once'}
+        first = self.delta(0, headers)
+        self.assertEqual(first.status_code, 200)
+        balance = self.balance()
+        second = self.delta(0, headers)
+        self.assertEqual(second.status_code, 200)
+        self.assertEqual(second['Idempotent-Replayed'], 'true')
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(self.balance(), balance)
+
+    def test_other_parameters_refused(self):
+        headers = {'Idempotency-Key': 'once'}
+        self.assertEqual(self.delta(0, headers).status_code, 200)
+        # Same URL, different body: the view would answer another question
+        self.assertEqual(self.delta(0, headers, mode='normal').status_code, 422)
+
+    def test_in_flight(self):
+        from .idempotency import cache_keys
+
+        _, lock_key = cache_keys(self.user.pk, reverse('matches'), 'busy')
+        cache.set(lock_key, 'other request', 300)
+        with self.settings(IDEMPOTENCY_WAIT_SECONDS=0):
+            response = self.delta(0, {'Idempotency-Key': 'busy'})
+        self.assertEqual(response.status_code, 409)
+        # Its lock is left alone
+        self.assertEqual(cache.get(lock_key), 'other request')
+
+    def test_not_modified_not_stored(self):
+        self.assertEqual(self.delta(0).status_code, 200)
+        headers = {'Idempotency-Key': 'poll'}
+        self.assertEqual(self.delta(1, headers).status_code, 304)
+        response = self.delta(1, headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertFalse(response.has_header('Idempotent-Replayed'))
+
+
+def split(body, size):
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+
+class PageStreamTests(SimpleTestCase):
+    """Incremental decoding matches json.loads whatever the chunking"""
+
+    rows = [
+        {'v': 15000000000.25, 'n': 'Over/Under 2.5', 'ln': 'Lig\u00e1 "A"\\B', 'i': [['1', 7, 0, 1.55]]},
+        {'v': -3e-5, 'htn': '\u20ac\n\t', 'i': []},
+        {'v': 12, 'atn': 'Zürich', 'ok': True, 'x': None},
+    ]
+
+    def bodies(self):
+        yield json.dumps({'data': self.rows, 'remaining': True}).encode()
+        yield json.dumps({'remaining': False, 'data': self.rows}).encode()
+        yield json.dumps({'meta': {'a': [1, 2]}, 'data': self.rows, 'remaining': 3}, indent=2).encode()
+
+    def test_any_chunking(self):
+        for body in self.bodies():
+            expected = json.loads(body)
+            for size in (1, 2, 3, 7, 64, len(body)):
+                with self.subTest(body=body[:20], size=size):
+                    page = PageStream(split(body, size))
+                    self.assertEqual(list(page['data']), expected['data'])
+                    self.assertEqual(page['remaining'], expected['remaining'])
+                    page.finish()
+
+    def test_key_after_data_skips_array(self):
+        body = json.dumps({'data': self.rows, 'remaining': True}).encode()
+        page = PageStream(split(body, 4))
+        self.assertIs(page.get('remaining'), True)
+        self.assertEqual(list(page['data']), [])
+        self.assertIsNone(page.get('missing'))
+
+    def test_finish_reads_to_the_end(self):
+        body = json.dumps({'data': self.rows, 'remaining': True, 'after': 1}).encode() + b'\n'
+        chunks = iter(split(body, 5))
+        page = PageStream(chunks)
+        self.assertEqual(len(list(page['data'])), 3)
+        page['remaining']
+        page.finish()
+        self.assertEqual(page.meta['after'], 1)
+        self.assertIsNone(next(chunks, None))
+
+    def test_truncated_or_malformed(self):
+        body = json.dumps({'data': self.rows, 'remaining': True}).encode()
+        for bad in (body[:-1], body[:40], body[:len(body) // 2], b'', b'[1]', body + b'{}'):
+            with self.subTest(bad=bad[-20:]):
+                page = PageStream(split(bad, 6))
+                with self.assertRaises(ValueError):
+                    list(page.get('data') or ())
+                    page.get('remaining')
+                    page.finish()
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=b'', headers=None):
+        self.status_code = status_code
+        self.content = body
+        self.headers = headers or {}
+        self.raw = None
+
+    def iter_content(self, size):
+        return iter(split(self.content, size))
+
+    def close(self):
+        pass
+
+
+class StreamedPageCacheTests(SimpleTestCase):
+    """Streamed pages are stored and revalidated like whole ones"""
+
+    def test_second_scan_revalidates(self):
+        from .scanners import PageCache, RateLimiter, TipScanner
+
+        kickoff = (timezone.now() + timedelta(hours=1)).strftime('%Y-%m-%dT%H:%M:%SZ')
+        body = json.dumps({'data': [
+            {'htn': 'Home', 'atn': 'Away', 'ln': 'League', 'n': '1X2', 'ce': kickoff,
+             'v': 1000, 'i': [['1', 900, 0, 1.2], ['2', 100, 0, 7.0]]},
+        ], 'remaining': False}).encode()
+        sent = []
+
+        def get(url, **kwargs):
+            headers = kwargs.get('headers') or {}
+            sent.append(headers.get('If-None-Match'))
+            if headers.get('If-None-Match') == '"v1"':
+                return FakeResponse(304)
+            return FakeResponse(200, body, {'ETag': '"v1"'})
+
+        page_cache = PageCache()
+        results = []
+        for _ in range(2):
+            scanner = TipScanner()
+            scanner.session.get = get
+            scanner.rate_limiter = RateLimiter(0)
+            scanner.page_cache = page_cache
+            scanner.stream_pages = True
+            scanner.stream_chunk_size = 16
+            results.append(scanner.scan_date('2024-01-01'))
+
+        self.assertEqual(sent, [None, '"v1"'])
+        self.assertEqual(results[0], results[1])
+        self.assertEqual([m.pick for m in results[0]], ['Home'])
+
+
+class WebhookTests(TestCase):
+    """Webhook URLs and delivery stay off internal addresses and the request thread"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='hooks', password='secret', referral_code='hooks')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_internal_urls_refused(self):
+        for url in ('http://127.0.0.1/hook', 'http://localhost:8000/hook', 'https://10.1.2.3/',
+                    'http://169.254.169.254/latest/meta-data/', 'http://[::1]/', 'ftp://8.8.8.8/'):
+            with self.subTest(url=url):
+                response = self.client.post(reverse('subscriptions-list'), {'webhook_url': url})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('webhook_url', response.data)
+        response = self.client.post(reverse('subscriptions-list'), {'webhook_url': 'https://8.8.8.8/hook'})
+        self.assertEqual(response.status_code, 201)
+
+    def test_delivery_leaves_the_caller(self):
+        from unittest import mock
+
+        from .notifications import ThreadDelivery
+
+        delivery = ThreadDelivery()
+        delivered = threading.Event()
+        threads = []
+
+        def post(*args):
+            threads.append(threading.current_thread())
+            delivered.set()
+
+        with mock.patch('api.tasks.post_webhook', post):
+            delivery.send(1, 'https://8.8.8.8/hook', 'secret', '{}')
+            self.assertTrue(delivered.wait(5))
+        self.assertIsNot(threads[0], threading.current_thread())
+
+    def test_stream_disabled(self):
+        response = self.client.get(reverse('subscriptions-stream'))
+        self.assertEqual(response.status_code, 501)
+
+
+class RecordingDelivery:
+    def __init__(self):
+        self.sent = []
+        self.fanned_out = []
+
+    def send(self, subscription_id, url, secret, body):
+        self.sent.append((subscription_id, json.loads(body)))
+
+    def fan_out(self, tip_type, events):
+        self.fanned_out.append((tip_type, events))
+
+
+class FanOutTests(TestCase):
+    """Subscriptions are matched by the fan-out job, not on the ingesting thread"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='fanout', password='secret', referral_code='fanout')
+        cls.hot = TipSubscription.objects.create(user=cls.user, min_percentage=80,
+                                                 webhook_url='https://8.8.8.8/hot')
+        TipSubscription.objects.create(user=cls.user, tip_type='underdog', webhook_url='https://8.8.8.8/dog')
+
+    def setUp(self):
+        from .notifications import Notifier
+
+        cache.clear()
+        self.delivery = RecordingDelivery()
+        self.notifier = Notifier(cache, None, self.delivery)
+        self.delta = {
+            'a': (ADDED, match_record('A', 90)),
+            'b': (CHANGED, match_record('B', 75)),
+            'c': ('removed', match_record('C', 95)),
+        }
+
+    def test_dispatch_only_queues(self):
+        with self.assertNumQueries(0):
+            self.notifier.dispatch(('normal', False, '2024-01-01'), 69, 3, self.delta)
+        self.assertEqual(self.delivery.sent, [])
+        [(tip_type, events)] = self.delivery.fanned_out
+        self.assertEqual(tip_type, 'normal')
+        self.assertEqual([(e['event'], e['match']) for e in events], [(ADDED, 'A vs Away'), (CHANGED, 'B vs Away')])
+        # The job goes through the broker as JSON
+        self.assertEqual(json.loads(json.dumps(events)), events)
+
+    def test_fan_out_matches_and_dedupes(self):
+        self.notifier.dispatch(('normal', False, '2024-01-01'), 69, 3, self.delta)
+        [(tip_type, events)] = self.delivery.fanned_out
+        self.notifier.fan_out(tip_type, events)
+        [(subscription_id, body)] = self.delivery.sent
+        self.assertEqual(subscription_id, self.hot.id)
+        self.assertEqual([tip['match'] for tip in body['tips']], ['A vs Away'])
+        # Another feed reporting the same tip notifies nobody again
+        self.notifier.fan_out(tip_type, events)
+        self.assertEqual(len(self.delivery.sent), 1)
+
+
+class IngestTests(SimpleTestCase):
+    """celery-beat's ingestion scans today into the store, which advances feeds"""
+
+    def setUp(self):
+        from unittest import mock
+
+        from .snapshots import SnapshotStore
+
+        cache.clear()
+        now = timezone.now().replace(microsecond=0)
+        rows = [upstream_row(i, pct, now + timedelta(hours=i + 1)) for i, pct in enumerate([70, 80, 90])]
+        self.scanners = [stub_scanner(rows), stub_scanner(rows, tip_type='underdog')]
+        self.store = SnapshotStore()
+        self.published = []
+        self.store.add_listener(lambda key, threshold, matches, built_at=None:
+                                self.published.append((key, threshold, len(matches))))
+        normal, underdog = self.scanners
+        for target, value in (('api.scanners.TipScanner', lambda: normal),
+                              ('api.scanners.UnderdogTipScanner', lambda: underdog),
+                              ('api.snapshots.snapshot_store', self.store),
+                              ('api.scanners.time.sleep', lambda seconds: None)):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_publishes_every_tip_type(self):
+        from .tasks import ingest_tips
+
+        today = timezone.now().strftime('%Y-%m-%d')
+        self.assertEqual(ingest_tips(), 2)
+        self.assertEqual(self.published, [(('normal', False, today), 69, 3), (('underdog', False, today), 69, 3)])
+        # A fresh snapshot is not scanned again
+        self.assertEqual(ingest_tips(), 2)
+        self.assertEqual([len(scanner.requests) for scanner in self.scanners], [1, 1])
+        self.assertEqual(len(self.published), 2)
+
+    def test_runs_do_not_overlap(self):
+        from .tasks import ingest_tips
+
+        cache.add('ingest_tips:lock', 1, 60)
+        self.assertEqual(ingest_tips(), 0)
+        self.assertEqual(self.published, [])
+
+
+class SchemaCacheTests(SimpleTestCase):
+    """The cached OpenAPI schema is not pinned to the first caller's host"""
+
+    def test_per_host(self):
+        from tip_api.schema import schema_view_class
+
+        schema_view_class().schemas.clear()
+        self.addCleanup(schema_view_class().schemas.clear)
+        url = reverse('schema-swagger-ui') + '?format=openapi'
+        internal = self.client.get(url, HTTP_HOST='10.0.0.5:8000')
+        public = self.client.get(url, HTTP_HOST='api.example.com', secure=True)
+        self.assertEqual(json.loads(internal.content)['host'], '10.0.0.5:8000')
+        schema = json.loads(public.content)
+        self.assertEqual((schema['host'], schema['schemes']), ('api.example.com', ['https']))
+
+
+class MetricsAccessTests(SimpleTestCase):
+    """/metrics is only served to allowlisted addresses or the scrape token"""
+
+    def scrape(self, addr, **headers):
+        return self.client.get(reverse('metrics'), REMOTE_ADDR=addr, **headers).status_code
+
+    def test_allowlist(self):
+        with self.settings(METRICS_ALLOWED_IPS=['127.0.0.1', '10.0.0.0/8'], METRICS_TOKEN=''):
+            self.assertEqual(self.scrape('127.0.0.1'), 200)
+            self.assertEqual(self.scrape('10.1.2.3'), 200)
+            self.assertEqual(self.scrape('::ffff:10.1.2.3'), 200)
+            self.assertEqual(self.scrape('203.0.113.9'), 404)
+            self.assertEqual(self.scrape('203.0.113.9', HTTP_X_FORWARDED_FOR='127.0.0.1'), 404)
+
+    def test_token(self):
+        with self.settings(METRICS_ALLOWED_IPS=[], METRICS_TOKEN='s3cret'):
+            self.assertEqual(self.scrape('203.0.113.9', HTTP_AUTHORIZATION='Bearer s3cret'), 200)
+            self.assertEqual(self.scrape('203.0.113.9', HTTP_AUTHORIZATION='Bearer wrong'), 404)
+            self.assertEqual(self.scrape('127.0.0.1'), 404)
+
+
+def make_tip(match_id, **fields):
+    values = {
+        'league': 'League', 'home_team': f'Home {match_id}', 'away_team': 'Away',
+        'match_time': timezone.now() + timedelta(hours=1), 'pick': '1', 'odds': Decimal('1.80'),
+        'percentage': Decimal('80.00'), 'market': '1X2', 'total_money': Decimal('1000'),
+        'dominant_money': Decimal('800'), 'confidence_level': 'medium',
+    }
+    values.update(fields)
+    return MatchTip.objects.create(match_id=str(match_id), **values)
+
+
+class BacktestMathTests(SimpleTestCase):
+    """evaluate_segment and _format on a hand-computed history"""
+
+    def setUp(self):
+        import numpy as np
+
+        from .backtest import LOST, VOID, WON
+
+        # pct 90 won @2.0, 80 lost @1.5, 70 won @3.0, 60 void @2.0
+        self.columns = (
+            np.array([70.0, 90.0, 60.0, 80.0]), np.array([3.0, 2.0, 2.0, 1.5]),
+            np.array([100.0, 100.0, 100.0, 500.0]), np.array([WON, WON, VOID, LOST], dtype=np.int8),
+        )
+        self.thresholds = (65, 75, 85, 95)
+        self.bands = ((0, float('inf')), (200, float('inf')))
+        self.ranges = ((0, float('inf')), (1.0, 2.0))
+
+    def test_evaluate_segment(self):
+        from .backtest import evaluate_segment
+
+        cells = evaluate_segment(*self.columns, self.thresholds, self.bands, self.ranges)
+        self.assertEqual(cells.shape, (2, 2, 4, 3))
+        # (bets, wins, profit) at 65, 75, 85, 95
+        self.assertEqual(cells[0, 0].tolist(), [[3, 2, 2.0], [2, 1, 0.0], [1, 1, 1.0], [0, 0, 0.0]])
+        # Odds in [1, 2): only the lost 1.5
+        self.assertEqual(cells[0, 1].tolist(), [[1, 0, -1.0], [1, 0, -1.0], [0, 0, 0.0], [0, 0, 0.0]])
+        # Volume >= 200: only the lost 1.5 again
+        self.assertEqual(cells[1, 0].tolist(), cells[0, 1].tolist())
+        self.assertEqual(cells[1, 1].tolist(), cells[0, 1].tolist())
+
+    def test_format(self):
+        from .backtest import Grid, _format, evaluate_segment
+
+        grid = Grid(thresholds=self.thresholds, volume_bands=self.bands,
+                    odds_ranges=self.ranges, min_bets=2)
+        cells = evaluate_segment(*self.columns, self.thresholds, self.bands, self.ranges)
+        self.assertEqual(_format('normal', None, cells, grid), [
+            {'tip_type': 'normal', 'league': 'all', 'threshold': 65, 'volume': [0, float('inf')],
+             'odds': [0, float('inf')], 'bets': 3, 'wins': 2, 'hit_rate': 0.6667,
+             'profit': 2.0, 'roi': 0.6667},
+            {'tip_type': 'normal', 'league': 'all', 'threshold': 75, 'volume': [0, float('inf')],
+             'odds': [0, float('inf')], 'bets': 2, 'wins': 1, 'hit_rate': 0.5,
+             'profit': 0.0, 'roi': 0.0},
+        ])
+
+
+class SettleTests(TestCase):
+    """Results written by settle move the backtest's data version"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_settle_invalidates_backtest(self):
+        from .backtest import Grid, backtest, settle
+
+        make_tip(1, result='won', odds=Decimal('2.00'))
+        make_tip(2)
+        make_tip(2, market='Over_Under_2.5', pick='Over 2.5')
+        grid = Grid(thresholds=(75,), volume_bands=((0, float('inf')),),
+                    odds_ranges=((0, float('inf')),), min_bets=1)
+        self.assertEqual(backtest(grid, workers=1)[0]['bets'], 1)
+
+        self.assertEqual(settle([('2', '1X2', '1', 'lost')]), 1)
+        result = backtest(grid, workers=1)[0]
+        self.assertEqual((result['bets'], result['wins'], result['profit']), (2, 1, 0.0))
+        self.assertEqual(MatchTip.objects.get(match_id='2', market='1X2').result, 'lost')
+        self.assertEqual(MatchTip.objects.get(match_id='2', market='Over_Under_2.5').result, 'pending')
+
+        # A plain update() leaves updated_at alone but still moves the version
+        MatchTip.objects.filter(match_id='2', market='1X2').update(result='won')
+        self.assertEqual(backtest(grid, workers=1)[0]['wins'], 2)
+
+    def test_unknown_result_writes_nothing(self):
+        from .backtest import settle
+
+        make_tip(1)
+        with self.assertRaises(ValueError):
+            settle([('1', '', '', 'won'), ('1', '', '', 'draw')])
+        self.assertEqual(MatchTip.objects.get().result, 'pending')
+
+    def test_command(self):
+        import tempfile
+
+        from django.core.management import call_command
+
+        make_tip(1)
+        make_tip(1, market='Over_Under_2.5', pick='Over 2.5')
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as f:
+            f.write('match_id,market,pick,result\n1,,,Void\n')
+        self.addCleanup(os.unlink, f.name)
+        call_command('settle_tips', f.name, stdout=io.StringIO())
+        self.assertEqual(set(MatchTip.objects.values_list('result', flat=True)), {'void'})
+
+
+class ExportTests(TestCase):
+    """/api/tips/export/ encoders, filters and permissions"""
+
+    @classmethod
+    def setUpTestData(cls):
+        from datetime import datetime, timezone as dt_timezone
+
+        cls.staff = User.objects.create_user(username='staff', password='secret', referral_code='staff',
+                                             is_staff=True)
+        cls.user = User.objects.create_user(username='plain', password='secret', referral_code='plain')
+        day = datetime(2024, 1, 15, 18, 30, tzinfo=dt_timezone.utc)
+        cls.tips = [
+            make_tip(1, match_time=day, league='Serie A', odds=Decimal('1.95'), result='won'),
+            make_tip(2, match_time=day + timedelta(days=1), tip_type='underdog'),
+            make_tip(3, match_time=day + timedelta(days=2), percentage=Decimal('91.25')),
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.staff)
+
+    def export(self, **params):
+        response = self.client.get(reverse('tips-export'), params)
+        if response.status_code != 200:
+            return response, None
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_permission(self):
+        self.client.force_authenticate(None)
+        self.assertIn(self.client.get(reverse('tips-export')).status_code, (401, 403))
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(reverse('tips-export')).status_code, 403)
+
+    def test_csv(self):
+        import csv
+
+        from .export import FIELDS
+
+        response, body = self.export(fmt='csv')
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.DictReader(io.StringIO(body.decode())))
+        self.assertEqual(list(rows[0]), list(FIELDS))
+        self.assertEqual([row['match_id'] for row in rows], ['1', '2', '3'])
+        self.assertEqual((rows[0]['odds'], rows[0]['result']), ('1.95', 'won'))
+        self.assertEqual(rows[0]['match_time'], '2024-01-15T18:30:00+00:00')
+
+    def test_ndjson(self):
+        _, body = self.export(fmt='ndjson')
+        rows = [json.loads(line) for line in body.decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows], [tip.pk for tip in self.tips])
+        self.assertEqual((rows[2]['percentage'], rows[1]['tip_type']), (91.25, 'underdog'))
+        self.assertIs(rows[0]['is_live'], False)
+
+    def test_arrow(self):
+        try:
+            import pyarrow as pa
+        except ImportError:
+            self.skipTest('pyarrow is not installed')
+
+        _, body = self.export(fmt='arrow')
+        table = pa.ipc.open_stream(body).read_all()
+        self.assertEqual(table.column('match_id').to_pylist(), ['1', '2', '3'])
+        self.assertEqual(table.column('odds').to_pylist()[0], 1.95)
+        self.assertEqual(table.schema.field('match_time').type, pa.timestamp('us', tz='UTC'))
+
+    def test_filters(self):
+        cases = [
+            ({'from': '2024-01-16'}, ['2', '3']),
+            ({'to': '2024-01-16'}, ['1', '2']),
+            ({'from': '2024-01-16', 'to': '2024-01-16'}, ['2']),
+            ({'tip_type': 'underdog'}, ['2']),
+            ({'league': 'Serie A'}, ['1']),
+        ]
+        for params, expected in cases:
+            with self.subTest(**params):
+                _, body = self.export(fmt='ndjson', **params)
+                self.assertEqual([json.loads(line)['match_id'] for line in body.decode().splitlines()], expected)
+        for params in ({'fmt': 'xml'}, {'from': '15/01/2024'}, {'tip_type': 'other'}):
+            with self.subTest(**params):
+                self.assertEqual(self.export(**params)[0].status_code, 400)
+
+    def test_streams_in_chunks(self):
+        from unittest import mock
+
+        from django.db.models.query import QuerySet
+
+        from .export import export_queryset, stream_export
+
+        real = QuerySet.iterator
+        with mock.patch.object(QuerySet, 'iterator', autospec=True, side_effect=real) as iterator:
+            chunks = list(stream_export('csv', export_queryset(), chunk_size=1))
+        self.assertEqual(iterator.call_args.kwargs, {'chunk_size': 1})
+        # Header and first row, then one row per chunk
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(sum(chunk.count('\n') for chunk in chunks), 4)
+
+
+class UpstreamStubMixin:
+    """Views scan a stubbed upstream into a private snapshot store"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='batch', password='secret', referral_code='batch',
+                                            credit_balance=5000)
+
+    def setUp(self):
+        from unittest import mock
+
+        from .snapshots import SnapshotStore
+
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        now = timezone.now().replace(microsecond=0)
+        self.rows = [upstream_row(i, pct, now + timedelta(hours=i + 1))
+                     for i, pct in enumerate([70, 72, 76, 80, 90])]
+        self.scanners = []
+
+        def make_scanner(tip_type):
+            scanner = stub_scanner(self.rows, tip_type=tip_type)
+            self.scanners.append(scanner)
+            return scanner
+
+        for target, value in (('api.views.make_scanner', make_scanner),
+                              ('api.views.snapshot_store', SnapshotStore()),
+                              ('api.scanners.time.sleep', lambda seconds: None)):
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def spent(self, balance):
+        self.user.refresh_from_db()
+        return balance - self.user.credit_balance
+
+    def upstream_dates(self):
+        return {request['date'] for scanner in self.scanners for request in scanner.requests}
+
+
+class BatchTests(UpstreamStubMixin, TestCase):
+    """/api/matches/batch/ grouping, re-filtering and billing"""
+
+    def batch(self, *variants):
+        return self.client.post(reverse('matches-batch'), {'variants': list(variants)}, format='json')
+
+    def test_modes_share_one_scan(self):
+        balance = self.user.credit_balance
+        response = self.batch({'mode': 'normal', 'limit': 3}, {'mode': 'safe'}, {'mode': 'safe', 'time_order': True, 'limit': 1})
+        self.assertEqual(response.status_code, 200)
+        # One upstream query, at the lowest threshold
+        self.assertEqual({r['min_percent'] for s in self.scanners for r in s.requests}, {69})
+        normal, safe, earliest = response.data['results']
+        self.assertEqual([m['percentage'] for m in normal['matches']], [70, 72, 76])
+        self.assertEqual([m['percentage'] for m in safe['matches']], [76, 80, 90])
+        self.assertEqual([m['percentage'] for m in earliest['matches']], [76])
+        self.assertEqual(response.data['scans'], 1)
+        self.assertEqual(self.spent(balance), 200)
+
+    def test_charged_per_query_and_date(self):
+        balance = self.user.credit_balance
+        today = timezone.now().date()
+        response = self.batch(
+            {'tip_type': 'normal'},
+            {'tip_type': 'underdog'},
+            # Overlaps today: only the two other days are new scans
+            {'tip_type': 'normal', 'from': str(today - timedelta(days=2)), 'to': str(today)},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['scans'], 4)
+        self.assertEqual(response.data['credits_used'], 800)
+        self.assertEqual(self.spent(balance), 800)
+
+    def test_insufficient_credits(self):
+        today = timezone.now().date()
+        self.user.credit_balance = 300
+        self.user.save()
+        response = self.batch({'from': str(today - timedelta(days=1)), 'to': str(today)})
+        self.assertEqual(response.status_code, 402)
+        self.assertEqual(response.data['required_credits'], 400)
+        self.assertEqual(self.scanners, [])
+
+
+class DateRangeTests(UpstreamStubMixin, TestCase):
+    """from/to on /api/matches/: parsing, the day cap, cross-date dedup and billing"""
+
+    def matches(self, **params):
+        return self.client.generic(
+            'GET', reverse('matches'), json.dumps(params), content_type='application/json',
+        )
+
+    def test_range_charged_per_day(self):
+        balance = self.user.credit_balance
+        start = timezone.now().date() - timedelta(days=2)
+        response = self.matches(**{'from': str(start), 'to': str(start + timedelta(days=2)), 'limit': 100})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['credits_used'], 600)
+        self.assertEqual(self.spent(balance), 600)
+
+    def test_invalid_ranges(self):
+        today = timezone.now().date()
+        cases = [
+            {'from': '2024-13-01'},
+            {'from': str(today), 'to': str(today - timedelta(days=1))},
+            {'from': str(today), 'to': str(today + timedelta(days=7))},
+        ]
+        for params in cases:
+            with self.subTest(**params):
+                self.assertEqual(self.matches(**params).status_code, 400)
+        self.assertEqual(self.scanners, [])
+        response = self.matches(**{'from': str(today), 'to': str(today + timedelta(days=6))})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.upstream_dates()), 7)
+
+    def test_single_bound(self):
+        day = str(timezone.now().date() - timedelta(days=1))
+        for params in ({'from': day}, {'to': day}):
+            with self.subTest(**params):
+                self.assertEqual(self.matches(**params).status_code, 200)
+                # The second one is answered from the first one's scan
+                self.assertEqual(self.upstream_dates(), {day})
+
+
+class ScanQueryBudgetTests(UpstreamStubMixin, TestCase):
+    """Charged scans and the export stay within SCAN_BUDGETS"""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.staff = User.objects.create_user(username='staff', password='secret', referral_code='staff',
+                                             is_staff=True)
+        for i in range(ROWS):
+            make_tip(i)
+
+    def request(self, method, name, **data):
+        budget = SCAN_BUDGETS[(method, name)]
+        with query_budget(budget):
+            response = getattr(self.client, method)(reverse(name), data, format='json')
+            # Streamed bodies query while they are read
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def test_matches(self):
+        self.request('get', 'matches')
+
+    def test_batch(self):
+        self.request('post', 'matches-batch', variants=[{'mode': 'normal'}, {'tip_type': 'underdog'}])
+
+    def test_export(self):
+        self.client.force_authenticate(self.staff)
+        self.request('get', 'tips-export', fmt='ndjson')
@@ -1,32 +1,24 @@
-from django.contrib import admin
 from django.urls import path, include
-from django.conf import settings
-from django.conf.urls.static import static
-from rest_framework import permissions
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
+from rest_framework.routers import DefaultRouter
 
-schema_view = get_schema_view(
-    openapi.Info(
-        title="Tip API",
-        default_version='v1',
-        description="API for fetching match tips and predictions",
-        terms_of_service="https://yourdomain.com/terms/",
-        contact=openapi.Contact(email="support@yourdomain.com"),
-        license=openapi.License(name="BSD License"),
-    ),
-    public=True,
-    permission_classes=(permissions.AllowAny,),
-)
+from . import views
+
+router = DefaultRouter()
+router.register('tips', views.MatchTipViewSet, basename='tips')
+router.register('logs', views.APIRequestLogViewSet, basename='logs')
+router.register('subscriptions', views.TipSubscriptionViewSet, basename='subscriptions')
+router.register('credits/transactions', views.CreditTransactionViewSet, basename='credit-transactions')
 
 urlpatterns = [
-    path('admin/', admin.site.urls),
-    path('api/', include('api.urls')),
-    
-    # API Documentation
-    path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
-    path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
+    path('auth/register/', views.RegisterView.as_view(), name='register'),
+    path('auth/login/', views.LoginView.as_view(), name='login'),
+    path('auth/profile/', views.UserProfileView.as_view(), name='profile'),
+    path('tips/export/', views.MatchTipExportView.as_view(), name='tips-export'),
+    path('matches/', views.MatchTipAPIView.as_view(), name='matches'),
+    path('matches/batch/', views.BatchMatchTipAPIView.as_view(), name='matches-batch'),
+    path('subscriptions/stream/', views.TipStreamView.as_view(), name='subscriptions-stream'),
+    path('credits/buy/', views.BuyCreditsView.as_view(), name='buy-credits'),
+    path('health/', views.HealthCheckView.as_view(), name='health'),
+    path('docs/', views.api_documentation, name='api-docs'),
+    path('', include(router.urls)),
 ]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
\ No newline at end of file
@@ -1,23 +1,34 @@
-from rest_framework import generics, status, viewsets
+from rest_framework import generics, serializers, status, viewsets
 from rest_framework.views import APIView
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticated, AllowAny
+from rest_framework.permissions import IsAuthenticated, IsAdminUser, AllowAny
 from rest_framework.authtoken.models import Token
 from rest_framework.decorators import action, api_view, permission_classes
 from django_filters.rest_framework import DjangoFilterBackend
+from django.core.cache import cache
+from django.conf import settings
+from django.http import StreamingHttpResponse
 from django.utils import timezone
 from datetime import datetime, timedelta
-import requests
+import heapq
 import json
 import random
 import time
+from operator import attrgetter
 
-from .models import User, MatchTip, APIRequestLog, CreditTransaction
+from .models import User, MatchTip, APIRequestLog, CreditTransaction, TipSubscription
 from .serializers import (
     UserSerializer, UserRegistrationSerializer, LoginSerializer,
-    MatchTipSerializer, APIRequestLogSerializer, CreditTransactionSerializer
+    MatchTipSerializer, APIRequestLogSerializer, CreditTransactionSerializer,
+    TipSubscriptionSerializer
 )
-from .scanners import TipScanner, UnderdogTipScanner
+from .metrics import CREDITS_CHARGED
+from .snapshots import snapshot_store
+from .feed import delta_feed, tip_id
+from .notifications import notifier
+from .export import FORMATS, export_queryset, stream_export
+from .idempotency import idempotent
+from .readcache import CachedResponseMixin, versioned_cache
 from utils.proxy_manager import ProxyManager
 
 class RegisterView(generics.CreateAPIView):
@@ -61,20 +72,67 @@ class UserProfileView(generics.RetrieveUpdateAPIView):
     def get_object(self):
         return self.request.user
 
+# Billing: every upstream query scanned for one date is one charge, on
+# /api/matches/ (a from/to range of N days costs N) as in batches
+MAX_SCAN_DAYS = 7
+MAX_BATCH_VARIANTS = 10
+MAX_TIP_SUBSCRIPTIONS = 20
+
+def parse_date_range(date_from, date_to):
+    """Inclusive list of dates between from/to, or None when neither is given"""
+    if not (date_from or date_to):
+        return None
+    try:
+        start = datetime.strptime(date_from or date_to, '%Y-%m-%d').date()
+        end = datetime.strptime(date_to or date_from, '%Y-%m-%d').date()
+    except ValueError:
+        raise ValueError('Dates must be YYYY-MM-DD')
+    if end < start or (end - start).days >= MAX_SCAN_DAYS:
+        raise ValueError(f'Date range must be 1-{MAX_SCAN_DAYS} days')
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+def charge_api_call(user, use_proxy, tip_type, endpoint, parameters, response_count,
+                    description, scans=1):
+    """Deduct credits and record the APIRequestLog/CreditTransaction pair"""
+    cost = user.request_cost(use_proxy, scans)
+    if not user.deduct_credits(use_proxy, scans):
+        return False
+    CREDITS_CHARGED.labels(tip_type=tip_type, proxy=str(use_proxy).lower()).inc(cost)
+    
+    APIRequestLog.objects.create(
+        user=user,
+        endpoint=endpoint,
+        parameters=parameters,
+        credits_used=cost,
+        response_count=response_count,
+        used_proxy=use_proxy
+    )
+    
+    CreditTransaction.objects.create(
+        user=user,
+        transaction_type='api_call',
+        amount=-cost,
+        description=description
+    )
+    return True
+
+def as_bool(value):
+    if isinstance(value, str):
+        return value.lower() == 'true'
+    return bool(value)
+
+def make_scanner(tip_type):
+    """Scanner for a tip type; the scanner module loads on the first scan"""
+    from .scanners import TipScanner, UnderdogTipScanner
+    return UnderdogTipScanner() if tip_type == 'underdog' else TipScanner()
+
 class MatchTipAPIView(APIView):
     permission_classes = [IsAuthenticated]
     
+    @idempotent
     def get(self, request):
-        # Check if user has sufficient credits
         use_proxy = request.data.get('use_proxy', False) or request.query_params.get('use_proxy', 'false').lower() == 'true'
         
-        if not request.user.has_sufficient_credits(use_proxy):
-            return Response({
-                'error': 'Insufficient credits',
-                'required_credits': 100 if use_proxy else 200,
-                'current_balance': request.user.credit_balance
-            }, status=status.HTTP_402_PAYMENT_REQUIRED)
-        
         # Parse parameters
         tip_type = request.data.get('tip_type', 'normal') or request.query_params.get('tip_type', 'normal')
         mode = request.data.get('mode', 'normal') or request.query_params.get('mode', 'normal')
@@ -84,9 +142,41 @@ class MatchTipAPIView(APIView):
         limit = int(request.data.get('limit', 10) or request.query_params.get('limit', 10))
         limit = max(1, min(limit, 100))
         
+        # Optional date range (inclusive), defaults to today
+        date_from = request.data.get('from') or request.query_params.get('from')
+        date_to = request.data.get('to') or request.query_params.get('to')
+        try:
+            dates = parse_date_range(date_from, date_to)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        # Check if user has sufficient credits: one charge per date scanned
+        scans = len(dates) if dates else 1
+        if not request.user.has_sufficient_credits(use_proxy, scans):
+            return Response({
+                'error': 'Insufficient credits',
+                'required_credits': request.user.request_cost(use_proxy, scans),
+                'current_balance': request.user.credit_balance
+            }, status=status.HTTP_402_PAYMENT_REQUIRED)
+        
+        params = {
+            'tip_type': tip_type,
+            'mode': mode,
+            'live_only': live_only,
+            'exclude_major': exclude_major,
+            'time_order': time_order,
+            'limit': limit,
+            'from': date_from,
+            'to': date_to,
+        }
+        
         # Determine confidence threshold
         threshold = 75 if mode == 'safe' else 69
         
+        since = request.query_params.get('since')
+        if since is not None:
+            return self.get_delta(request, since, params, threshold, dates, use_proxy)
+        
         # Get proxy if requested
         proxy = None
         if use_proxy:
@@ -95,10 +185,7 @@ class MatchTipAPIView(APIView):
         
         try:
             # Fetch matches using the scanner
-            if tip_type == 'underdog':
-                scanner = UnderdogTipScanner()
-            else:
-                scanner = TipScanner()
+            scanner = make_scanner(tip_type)
             
             matches = scanner.fetch_matches_once(
                 threshold_pct=threshold,
@@ -106,46 +193,274 @@ class MatchTipAPIView(APIView):
                 live_only=live_only,
                 exclude_major=exclude_major,
                 time_order=time_order,
-                proxy=proxy
+                proxy=proxy,
+                dates=dates,
+                cache=cache,
+                store=snapshot_store,
             )
             
-            # Deduct credits
-            if not request.user.deduct_credits(use_proxy):
+            # Deduct credits, log the request and record the transaction
+            if not charge_api_call(
+                request.user, use_proxy, scanner.tip_type, '/api/matches/',
+                {**params, 'use_proxy': use_proxy},
+                len(matches),
+                f'API call for {tip_type} tips (proxy: {use_proxy})',
+                scans=scans,
+            ):
                 return Response({'error': 'Credit deduction failed'}, 
                               status=status.HTTP_500_INTERNAL_SERVER_ERROR)
             
-            # Log the API request
-            APIRequestLog.objects.create(
-                user=request.user,
-                endpoint='/api/matches/',
-                parameters={
-                    'tip_type': tip_type,
-                    'mode': mode,
-                    'live_only': live_only,
-                    'exclude_major': exclude_major,
-                    'time_order': time_order,
-                    'limit': limit,
-                    'use_proxy': use_proxy
-                },
-                credits_used=100 if use_proxy else 200,
-                response_count=len(matches),
-                used_proxy=use_proxy
+            return Response({
+                'success': True,
+                'count': len(matches),
+                'credits_used': request.user.request_cost(use_proxy, scans),
+                'credits_remaining': request.user.credit_balance,
+                'matches': [m.as_dict() for m in matches]
+            })
+            
+        except Exception as e:
+            return Response({
+                'error': str(e),
+                'success': False
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+
+    def get_delta(self, request, since, params, threshold, dates, use_proxy):
+        """``?since=<version>``: only tips added, removed or changed since then.
+        
+        Works on one full day (today or from=to). ``since=0`` returns every
+        current tip. Replies 304 without charging when the client's ETag or
+        version is current, and 503 without charging when the day could not
+        be scanned into a snapshot.
+        """
+        try:
+            since = int(since)
+        except ValueError:
+            return Response({'error': 'since must be an integer version'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        if dates and len(dates) > 1:
+            return Response({'error': 'since supports a single date'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        # The feed is the whole day at one threshold; these would only narrow the full answer
+        unsupported = [name for name in ('live_only', 'time_order') if as_bool(params[name])]
+        if request.data.get('limit') is not None or request.query_params.get('limit') is not None:
+            unsupported.append('limit')
+        if unsupported:
+            return Response({'error': f"since does not support {', '.join(unsupported)}"},
+                          status=status.HTTP_400_BAD_REQUEST)
+        
+        scanner = make_scanner(params['tip_type'])
+        f_date = (dates[0] if dates else timezone.now().date()).strftime('%Y-%m-%d')
+        store_key = scanner.store_key(f_date, params['exclude_major'])
+        feed_key = delta_feed.feed_key(scanner.tip_type, params['exclude_major'], f_date, threshold)
+        
+        try:
+            # A snapshot the store can serve means no upstream request, so
+            # only take (and mark used) a proxy when the day must be scanned
+            proxy = None
+            if use_proxy and snapshot_store.get(
+                store_key, max_age=scanner.snapshot_stale_ttl, threshold=threshold,
+            ) is None:
+                proxy = ProxyManager().get_best_proxy()
+            # Full, unordered day scan: refreshes the snapshot unless a fresh
+            # one is already in the store
+            scanner.fetch_matches_once(
+                threshold_pct=threshold,
+                exclude_major=params['exclude_major'],
+                proxy=proxy,
+                dates=[f_date],
+                cache=cache,
+                store=snapshot_store,
+            )
+            # The store may hold the day at a lower threshold (another mode
+            # published it); fold what was served, at this threshold, into
+            # this feed, since publishing only advanced the snapshot's own
+            snapshot = snapshot_store.get(
+                store_key, max_age=scanner.snapshot_stale_ttl, threshold=threshold,
             )
+            if snapshot is None:
+                # Upstream failed, or the day is too big to snapshot
+                return Response({
+                    'error': f'Tips for {f_date} are unavailable; no credits were charged',
+                    'success': False
+                }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+            delta_feed.record(
+                store_key, threshold, snapshot.query(threshold=threshold),
+                built_at=snapshot.built_at,
+            )
+            version, changes, full = delta_feed.changes_since(feed_key, since)
+        except Exception as e:
+            return Response({
+                'error': str(e),
+                'success': False
+            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        etag = delta_feed.etag(feed_key, version)
+        if not full and (since == version or request.headers.get('If-None-Match') == etag):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            response['ETag'] = etag
+            return response
+        
+        count = sum(len(records) for records in changes.values())
+        if not charge_api_call(
+            request.user, use_proxy, scanner.tip_type, '/api/matches/',
+            {**params, 'since': since, 'use_proxy': use_proxy},
+            count,
+            f'Delta API call for {params["tip_type"]} tips (proxy: {use_proxy})',
+        ):
+            return Response({'error': 'Credit deduction failed'}, 
+                          status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        
+        response = Response({
+            'success': True,
+            'version': version,
+            'since': since,
+            'full': full,
+            'count': count,
+            'credits_used': request.user.request_cost(use_proxy),
+            'credits_remaining': request.user.credit_balance,
+            'added': [m.as_dict() for m in changes['added']],
+            'changed': [m.as_dict() for m in changes['changed']],
+            'removed': [tip_id(m) for m in changes['removed']],
+        })
+        response['ETag'] = etag
+        return response
+
+class BatchMatchTipAPIView(APIView):
+    """Answer several /api/matches/ variants from as few upstream scans as possible.
+    
+    Variants that only differ in ``mode`` (69% vs 75%) share one scan at the
+    lowest threshold and are re-filtered on percentage in memory. The whole
+    batch is charged once, for the number of distinct (query, date) scans,
+    the same rule as a date range on /api/matches/.
+    """
+    permission_classes = [IsAuthenticated]
+    
+    @idempotent
+    def post(self, request):
+        use_proxy = as_bool(request.data.get('use_proxy', False))
+        variants = request.data.get('variants')
+        
+        if not isinstance(variants, list) or not variants:
+            return Response({'error': 'variants must be a non-empty list'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        if len(variants) > MAX_BATCH_VARIANTS:
+            return Response({'error': f'At most {MAX_BATCH_VARIANTS} variants per batch'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        
+        # Normalize every variant and group them by upstream query
+        parsed = []
+        groups = {}
+        for raw in variants:
+            if not isinstance(raw, dict):
+                return Response({'error': 'Each variant must be an object'},
+                              status=status.HTTP_400_BAD_REQUEST)
+            try:
+                limit = max(1, min(int(raw.get('limit', 10)), 100))
+                dates = parse_date_range(raw.get('from'), raw.get('to'))
+            except (TypeError, ValueError) as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
             
-            # Create credit transaction record
-            CreditTransaction.objects.create(
-                user=request.user,
-                transaction_type='api_call',
-                amount=-(100 if use_proxy else 200),
-                description=f'API call for {tip_type} tips (proxy: {use_proxy})'
+            variant = {
+                'tip_type': 'underdog' if raw.get('tip_type') == 'underdog' else 'normal',
+                'mode': 'safe' if raw.get('mode') == 'safe' else 'normal',
+                'live_only': as_bool(raw.get('live_only', False)),
+                'exclude_major': as_bool(raw.get('exclude_major', False)),
+                'time_order': as_bool(raw.get('time_order', False)),
+                'limit': limit,
+                'from': raw.get('from'),
+                'to': raw.get('to'),
+            }
+            threshold = 75 if variant['mode'] == 'safe' else 69
+            key = (
+                variant['tip_type'], variant['exclude_major'], variant['live_only'],
+                tuple(dates) if dates else None,
             )
+            parsed.append((variant, threshold, key))
+            groups.setdefault(key, []).append((variant, threshold))
+        
+        today = timezone.now().date()
+        scans = len({
+            (tip_type, exclude_major, live_only, day)
+            for tip_type, exclude_major, live_only, dates in groups
+            for day in (dates or (today,))
+        })
+        cost = request.user.request_cost(use_proxy, scans)
+        if not request.user.has_sufficient_credits(use_proxy, scans):
+            return Response({
+                'error': 'Insufficient credits',
+                'required_credits': cost,
+                'current_balance': request.user.credit_balance
+            }, status=status.HTTP_402_PAYMENT_REQUIRED)
+        
+        proxy = None
+        if use_proxy:
+            proxy = ProxyManager().get_best_proxy()
+        
+        try:
+            datasets = {}
+            for key, members in groups.items():
+                tip_type, exclude_major, live_only, dates = key
+                scanner = make_scanner(tip_type)
+                
+                if len(members) == 1:
+                    # Nothing to share: let the scanner apply limit/time_order itself
+                    variant, threshold = members[0]
+                    datasets[key] = scanner.fetch_matches_once(
+                        threshold_pct=threshold,
+                        limit=variant['limit'],
+                        live_only=live_only,
+                        exclude_major=exclude_major,
+                        time_order=variant['time_order'],
+                        proxy=proxy,
+                        dates=dates,
+                        cache=cache,
+                        store=snapshot_store,
+                    )
+                else:
+                    # Widest dataset: lowest threshold, unlimited, unordered
+                    datasets[key] = scanner.fetch_matches_once(
+                        threshold_pct=min(threshold for _, threshold in members),
+                        live_only=live_only,
+                        exclude_major=exclude_major,
+                        proxy=proxy,
+                        dates=dates,
+                        cache=cache,
+                        store=snapshot_store,
+                    )
+            
+            results = []
+            for variant, threshold, key in parsed:
+                matches = [m for m in datasets[key] if m.percentage >= threshold]
+                if variant['time_order']:
+                    matches = heapq.nsmallest(variant['limit'], matches, key=attrgetter('kickoff_ts'))
+                else:
+                    matches = matches[:variant['limit']]
+                results.append({
+                    'variant': variant,
+                    'count': len(matches),
+                    'matches': [m.as_dict() for m in matches],
+                })
+            
+            if not charge_api_call(
+                request.user, use_proxy, 'batch', '/api/matches/batch/',
+                {
+                    'variants': [variant for variant, _, _ in parsed],
+                    'scans': scans,
+                    'use_proxy': use_proxy,
+                },
+                sum(result['count'] for result in results),
+                f'Batch API call: {len(parsed)} variants, {scans} scans (proxy: {use_proxy})',
+                scans=scans,
+            ):
+                return Response({'error': 'Credit deduction failed'}, 
+                              status=status.HTTP_500_INTERNAL_SERVER_ERROR)
             
             return Response({
                 'success': True,
-                'count': len(matches),
-                'credits_used': 100 if use_proxy else 200,
+                'scans': scans,
+                'credits_used': cost,
                 'credits_remaining': request.user.credit_balance,
-                'matches': matches
+                'results': results
             })
             
         except Exception as e:
@@ -154,7 +469,7 @@ class MatchTipAPIView(APIView):
                 'success': False
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-class MatchTipViewSet(viewsets.ReadOnlyModelViewSet):
+class MatchTipViewSet(CachedResponseMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = MatchTipSerializer
     permission_classes = [IsAuthenticated]
     filter_backends = [DjangoFilterBackend]
@@ -191,7 +506,12 @@ class MatchTipViewSet(viewsets.ReadOnlyModelViewSet):
         
         return queryset
     
+    @versioned_cache()
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+    
     @action(detail=False, methods=['get'])
+    @versioned_cache(bucket='day')
     def today(self, request):
         today = timezone.now().date()
         tips = MatchTip.objects.filter(match_time__date=today)
@@ -199,12 +519,44 @@ class MatchTipViewSet(viewsets.ReadOnlyModelViewSet):
         return Response(serializer.data)
     
     @action(detail=False, methods=['get'])
+    @versioned_cache(bucket='minute')
     def upcoming(self, request):
         now = timezone.now()
         upcoming = MatchTip.objects.filter(match_time__gte=now).order_by('match_time')
         serializer = self.get_serializer(upcoming, many=True)
         return Response(serializer.data)
 
+class MatchTipExportView(APIView):
+    """Stream MatchTip history as CSV, NDJSON or an Arrow IPC stream"""
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        # `format` is taken by DRF's renderer override, hence `fmt`
+        fmt = request.query_params.get('fmt', 'csv')
+        if fmt not in FORMATS:
+            return Response({'error': f'fmt must be one of {", ".join(FORMATS)}'},
+                          status=status.HTTP_400_BAD_REQUEST)
+        try:
+            queryset = export_queryset(
+                date_from=request.query_params.get('from'),
+                date_to=request.query_params.get('to'),
+                tip_type=request.query_params.get('tip_type'),
+                league=request.query_params.get('league'),
+            )
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        try:
+            chunks = stream_export(fmt, queryset)
+        except ImportError:
+            return Response({'error': f'{fmt} export is not available on this server'},
+                          status=status.HTTP_501_NOT_IMPLEMENTED)
+        
+        content_type, extension = FORMATS[fmt]
+        response = StreamingHttpResponse(chunks, content_type=content_type)
+        response['Content-Disposition'] = f'attachment; filename="match_tips.{extension}"'
+        return response
+
 class APIRequestLogViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = APIRequestLogSerializer
     permission_classes = [IsAuthenticated]
@@ -219,6 +571,45 @@ class CreditTransactionViewSet(viewsets.ReadOnlyModelViewSet):
     def get_queryset(self):
         return CreditTransaction.objects.filter(user=self.request.user).order_by('-created_at')
 
+class TipSubscriptionViewSet(viewsets.ModelViewSet):
+    serializer_class = TipSubscriptionSerializer
+    permission_classes = [IsAuthenticated]
+    
+    def get_queryset(self):
+        return TipSubscription.objects.filter(user=self.request.user).order_by('-created_at')
+    
+    def perform_create(self, serializer):
+        if TipSubscription.objects.filter(user=self.request.user).count() >= MAX_TIP_SUBSCRIPTIONS:
+            raise serializers.ValidationError(
+                {'error': f'At most {MAX_TIP_SUBSCRIPTIONS} subscriptions per user'}
+            )
+        serializer.save(user=self.request.user)
+
+class TipStreamView(APIView):
+    """Server-sent events for the user's tip subscriptions"""
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request):
+        if notifier.broker is None:
+            return Response({'error': 'Streaming is not enabled on this server; use a webhook'},
+                          status=status.HTTP_501_NOT_IMPLEMENTED)
+        user_id = request.user.id
+        keepalive = getattr(settings, 'SSE_KEEPALIVE_SECONDS', 15)
+        
+        def events():
+            yield 'retry: 5000\n\n'
+            for message in notifier.broker.listen(user_id, keepalive):
+                if message is None:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ': keepalive\n\n'
+                else:
+                    yield f'event: tips\ndata: {message}\n\n'
+        
+        response = StreamingHttpResponse(events(), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
 class BuyCreditsView(APIView):
     permission_classes = [IsAuthenticated]
     
@@ -256,7 +647,8 @@ class HealthCheckView(APIView):
         return Response({
             'status': 'healthy',
             'timestamp': timezone.now().isoformat(),
-            'service': 'Tip API'
+            'service': 'Tip API',
+            'snapshot_store': snapshot_store.stats(),
         })
 
 @api_view(['GET'])
@@ -271,9 +663,16 @@ def api_documentation(request):
             },
             'matches': {
                 'live_query': 'GET /api/matches/',
+                'batch_query': 'POST /api/matches/batch/',
                 'list': 'GET /api/tips/',
                 'today': 'GET /api/tips/today/',
-                'upcoming': 'GET /api/tips/upcoming/'
+                'upcoming': 'GET /api/tips/upcoming/',
+                'export': 'GET /api/tips/export/?fmt=csv|ndjson|arrow (staff only)'
+            },
+            'notifications': {
+                'subscriptions': 'GET/POST /api/subscriptions/',
+                'subscription': 'GET/PATCH/DELETE /api/subscriptions/{id}/',
+                'stream': 'GET /api/subscriptions/stream/ (text/event-stream, when SSE is enabled)'
             },
             'user': {
                 'credits': 'GET /api/credits/',
@@ -290,7 +689,10 @@ def api_documentation(request):
                 'exclude_major': 'true/false',
                 'time_order': 'true/false',
                 'limit': 'number (1-100)',
-                'use_proxy': 'true/false (100 credits with proxy, 200 without)'
+                'use_proxy': 'true/false (100 credits with proxy, 200 without)',
+                'since': 'version (optional, returns only tips added/changed/removed since it)',
+                'from': 'YYYY-MM-DD (optional, start of date range)',
+                'to': 'YYYY-MM-DD (optional, end of date range, max 7 days)'
             }
         }
     })
\ No newline at end of file
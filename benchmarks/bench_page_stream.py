@@ -0,0 +1,87 @@
+"""Peak memory of decoding an upstream page: whole document vs PageStream.
+
+    python benchmarks/bench_page_stream.py [rows ...]
+
+Builds synthetic pages (default 5k, 20k and 80k rows, each with a long
+outcome list), then runs ``TipScanner.process_match`` over them once after
+``json.loads`` of the whole body and once over a ``PageStream`` fed 64 KiB
+chunks. Prints wall time, the tracemalloc peak and the decode overhead
+(peak minus what the processed records still hold). The body itself is
+allocated before tracing starts, as it would be on the wire.
+"""
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tip_api.settings')
+
+import django
+
+django.setup()
+
+from api.pagestream import PageStream
+from api.scanners import TipScanner
+from bench_process_match import make_rows
+
+CHUNK = 64 * 1024
+
+
+def make_page(n):
+    rows = make_rows(n)
+    for i, row in enumerate(rows):
+        # Correct-score style markets carry many outcomes per row
+        row['i'] += [[f'{g}-{i % 5}', 0, 0, 25.0] for g in range(12)]
+    return json.dumps({'data': rows, 'remaining': True}).encode()
+
+
+def chunks(body):
+    view = memoryview(body)
+    for start in range(0, len(body), CHUNK):
+        yield bytes(view[start:start + CHUNK])
+
+
+def measure(fn):
+    """(seconds, peak bytes, bytes still held by the result)"""
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    tracemalloc.start()
+    result = fn()
+    held, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, held, result
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [5_000, 20_000, 80_000]
+    scanner = TipScanner()
+
+    def whole(body):
+        page = json.loads(body)
+        out = []
+        scanner.process_match(page['data'], out, set())
+        return out, page.get('remaining')
+
+    def streamed(body):
+        page = PageStream(chunks(body))
+        out = []
+        scanner.process_match(page['data'], out, set())
+        return out, page.get('remaining')
+
+    print(f'{"rows":>8} {"body MB":>8} {"mode":>8} {"ms":>9} {"peak MB":>9} {"overhead MB":>12}')
+    for n in sizes:
+        body = make_page(n)
+        results = []
+        for name, fn in (('loads', whole), ('stream', streamed)):
+            elapsed, peak, held, result = measure(lambda: fn(body))
+            results.append(result)
+            print(f'{n:>8} {len(body) / 2**20:>8.1f} {name:>8} {elapsed * 1000:>9.1f} '
+                  f'{peak / 2**20:>9.1f} {(peak - held) / 2**20:>12.1f}')
+        assert results[0] == results[1], 'streamed page differs from json.loads'
+
+
+if __name__ == '__main__':
+    main()
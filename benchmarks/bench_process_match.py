@@ -0,0 +1,77 @@
+"""TipScanner.process_match throughput.
+
+    python benchmarks/bench_process_match.py [rows]
+
+Generates synthetic upstream rows (default 200k, a third of them repeat
+keys so dedup is exercised) and prints the best wall time of three runs.
+"""
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tip_api.settings')
+
+import django
+
+django.setup()
+
+from api.scanners import TipScanner
+
+
+def make_rows(n, seed=0):
+    rng = random.Random(seed)
+    start = datetime(2024, 1, 15, tzinfo=timezone.utc)
+    markets = ['1X2', 'Over_Under_2.5', 'Both teams to score']
+    rows = []
+    for i in range(n):
+        total = rng.randint(50, 50000)
+        a = rng.randint(0, total)
+        b = rng.randint(0, total - a)
+        key = i % (n * 2 // 3 or 1)
+        rows.append({
+            'htn': f'Home {key % 997}',
+            'atn': f'Away {key % 991}',
+            'ln': f'League {key % 120}',
+            'n': markets[key % len(markets)],
+            'ce': (start + timedelta(minutes=rng.randint(0, 2880))).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'v': total,
+            'i': [
+                ['1', a, 0, round(rng.uniform(1.05, 12), 2)],
+                ['X', b, 0, round(rng.uniform(1.05, 12), 2)],
+                ['2', total - a - b, 0, round(rng.uniform(1.05, 12), 2)],
+            ],
+        })
+    return rows
+
+
+def timed(fn, repeat=3):
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    rows = make_rows(n)
+    scanner = TipScanner()
+
+    def process():
+        out = []
+        scanner.process_match(rows, out, set())
+        return out
+
+    elapsed, expected = timed(process)
+
+    print(f'rows={n} unique={len(expected)}')
+    print(f'process_match  {elapsed * 1000:9.1f} ms  {n / elapsed:12,.0f} rows/s')
+
+
+if __name__ == '__main__':
+    main()
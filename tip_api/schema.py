@@ -0,0 +1,67 @@
+"""Swagger/ReDoc views, built on first request.
+
+drf_yasg and its schema generator are imported when the docs are first
+opened instead of with the URLconf. The schema is public and only changes
+with the code, so each process generates it once per format and serves
+that copy afterwards. Its host, scheme and base path come from
+``API_PUBLIC_URL`` when set; otherwise drf_yasg takes them from the
+request, so copies are also kept per scheme and host.
+"""
+from functools import lru_cache
+
+from django.conf import settings
+from rest_framework import permissions
+from rest_framework.response import Response
+
+# Per-host copies kept without API_PUBLIC_URL (ALLOWED_HOSTS may be '*')
+MAX_SCHEMAS = 16
+
+
+@lru_cache(maxsize=None)
+def schema_view_class():
+    from drf_yasg import openapi
+    from drf_yasg.views import get_schema_view
+
+    url = getattr(settings, 'API_PUBLIC_URL', None) or None
+    base = get_schema_view(
+        openapi.Info(
+            title="Tip API",
+            default_version='v1',
+            description="API for fetching match tips and predictions",
+            terms_of_service="https://yourdomain.com/terms/",
+            contact=openapi.Contact(email="support@yourdomain.com"),
+            license=openapi.License(name="BSD License"),
+        ),
+        url=url,
+        public=True,
+        permission_classes=(permissions.AllowAny,),
+    )
+
+    class CachedSchemaView(base):
+        schemas = {}
+
+        def get(self, request, version='', format=None):
+            key = (request.version or version or '', request.accepted_renderer.format)
+            if url is None:
+                key += (request.scheme, request.get_host())
+            schema = self.schemas.get(key)
+            if schema is None:
+                schema = super().get(request, version, format).data
+                if len(self.schemas) < MAX_SCHEMAS:
+                    self.schemas[key] = schema
+            return Response(schema)
+
+    return CachedSchemaView
+
+
+@lru_cache(maxsize=None)
+def ui_view(renderer):
+    return schema_view_class().with_ui(renderer)
+
+
+def schema_ui(renderer):
+    """URLconf entry for the 'swagger' or 'redoc' UI"""
+    def view(request, *args, **kwargs):
+        return ui_view(renderer)(request, *args, **kwargs)
+    view.csrf_exempt = True
+    return view
@@ -1,4 +1,5 @@
 import os
+import sys
 from pathlib import Path
 from datetime import timedelta
 from dotenv import load_dotenv
@@ -20,6 +21,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     
     # Third party
     'rest_framework',
@@ -34,6 +36,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'api.middleware.RequestIdMiddleware',
+    'api.middleware.QueryMetricsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -96,6 +100,23 @@ REST_FRAMEWORK = {
     'PAGE_SIZE': 20,
 }
 
+# Shared cache for scan snapshots and rate limits; falls back to per-process memory
+REDIS_URL = os.getenv('REDIS_URL')
+
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
 CORS_ALLOW_ALL_ORIGINS = True
 CORS_ALLOW_CREDENTIALS = True
 
@@ -109,7 +130,102 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Logging: JSON lines written to stdout by a background listener thread, so
+# request threads never block on the sink. Disabled levels cost one check.
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO')
+# `manage.py test` output is the test report only; tests that check log
+# lines capture them themselves
+TESTING = sys.argv[1:2] == ['test']
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'filters': {
+        'context': {'()': 'api.log.ContextFilter'},
+    },
+    'handlers': {
+        'queue': {'class': 'logging.NullHandler'} if TESTING else {
+            '()': 'api.log.QueueListenerHandler',
+            'filters': ['context'],
+        },
+    },
+    'root': {
+        'handlers': ['queue'],
+        'level': 'WARNING',
+    },
+    'loggers': {
+        'api': {'level': LOG_LEVEL},
+        'django.request': {'level': 'ERROR'},
+    },
+}
+
 # API Settings
 API_REQUEST_COST_WITH_PROXY = 100
 API_REQUEST_COST_WITHOUT_PROXY = 200
-DEFAULT_USER_CREDITS = 1000
\ No newline at end of file
+DEFAULT_USER_CREDITS = 1000
+
+# /metrics carries proxy labels and endpoint traffic: it is served only to
+# these addresses/CIDRs (the socket peer) or to "Authorization: Bearer <token>"
+METRICS_ALLOWED_IPS = os.getenv('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',')
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+# In-process snapshot store (api/snapshots.py), per worker
+SNAPSHOT_STORE_MAX_SNAPSHOTS = int(os.getenv('SNAPSHOT_STORE_MAX_SNAPSHOTS', 32))
+SNAPSHOT_STORE_MAX_BYTES = int(os.getenv('SNAPSHOT_STORE_MAX_BYTES', 64 * 1024 * 1024))
+# Days with more rows than this are never snapshotted, only scanned
+SNAPSHOT_STORE_MAX_ROWS = int(os.getenv('SNAPSHOT_STORE_MAX_ROWS', 50000))
+# Published snapshots are also written here so restarted workers start warm;
+# set to an empty value to keep them in memory only
+SNAPSHOT_DIR = os.getenv('SNAPSHOT_DIR', os.path.join(BASE_DIR, 'var', 'snapshots'))
+SNAPSHOT_STALE_SECONDS = int(os.getenv('SNAPSHOT_STALE_SECONDS', 600))
+
+# Upstream page bodies kept for conditional (ETag/Last-Modified) requests, per worker
+UPSTREAM_PAGE_CACHE_BYTES = int(os.getenv('UPSTREAM_PAGE_CACHE_BYTES', 32 * 1024 * 1024))
+
+# Decode upstream pages entry by entry as they download (False: json.loads the whole body)
+UPSTREAM_STREAM_PAGES = os.getenv('UPSTREAM_STREAM_PAGES', 'True') == 'True'
+
+# Delta feed (?since=) for /api/matches/
+FEED_RETAIN_VERSIONS = int(os.getenv('FEED_RETAIN_VERSIONS', 50))
+FEED_PERCENT_EPSILON = float(os.getenv('FEED_PERCENT_EPSILON', 0.5))
+FEED_MONEY_EPSILON = float(os.getenv('FEED_MONEY_EPSILON', 0.05))
+
+# X-DB-Queries response header (SQL count/time/N+1) from QueryMetricsMiddleware
+QUERY_DEBUG_HEADER = os.getenv('QUERY_DEBUG_HEADER', str(DEBUG)) == 'True'
+
+# Idempotency-Key replay window for charged endpoints, and how long a
+# duplicate waits for the in-flight original
+IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', 24 * 3600))
+IDEMPOTENCY_WAIT_SECONDS = int(os.getenv('IDEMPOTENCY_WAIT_SECONDS', 30))
+IDEMPOTENCY_LOCK_SECONDS = 300
+
+# Celery (tip ingestion, notification fan-out, webhook deliveries); without
+# Redis tasks would run inline, so notifications go to a background thread
+# in the web process instead
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', REDIS_URL or 'memory://localhost/')
+CELERY_TASK_ALWAYS_EAGER = not (REDIS_URL or os.getenv('CELERY_BROKER_URL'))
+CELERY_TASK_SERIALIZER = 'json'
+
+# celery-beat scans today's tips this often, so feeds and subscribers are
+# updated without anyone polling; the lowest percentage ingested
+INGEST_INTERVAL_SECONDS = int(os.getenv('INGEST_INTERVAL_SECONDS', 120))
+INGEST_MIN_PERCENT = int(os.getenv('INGEST_MIN_PERCENT', 69))
+CELERY_BEAT_SCHEDULE = {
+    'ingest-tips': {
+        'task': 'api.tasks.ingest_tips',
+        'schedule': INGEST_INTERVAL_SECONDS,
+        # A run still queued when the next one is due is stale
+        'options': {'expires': INGEST_INTERVAL_SECONDS},
+    },
+}
+
+# Public base URL written into the OpenAPI schema, e.g. https://api.example.com;
+# without it the schema takes host and scheme from each request
+API_PUBLIC_URL = os.getenv('API_PUBLIC_URL', '')
+
+# Tip notifications (api/notifications.py)
+NOTIFY_DEDUPE_SECONDS = int(os.getenv('NOTIFY_DEDUPE_SECONDS', 6 * 3600))
+# Every open stream holds a worker for as long as it is connected, so only
+# enable SSE where the stream is served by an async/gevent worker class
+SSE_ENABLED = os.getenv('SSE_ENABLED', 'False') == 'True'
+SSE_KEEPALIVE_SECONDS = int(os.getenv('SSE_KEEPALIVE_SECONDS', 15))
@@ -15,8 +15,22 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path
+from django.urls import path, include
+from django.conf import settings
+from django.conf.urls.static import static
+
+from api.metrics import metrics_view
+from .schema import schema_ui
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/', include('api.urls')),
+    path('metrics', metrics_view, name='metrics'),
+    
+    # API Documentation
+    path('swagger/', schema_ui('swagger'), name='schema-swagger-ui'),
+    path('redoc/', schema_ui('redoc'), name='schema-redoc'),
 ]
+
+if settings.DEBUG:
+    urlpatterns += static(settings.STATIC_URL, document_root=settings.STATIC_ROOT)
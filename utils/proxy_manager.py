@@ -9,15 +9,14 @@ class ProxyManager:
     
     def get_best_proxy(self):
         """Get the best available proxy based on success rate"""
-        active_proxies = self.Proxy.objects.filter(
+        proxy = self.Proxy.objects.filter(
             is_active=True,
             last_used__lte=timezone.now() - timedelta(minutes=1)
-        ).order_by('-success_rate')
+        ).order_by('-success_rate').first()
         
-        if active_proxies.exists():
-            proxy = active_proxies.first()
+        if proxy is not None:
             proxy.last_used = timezone.now()
-            proxy.save()
+            proxy.save(update_fields=['last_used'])
             
             if proxy.username and proxy.password:
                 return f"{proxy.protocol}://{proxy.username}:{proxy.password}@{proxy.host}:{proxy.port}"